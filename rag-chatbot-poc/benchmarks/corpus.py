@@ -0,0 +1,123 @@
+"""Génération de corpus synthétiques (PDF, DOCX, XLSX, PPTX, TXT) pour les benchmarks."""
+import random
+from pathlib import Path
+from typing import Dict, List
+
+import openpyxl
+from docx import Document as DocxDocument
+from pptx import Presentation
+
+VOCABULARY = (
+    "contrat client fournisseur facture livraison délai garantie produit référence article "
+    "commande paiement échéance pénalité résiliation assurance sinistre dossier procédure "
+    "conformité audit rapport annuel budget prévision trimestre vente marge coût stock "
+    "entrepôt transport réclamation service support maintenance installation formation "
+    "sécurité accès données confidentialité sauvegarde serveur réseau logiciel version"
+).split()
+
+FORMATS = ("pdf", "docx", "xlsx", "pptx", "txt")
+
+
+class TextGenerator:
+    """Phrases pseudo-aléatoires mais reproductibles, parsemées d'identifiants (REF-1234, L123-4)."""
+    def __init__(self, seed: int = 42):
+        self.random = random.Random(seed)
+
+    def sentence(self, words: int = 14) -> str:
+        tokens = self.random.choices(VOCABULARY, k=words)
+        if self.random.random() < 0.3:
+            tokens.insert(self.random.randrange(len(tokens)), f"REF-{self.random.randint(1000, 9999)}")
+        if self.random.random() < 0.2:
+            tokens.insert(self.random.randrange(len(tokens)), f"L{self.random.randint(100, 999)}-{self.random.randint(1, 9)}")
+        return " ".join(tokens).capitalize() + "."
+
+    def paragraph(self, sentences: int = 6) -> str:
+        return " ".join(self.sentence() for _ in range(sentences))
+
+    def query(self) -> str:
+        return " ".join(self.random.choices(VOCABULARY, k=self.random.randint(3, 8))) + " ?"
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, pages: List[List[str]]):
+    """Écrit un PDF minimal (police Helvetica, une ligne de texte par élément), sans dépendance."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    page_refs = []
+    for lines in pages:
+        stream = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        stream = stream.encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        page_refs.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % ref for ref in page_refs), len(page_refs))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    path.write_bytes(bytes(output))
+
+
+def _wrap(text: str, width: int = 100) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if len(current) + len(word) + 1 > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    if current:
+        lines.append(current)
+    return lines
+
+
+def generate_file(path: Path, file_format: str, size: int, generator: TextGenerator):
+    """Crée un fichier du format demandé ; `size` est un nombre de pages, lignes, diapositives ou paragraphes."""
+    if file_format == "pdf":
+        write_pdf(path, [_wrap(generator.paragraph(12)) for _ in range(size)])
+    elif file_format == "docx":
+        doc = DocxDocument()
+        for _ in range(size):
+            doc.add_paragraph(generator.paragraph())
+        doc.save(path)
+    elif file_format == "xlsx":
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Données")
+        sheet.append(["Référence", "Quantité", "Montant", "Description"])
+        for row in range(size * 20):
+            sheet.append([f"REF-{row}", generator.random.randint(1, 500), round(generator.random.uniform(10, 10000), 2), generator.sentence()])
+        workbook.save(path)
+    elif file_format == "pptx":
+        prs = Presentation()
+        for index in range(size):
+            slide = prs.slides.add_slide(prs.slide_layouts[1])
+            slide.shapes.title.text = f"Diapositive {index + 1} : {generator.sentence(5)}"
+            slide.placeholders[1].text = generator.paragraph(4)
+        prs.save(path)
+    elif file_format == "txt":
+        path.write_text("\n\n".join(generator.paragraph() for _ in range(size)), encoding="utf-8")
+    else:
+        raise ValueError(f"Format inconnu : {file_format}")
+
+
+def generate_corpus(directory: Path, files_per_format: int = 5, size: int = 20, formats=FORMATS, seed: int = 42) -> Dict[str, List[Path]]:
+    """Génère `files_per_format` fichiers par format dans `directory` et les renvoie par format."""
+    directory.mkdir(parents=True, exist_ok=True)
+    generator = TextGenerator(seed)
+    corpus = {}
+    for file_format in formats:
+        corpus[file_format] = []
+        for index in range(files_per_format):
+            path = directory / f"bench_{index:03d}.{file_format}"
+            generate_file(path, file_format, size, generator)
+            corpus[file_format].append(path)
+    return corpus
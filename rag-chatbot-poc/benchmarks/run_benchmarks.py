@@ -0,0 +1,404 @@
+"""Benchmarks de bout en bout : extraction, ingestion, recherche et latence de /api/chat.
+
+Tout s'exécute hors ligne dans un répertoire temporaire (base vectorielle, catalogue,
+documents) avec un serveur Ollama factice ; les données de l'application ne sont pas touchées.
+Le modèle d'embedding doit être présent dans le cache local de sentence-transformers.
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sections search --sizes 1000,10000,50000
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/reference.json
+
+Les résultats sont écrits en JSON (`benchmarks/results/` par défaut). Avec `--compare`,
+les métriques de débit (`*_per_s`) et de latence (`*_ms`) sont comparées à un run de
+référence et le script sort en erreur si l'une d'elles régresse au-delà de `--tolerance`.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import yaml
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import run  # noqa: E402
+from benchmarks.corpus import FORMATS, TextGenerator, generate_corpus  # noqa: E402
+from benchmarks.stub_ollama import start_stub_server  # noqa: E402
+
+logger = logging.getLogger("benchmarks")
+SECTIONS = ("extraction", "ingestion", "search", "chat")
+
+
+def latency_summary(samples: List[float]) -> Dict:
+    """Résumé d'une série de durées en secondes, exprimé en millisecondes."""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+def build_config(base_config: Dict, work_dir: Path, args) -> Dict:
+    """Configuration isolée : toutes les données dans `work_dir`, caches désactivés."""
+    config = copy.deepcopy(base_config)
+    config['app']['workers'] = 1
+    config['database']['path'] = str(work_dir / "chatbot.db")
+    config['database']['vector_db']['path'] = str(work_dir / "chroma_db")
+    config['storage']['documents_path'] = str(work_dir / "documents")
+    config['storage']['processed_path'] = str(work_dir / "processed")
+    # Les caches masqueraient le coût réel de l'embedding et de la génération
+    config['embedding'].setdefault('cache', {})['enabled'] = False
+    config.setdefault('answer_cache', {})['enabled'] = False
+    if args.retrieval_mode:
+        config.setdefault('retrieval', {})['mode'] = args.retrieval_mode
+    if args.embedding_backend:
+        config['embedding']['backend'] = args.embedding_backend
+    for directory in (config['storage']['documents_path'], config['storage']['processed_path']):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+    return config
+
+
+def bench_extraction(corpus: Dict[str, List[Path]]) -> Dict:
+    from src.document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    results = {}
+    for file_format, paths in corpus.items():
+        total_bytes = sum(path.stat().st_size for path in paths)
+        chars = 0
+        start = time.perf_counter()
+        for path in paths:
+            chars += sum(len(text) for _, text in processor.iter_segments(str(path)))
+        elapsed = time.perf_counter() - start
+        results[file_format] = {
+            "files": len(paths),
+            "bytes": total_bytes,
+            "chars": chars,
+            "seconds": round(elapsed, 4),
+            "files_per_s": round(len(paths) / elapsed, 2),
+            "mb_per_s": round(total_bytes / 1e6 / elapsed, 3),
+            "chars_per_s": round(chars / elapsed, 1),
+        }
+        logger.info(f"Extraction {file_format} : {results[file_format]['files_per_s']} fichiers/s")
+    return results
+
+
+def bench_ingestion(engine, corpus: Dict[str, List[Path]], max_chunks: int) -> Dict:
+    from src.document_processor import DocumentProcessor
+
+    processor = DocumentProcessor()
+    paths = [path for file_paths in corpus.values() for path in file_paths]
+    chunks = []
+    for path in paths:
+        for _, text in processor.iter_segments(str(path)):
+            chunks.extend(engine.text_splitter.split_text(text))
+    chunks = chunks[:max_chunks]
+
+    start = time.perf_counter()
+    embeddings = engine.embedding_model.encode(chunks, batch_size=engine.encode_batch_size, show_progress_bar=False)
+    embed_seconds = time.perf_counter() - start
+
+    scratch = engine.client.get_or_create_collection(name="benchmark_insert")
+    start = time.perf_counter()
+    for offset in range(0, len(chunks), engine.insert_batch_size):
+        end = offset + engine.insert_batch_size
+        scratch.add(
+            ids=[f"bench_{i}" for i in range(offset, min(end, len(chunks)))],
+            documents=chunks[offset:end],
+            embeddings=np.asarray(embeddings[offset:end]).tolist(),
+        )
+    insert_seconds = time.perf_counter() - start
+    engine.client.delete_collection(name="benchmark_insert")
+
+    documents = [(f"bench_{path.name}", processor.iter_segments(str(path)), {"doc_id": f"bench_{path.name}", "filename": path.name}) for path in paths]
+    start = time.perf_counter()
+    chunk_counts = engine.add_documents(documents)
+    pipeline_seconds = time.perf_counter() - start
+    total_chunks = sum(chunk_counts.values())
+
+    results = {
+        "chunks": len(chunks),
+        "embedding_chunks_per_s": round(len(chunks) / embed_seconds, 1),
+        "insert_chunks_per_s": round(len(chunks) / insert_seconds, 1),
+        "pipeline_files": len(paths),
+        "pipeline_chunks": total_chunks,
+        "pipeline_seconds": round(pipeline_seconds, 3),
+        "pipeline_chunks_per_s": round(total_chunks / pipeline_seconds, 1),
+    }
+    logger.info(f"Ingestion : {results['embedding_chunks_per_s']} chunks/s (embedding), {results['insert_chunks_per_s']} chunks/s (insertion)")
+    return results
+
+
+def populate(engine, target_chunks: int, generator: TextGenerator):
+    """Ajoute des documents synthétiques jusqu'à atteindre `target_chunks` chunks dans la collection."""
+    index = engine.collection.count()
+    while engine.collection.count() < target_chunks:
+        missing = target_chunks - engine.collection.count()
+        documents = []
+        for _ in range(max(1, min(50, missing // 40))):
+            doc_id = f"synthetic_{index}"
+            segments = [({"page": page}, generator.paragraph(8)) for page in range(1, 41)]
+            documents.append((doc_id, segments, {"doc_id": doc_id, "filename": f"{doc_id}.txt"}))
+            index += 1
+        engine.add_documents(documents)
+
+
+def bench_search(engine, sizes: List[int], num_queries: int, n_results: int, generator: TextGenerator) -> Dict:
+    results = {}
+    queries = [generator.query() for _ in range(num_queries)]
+    for size in sizes:
+        start = time.perf_counter()
+        populate(engine, size, generator)
+        logger.info(f"Collection portée à {engine.collection.count()} chunks en {time.perf_counter() - start:.1f}s")
+        engine.search(queries[0], n_results=n_results)  # échauffement
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            engine.search(query, n_results=n_results)
+            samples.append(time.perf_counter() - start)
+        results[str(size)] = {"collection_chunks": engine.collection.count(), **latency_summary(samples)}
+        logger.info(f"Recherche sur {size} chunks : p50 {results[str(size)]['p50_ms']} ms, p99 {results[str(size)]['p99_ms']} ms")
+    return results
+
+
+def start_app_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def wait_until_ready(base_url: str, timeout: float = 600):
+    """Attend la fin du warm-up de l'application (modèles et bases chargés)."""
+    import httpx
+
+    start = time.perf_counter()
+    while httpx.get(f"{base_url}/readyz").status_code != 200:
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError("L'application n'est pas prête.")
+        time.sleep(0.1)
+    logger.info(f"Application prête {time.perf_counter() - start:.1f}s après l'ouverture du port")
+
+
+async def _run_chat_load(base_url: str, endpoint: str, queries: List[str], concurrency: int) -> Dict:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, first_tokens, statuses = [], [], {}
+
+    async def one_request(client, query):
+        async with semaphore:
+            start = time.perf_counter()
+            if endpoint == "/api/chat/stream":
+                async with client.stream("POST", endpoint, json={"message": query}) as response:
+                    first_token = None
+                    async for line in response.aiter_lines():
+                        if first_token is None and line.startswith("event: token"):
+                            first_token = time.perf_counter() - start
+                    if first_token is not None:
+                        first_tokens.append(first_token)
+            else:
+                response = await client.post(endpoint, json={"message": query})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request(client, query) for query in queries))
+        elapsed = time.perf_counter() - start
+
+    result = {
+        "requests": len(queries),
+        "concurrency": concurrency,
+        "status_codes": {str(code): count for code, count in statuses.items()},
+        "requests_per_s": round(len(queries) / elapsed, 2),
+        **latency_summary(latencies),
+    }
+    if first_tokens:
+        result["first_token"] = latency_summary(first_tokens)
+    return result
+
+
+def bench_chat(config: Dict, work_dir: Path, args, generator: TextGenerator) -> Dict:
+    stub, stub_url = start_stub_server(first_token_delay=args.stub_first_token_delay, token_delay=args.stub_token_delay, num_tokens=args.stub_tokens)
+    config['llm']['provider'] = 'ollama'
+    config['llm']['ollama']['url'] = stub_url
+    config_path = work_dir / "config.yaml"
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    # web_app lit sa configuration à l'import : on le fait pointer vers la configuration isolée
+    run.CONFIG_PATH = str(config_path)
+    from src import web_app
+
+    server, thread = start_app_server(web_app.app, args.app_port)
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    wait_until_ready(base_url)
+    if web_app.rag_engine.collection.count() == 0:
+        populate(web_app.rag_engine, args.chat_collection_size, generator)
+    queries = [generator.query() for _ in range(args.chat_requests)]
+    try:
+        results = {
+            "stub": {"first_token_delay_s": args.stub_first_token_delay, "token_delay_s": args.stub_token_delay, "tokens": args.stub_tokens},
+            "chat": asyncio.run(_run_chat_load(base_url, "/api/chat", queries, args.concurrency)),
+            "chat_stream": asyncio.run(_run_chat_load(base_url, "/api/chat/stream", queries, args.concurrency)),
+        }
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        stub.shutdown()
+    logger.info(f"/api/chat : p50 {results['chat'].get('p50_ms')} ms, {results['chat']['requests_per_s']} req/s")
+    return results
+
+
+def collect_metadata(config: Dict, args) -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "embedding_model": config['embedding']['model_name'],
+        "chunk_size": config['embedding']['chunk_size'],
+        "retrieval_mode": config.get('retrieval', {}).get('mode', 'vector'),
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+    }
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Liste les métriques qui se dégradent de plus de `tolerance` (proportion) par rapport à la référence."""
+    current_flat = flatten({k: v for k, v in current.items() if k != "meta"})
+    baseline_flat = flatten({k: v for k, v in baseline.items() if k != "meta"})
+    regressions = []
+    for name, value in sorted(current_flat.items()):
+        reference = baseline_flat.get(name)
+        if not reference:
+            continue
+        change = (value - reference) / reference
+        if name.endswith("_per_s") and change < -tolerance:
+            regressions.append(f"{name} : {reference} -> {value} ({change:+.1%})")
+        elif name.endswith("_ms") and change > tolerance:
+            regressions.append(f"{name} : {reference} -> {value} ({change:+.1%})")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks du RAG Document Chatbot")
+    parser.add_argument("--sections", default=",".join(SECTIONS), help="Sections à exécuter, séparées par des virgules")
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--files-per-format", type=int, default=5)
+    parser.add_argument("--file-size", type=int, default=20, help="Pages, diapositives ou paragraphes par fichier")
+    parser.add_argument("--max-chunks", type=int, default=2000, help="Chunks utilisés pour mesurer l'embedding et l'insertion")
+    parser.add_argument("--sizes", default="1000,5000,20000", help="Tailles de collection pour la recherche")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--retrieval-mode", choices=("vector", "hybrid"), default=None)
+    parser.add_argument("--embedding-backend", choices=("torch", "onnx", "onnx-int8"), default=None)
+    parser.add_argument("--chat-requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--chat-collection-size", type=int, default=1000)
+    parser.add_argument("--app-port", type=int, default=8899, help="Port local du serveur lancé pour la section chat")
+    parser.add_argument("--stub-first-token-delay", type=float, default=0.1)
+    parser.add_argument("--stub-token-delay", type=float, default=0.01)
+    parser.add_argument("--stub-tokens", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--work-dir", default=None, help="Répertoire de travail (temporaire par défaut)")
+    parser.add_argument("--output", default=None, help="Fichier JSON de résultats")
+    parser.add_argument("--compare", default=None, help="Résultats de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Dégradation tolérée avant de signaler une régression")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for noisy in ('chromadb', 'sentence_transformers', 'transformers', 'httpx', 'src'):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+    os.chdir(PROJECT_ROOT)
+    sections = [section for section in args.sections.split(",") if section]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        raise SystemExit(f"Sections inconnues : {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as tmp:
+        work_dir = Path(args.work_dir or tmp)
+        config = build_config(run.load_config(), work_dir, args)
+        generator = TextGenerator(args.seed)
+        results = {"meta": collect_metadata(config, args)}
+
+        corpus = None
+        if "extraction" in sections or "ingestion" in sections:
+            corpus = generate_corpus(work_dir / "corpus", args.files_per_format, args.file_size, args.formats.split(","), args.seed)
+        if "extraction" in sections:
+            results["extraction"] = bench_extraction(corpus)
+
+        engine = None
+        if "ingestion" in sections or "search" in sections:
+            from src.rag_engine import RAGEngine
+            engine = RAGEngine(config)
+        if "ingestion" in sections:
+            results["ingestion"] = bench_ingestion(engine, corpus, args.max_chunks)
+        if "search" in sections:
+            sizes = sorted(int(size) for size in args.sizes.split(","))
+            results["search"] = bench_search(engine, sizes, args.queries, args.n_results, generator)
+        if "chat" in sections:
+            results["chat"] = bench_chat(config, work_dir, args, generator)
+
+    output = Path(args.output) if args.output else PROJECT_ROOT / "benchmarks" / "results" / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"📊 Résultats écrits dans {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if baseline.get("meta", {}).get("args") != results["meta"]["args"]:
+            print("⚠️  Paramètres différents de ceux de la référence : la comparaison peut être trompeuse.")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} régression(s) par rapport à {args.compare} :")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"✅ Aucune régression au-delà de {args.tolerance:.0%} par rapport à {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
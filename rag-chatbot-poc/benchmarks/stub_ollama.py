@@ -0,0 +1,136 @@
+"""Serveur Ollama factice pour mesurer la latence de l'application sans modèle réel.
+
+Répond à /api/tags, /api/generate et /api/chat (en mode stream ou non) avec un délai
+avant le premier token puis un délai fixe entre chaque token. Avec `--load-delay`, le
+modèle simule son chargement à la première requête puis reste en mémoire pendant son
+`keep_alive`, comme Ollama.
+
+    python -m benchmarks.stub_ollama --port 11435 --first-token-delay 0.2 --load-delay 3
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Valeurs remplacées par start_stub_server
+    first_token_delay = 0.1
+    token_delay = 0.01
+    num_tokens = 50
+    model = "stub"
+    load_delay = 0.0
+    # Instant (time.monotonic) jusqu'auquel le modèle reste chargé, partagé par toutes les requêtes
+    loaded_until = [0.0]
+
+    @staticmethod
+    def _keep_alive_seconds(value) -> float:
+        if value is None:
+            return 300.0
+        if isinstance(value, (int, float)):
+            return float("inf") if value < 0 else float(value)
+        units = {"s": 1, "m": 60, "h": 3600}
+        return float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+
+    def _load_model(self, keep_alive) -> float:
+        """Simule le chargement du modèle s'il n'est plus en mémoire ; renvoie sa durée."""
+        load_seconds = 0.0
+        if time.monotonic() >= self.loaded_until[0]:
+            time.sleep(self.load_delay)
+            load_seconds = self.load_delay
+        self.loaded_until[0] = time.monotonic() + self._keep_alive_seconds(keep_alive)
+        return load_seconds
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": f"{self.model}:latest", "size": 0}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/api/chat"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        tokens = [f"mot{i} " for i in range(self.num_tokens)]
+        is_chat = self.path == "/api/chat"
+        load_seconds = self._load_model(payload.get("keep_alive"))
+        # Durées rapportées en nanosecondes dans le message final, comme Ollama
+        durations = {"load_duration": int(load_seconds * 1e9), "prompt_eval_duration": int(self.first_token_delay * 1e9)}
+
+        def chunk(token: str, done: bool) -> dict:
+            extra = durations if done else {}
+            if is_chat:
+                return {"model": self.model, "message": {"role": "assistant", "content": token}, "done": done, **extra}
+            return {"model": self.model, "response": token, "done": done, **extra}
+
+        if is_chat and not payload.get("messages"):
+            # Requête de préchargement : le modèle est chargé, rien n'est généré
+            self._send_json({**chunk("", True), "done_reason": "load"})
+            return
+        time.sleep(self.first_token_delay)
+        if not payload.get("stream", True):
+            time.sleep(self.token_delay * (len(tokens) - 1))
+            self._send_json(chunk("".join(tokens), True))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, token in enumerate(tokens):
+            if index:
+                time.sleep(self.token_delay)
+            line = (json.dumps(chunk(token, False)) + "\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+        line = (json.dumps(chunk("", True)) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(line), line))
+
+
+def start_stub_server(port: int = 0, first_token_delay: float = 0.1, token_delay: float = 0.01,
+                      num_tokens: int = 50, model: str = "stub", load_delay: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """Démarre le serveur dans un thread et renvoie (serveur, url)."""
+    handler = type("ConfiguredStubHandler", (StubOllamaHandler,), {
+        "first_token_delay": first_token_delay, "token_delay": token_delay,
+        "num_tokens": num_tokens, "model": model, "load_delay": load_delay, "loaded_until": [0.0],
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur Ollama factice")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--first-token-delay", type=float, default=0.1)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--num-tokens", type=int, default=50)
+    parser.add_argument("--load-delay", type=float, default=0.0, help="Durée simulée du chargement du modèle (secondes)")
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, args.first_token_delay, args.token_delay, args.num_tokens, load_delay=args.load_delay)
+    print(f"Ollama factice à l'écoute sur {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
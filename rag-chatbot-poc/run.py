@@ -4,6 +4,7 @@ RAG Document Chatbot POC - Point d'entrée principal
 """
 import os
 import sys
+import argparse
 import logging
 import yaml
 from pathlib import Path
@@ -28,13 +29,14 @@ def setup_logging():
     logging.getLogger('sentence_transformers').setLevel(logging.WARNING)
     logging.getLogger('transformers').setLevel(logging.WARNING)
 
+CONFIG_PATH = 'config/config.yaml'
+
 def load_config():
     """Chargement de la configuration"""
-    config_path = 'config/config.yaml'
-    if Path(config_path).exists():
-        with open(config_path, 'r', encoding='utf-8') as f:
+    if Path(CONFIG_PATH).exists():
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
             return yaml.safe_load(f)
-    raise FileNotFoundError(f"Le fichier de configuration '{config_path}' est introuvable.")
+    raise FileNotFoundError(f"Le fichier de configuration '{CONFIG_PATH}' est introuvable.")
 
 def create_directories(config: dict):
     """Création des répertoires nécessaires à partir de la config"""
@@ -48,35 +50,190 @@ def create_directories(config: dict):
     for directory in directories:
         Path(directory).mkdir(parents=True, exist_ok=True)
 
-def check_ollama_status(config: dict):
-    """Vérification du statut d'Ollama (uniquement si le provider est ollama)"""
+def ingest_directory(config: dict, directory: str, workspace: str):
+    """Ingestion en masse d'un répertoire, sans démarrer le serveur web"""
     logger = logging.getLogger(__name__)
-    if config.get('llm', {}).get('provider') != 'ollama':
-        logger.info("Fournisseur LLM n'est pas Ollama, la vérification du statut est ignorée.")
-        return
+    from src.rag_engine import RAGEngine
+    from src.database import DocumentRegistry
+    from src.ingestion import BulkIngestionManager
+    from src.workspaces import validate_workspace
 
-    logger.info("Vérification du statut d'Ollama...")
-    try:
-        import requests
-        ollama_config = config['llm']['ollama']
-        ollama_url = ollama_config['url']
-        response = requests.get(f"{ollama_url}/api/tags", timeout=3)
-        if response.status_code == 200:
-            logger.info("(OK) Ollama détecté et opérationnel")
-            models = response.json().get('models', [])
-            if models:
-                logger.info(f" -> {len(models)} modèle(s) installé(s).")
-            else:
-                logger.warning("(!) Aucun modèle installé dans Ollama.")
-        else:
-            logger.warning("(!) Ollama répond mais avec un statut inattendu.")
-    except requests.exceptions.RequestException:
-        logger.warning("(!) Ollama non disponible.")
-    except Exception as e:
-        logger.error(f"(X) Erreur lors de la vérification d'Ollama: {e}")
+    workspace = validate_workspace(workspace, config)
+
+    rag_engine = RAGEngine(config)
+    registry = DocumentRegistry(config)
+    manager = BulkIngestionManager(config, rag_engine, registry)
+    file_paths = manager.list_files(directory)
+    logger.info(f"{len(file_paths)} fichier(s) à ingérer depuis {directory} (espace de travail {workspace})")
+    job = manager.ingest(file_paths, workspace)
+    duration = job['finished_at'] - job['started_at']
+    print(f"✅ {job['indexed_files']}/{job['total_files']} fichier(s) indexé(s), {job['skipped_files']} inchangé(s), {job['total_chunks']} chunks en {duration:.1f}s")
+    for error in job['errors']:
+        print(f"❌ {error['file']}: {error['error']}")
+    manager.shutdown()
+
+def reindex(config: dict, workspace: str):
+    """Reconstruit la base vectorielle depuis le texte extrait conservé (après un changement de découpage ou de modèle)"""
+    from src.rag_engine import RAGEngine
+    from src.database import DocumentRegistry
+    from src.ingestion import BulkIngestionManager
+    from src.workspaces import validate_workspace
+
+    if workspace:
+        workspace = validate_workspace(workspace, config)
+    manager = BulkIngestionManager(config, RAGEngine(config), DocumentRegistry(config))
+    summary = manager.reindex(workspace)
+    duration = summary['finished_at'] - summary['started_at']
+    print(f"✅ {summary['indexed_files']}/{summary['total_files']} document(s) réindexé(s) ({summary['reextracted_files']} réextrait(s)), {summary['total_chunks']} chunks en {duration:.1f}s")
+    for error in summary['errors']:
+        print(f"❌ {error['file']}: {error['error']}")
+    manager.shutdown()
+
+def compact(config: dict, workspace: str, force: bool):
+    """Compacte la base vectorielle et nettoie le catalogue (serveur arrêté en mode multi-workers)"""
+    from src.rag_engine import RAGEngine
+    from src.database import DocumentRegistry
+    from src.index_maintenance import IndexMaintenance
+    from src.workspaces import validate_workspace
+
+    if workspace:
+        workspace = validate_workspace(workspace, config)
+    maintenance = IndexMaintenance(config, RAGEngine(config), DocumentRegistry(config))
+    report = maintenance.run(workspace, force, allow_shared=True)
+    for item in report['workspaces']:
+        if 'error' in item:
+            print(f"❌ {item['workspace']}: {item['error']}")
+            continue
+        before, after = item['before'], item['after']
+        print(f"✅ {item['workspace']} : {item['deleted_chunks']} chunks supprimés retirés en {item['seconds']:.1f}s, "
+              f"index {before['index_bytes'] / 1e6:.1f} Mo -> {after['index_bytes'] / 1e6:.1f} Mo, "
+              f"recherche p95 {before['search_p95_ms']} ms -> {after['search_p95_ms']} ms")
+    if not report['workspaces']:
+        print(f"Aucun espace de travail au-delà du seuil de {maintenance.tombstone_ratio:.0%} de chunks supprimés (--force pour compacter quand même).")
+    metadata = report['metadata']
+    print(f"Catalogue : {metadata['pruned_jobs']} job(s) purgé(s), {metadata['size_before'] / 1e6:.1f} Mo -> {metadata['size_after'] / 1e6:.1f} Mo")
+    maintenance.shutdown()
+
+def migrate_vectors(config: dict):
+    """Copie la base ChromaDB dans le stockage NumPy (database.vector_db.numpy), sans réencoder"""
+    from src.vector_store import migrate_chroma_to_numpy
+    copied = migrate_chroma_to_numpy(config, config['database']['vector_db'].get('insert_batch_size', 1000))
+    for name, count in copied.items():
+        print(f"✅ {name} : {count} chunks copiés")
+    print("Passez database.vector_db.type à \"numpy\" dans config/config.yaml pour utiliser la copie.")
+
+def ask(config: dict, questions_file: str, output: str, workspace: str, concurrency: int):
+    """Répond aux questions d'un fichier JSON Lines sans démarrer le serveur web (évaluation, génération de FAQ)"""
+    import asyncio
+    import json
+    from src.rag_engine import RAGEngine
+    from src.llm_handler import get_llm_handler
+    from src.answer_cache import AnswerCache
+    from src.context_builder import ContextBuilder
+    from src.batch_qa import BatchAnswerer, parse_questions
+    from src.concurrency import create_embedding_executor
+    from src.ollama_client import close_ollama_clients
+    from src.workspaces import validate_workspace
+
+    workspace = validate_workspace(workspace, config)
+    with open(questions_file, 'r', encoding='utf-8') as f:
+        # Une question par ligne : chaîne JSON ou objet {"id": ..., "question": ...}
+        questions = parse_questions([json.loads(line) for line in f if line.strip()])
+    output = output or str(Path(questions_file).with_suffix('.answers.jsonl'))
+    executor = create_embedding_executor(config)
+    answerer = BatchAnswerer(config, RAGEngine(config), ContextBuilder(config), AnswerCache(config), executor)
+    handler = get_llm_handler(config)
+
+    async def run_batch():
+        summary = None
+        try:
+            with open(output, 'w', encoding='utf-8') as out:
+                async for result in answerer.answer(questions, handler, workspace, concurrency=concurrency):
+                    if 'summary' in result:
+                        summary = result['summary']
+                    else:
+                        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                        out.flush()
+        finally:
+            await handler.aclose()
+            await close_ollama_clients()
+        return summary
+
+    summary = asyncio.run(run_batch())
+    executor.shutdown()
+    print(f"✅ {summary['answered']}/{summary['questions']} réponse(s) ({summary['cached']} depuis le cache, {summary['errors']} erreur(s)) en {summary['elapsed_seconds']:.1f}s → {output}")
+    print(f"   Recherche : {summary['retrieve_seconds']:.1f}s ({summary['retrieve_questions_per_second']} questions/s)")
+    if summary['generate_seconds_per_answer'] is not None:
+        print(f"   Génération : {summary['generate_seconds_per_answer']:.2f}s par réponse, {summary['concurrency']} en parallèle")
+    print(f"   Débit global : {summary['questions_per_second']} questions/s")
+
+def export_embeddings(config: dict):
+    """Exporte le modèle d'embedding en ONNX (et int8) sans attendre le premier démarrage"""
+    from src.embedding_backends import export_onnx_model
+    embedding_config = config['embedding']
+    cache_dir = embedding_config.get('onnx', {}).get('cache_dir', 'data/models')
+    model_dir = export_onnx_model(embedding_config['model_name'], cache_dir, quantized=True)
+    print(f"✅ Modèle {embedding_config['model_name']} exporté dans {model_dir}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="RAG Document Chatbot POC")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("serve", help="Démarre le serveur web (par défaut)")
+    ingest_parser = subparsers.add_parser("ingest", help="Ingère tous les documents d'un répertoire")
+    ingest_parser.add_argument("directory", help="Répertoire contenant les documents")
+    ingest_parser.add_argument("--workspace", default="default", help="Espace de travail dans lequel indexer les documents")
+    reindex_parser = subparsers.add_parser("reindex", help="Reconstruit la base vectorielle depuis le texte extrait (serveur arrêté)")
+    reindex_parser.add_argument("--workspace", help="Limite la réindexation à un espace de travail")
+    ask_parser = subparsers.add_parser("ask", help="Répond aux questions d'un fichier JSON Lines (serveur non requis)")
+    ask_parser.add_argument("--file", required=True, help="Fichier de questions, une par ligne (chaîne JSON ou objet avec 'question' et 'id')")
+    ask_parser.add_argument("--output", help="Fichier de réponses JSON Lines (par défaut : <file>.answers.jsonl)")
+    ask_parser.add_argument("--workspace", default="default", help="Espace de travail interrogé")
+    ask_parser.add_argument("--concurrency", type=int, help="Générations simultanées (par défaut : batch.concurrency)")
+    compact_parser = subparsers.add_parser("compact", help="Retire les chunks supprimés de la base vectorielle et nettoie le catalogue")
+    compact_parser.add_argument("--workspace", help="Limite la compaction à un espace de travail")
+    compact_parser.add_argument("--force", action="store_true", help="Compacte même en dessous de maintenance.tombstone_ratio")
+    subparsers.add_parser("migrate-vectors", help="Copie la base ChromaDB vers le stockage vectoriel NumPy")
+    subparsers.add_parser("export-embeddings", help="Exporte le modèle d'embedding en ONNX (float32 et int8)")
+    return parser.parse_args()
 
 def main():
     """Fonction principale"""
+    args = parse_args()
+    if args.command == "ingest":
+        setup_logging()
+        config = load_config()
+        create_directories(config)
+        ingest_directory(config, args.directory, args.workspace)
+        return
+    if args.command == "reindex":
+        setup_logging()
+        config = load_config()
+        create_directories(config)
+        reindex(config, args.workspace)
+        return
+    if args.command == "ask":
+        setup_logging()
+        config = load_config()
+        create_directories(config)
+        ask(config, args.file, args.output, args.workspace, args.concurrency)
+        return
+    if args.command == "compact":
+        setup_logging()
+        config = load_config()
+        create_directories(config)
+        compact(config, args.workspace, args.force)
+        return
+    if args.command == "migrate-vectors":
+        setup_logging()
+        config = load_config()
+        create_directories(config)
+        migrate_vectors(config)
+        return
+    if args.command == "export-embeddings":
+        setup_logging()
+        export_embeddings(load_config())
+        return
+
     print("🚀 RAG Document Chatbot POC - Démarrage")
     print("=" * 50)
     
@@ -89,13 +246,17 @@ def main():
 
         create_directories(config)
 
-        check_ollama_status(config)
-        
-        from src.web_app import app, run_app
+        # Ollama est sondé une seule fois, par le gestionnaire LLM pendant le warm-up
         logger.info(f"Démarrage du serveur sur {config['app']['host']}:{config['app']['port']}")
         print(f"🌐 Serveur démarré: http://{config['app']['host']}:{config['app']['port']}")
-        
-        run_app()
+
+        if config['app'].get('workers', 1) > 1:
+            # Le processus principal ne charge ni modèle ni base : il lance les services partagés et les workers
+            from src.multiworker import run_multi_worker
+            run_multi_worker(config)
+        else:
+            from src.web_app import app, run_app
+            run_app()
 
     except KeyboardInterrupt:
         logger.info("Arrêt demandé par l'utilisateur")
@@ -0,0 +1,132 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class AnswerCache:
+    """Cache des réponses du LLM, placé devant l'étape de génération de /api/chat.
+
+    Une entrée est réutilisée si la question normalisée, le modèle et les chunks récupérés
+    sont identiques. En mode sémantique, une question proche (distance cosinus inférieure à
+    `max_distance`) avec exactement le même contexte réutilise aussi la réponse.
+    """
+    def __init__(self, config: Dict):
+        self.logger = logging.getLogger(__name__)
+        cache_config = config.get('answer_cache', {})
+        self.enabled = cache_config.get('enabled', False)
+        self.max_entries = cache_config.get('max_entries', 1000)
+        self.ttl_seconds = cache_config.get('ttl_seconds', 3600)
+        self.semantic = cache_config.get('semantic', False)
+        self.max_distance = cache_config.get('max_distance', 0.05)
+        self._entries: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._keys_by_doc: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return re.sub(r"\s+", " ", query.strip().lower()).rstrip(" ?!.")
+
+    def _key(self, query: str, chunk_ids: List[str], model: str) -> tuple:
+        return (self.normalize_query(query), tuple(chunk_ids), model)
+
+    def get(self, query: str, chunk_ids: List[str], model: str, query_embedding: Optional[np.ndarray] = None) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = self._key(query, chunk_ids, model)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['created_at'] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry['answer']
+
+            if self.semantic and query_embedding is not None:
+                match = self._find_similar(key, query_embedding, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.stats["semantic_hits"] += 1
+                    return self._entries[match]['answer']
+
+            self.stats["misses"] += 1
+            return None
+
+    def _find_similar(self, key: tuple, query_embedding: np.ndarray, now: float) -> Optional[tuple]:
+        # Seules les entrées avec le même contexte et le même modèle sont candidates
+        query_vector = query_embedding / (np.linalg.norm(query_embedding) or 1.0)
+        best_key, best_distance = None, self.max_distance
+        for candidate_key, entry in self._entries.items():
+            if candidate_key[1:] != key[1:] or entry['embedding'] is None:
+                continue
+            if now - entry['created_at'] > self.ttl_seconds:
+                continue
+            distance = 1.0 - float(np.dot(query_vector, entry['embedding']))
+            if distance <= best_distance:
+                best_key, best_distance = candidate_key, distance
+        return best_key
+
+    def put(self, query: str, chunk_ids: List[str], model: str, answer: str, doc_ids: Iterable[str], query_embedding: Optional[np.ndarray] = None):
+        if not self.enabled:
+            return
+        key = self._key(query, chunk_ids, model)
+        embedding = None
+        if query_embedding is not None:
+            embedding = query_embedding / (np.linalg.norm(query_embedding) or 1.0)
+        doc_ids = set(doc_ids)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = {"answer": answer, "doc_ids": doc_ids, "embedding": embedding, "created_at": time.time()}
+            for doc_id in doc_ids:
+                self._keys_by_doc.setdefault(doc_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_documents(self, doc_ids: Iterable[str]):
+        """Supprime les réponses construites à partir des documents ajoutés, modifiés ou supprimés."""
+        with self._lock:
+            removed = 0
+            for doc_id in doc_ids:
+                for key in list(self._keys_by_doc.get(doc_id, ())):
+                    removed += self._remove(key)
+            if removed:
+                self.stats["invalidations"] += removed
+                self.logger.info(f"Cache de réponses : {removed} entrée(s) invalidée(s).")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_doc.clear()
+
+    def _remove(self, key: tuple) -> int:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return 0
+        for doc_id in entry['doc_ids']:
+            keys = self._keys_by_doc.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_doc[doc_id]
+        return 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            hits = self.stats["hits"] + self.stats["semantic_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                "answer_cache_entries": len(self._entries),
+                "answer_cache_hits": self.stats["hits"],
+                "answer_cache_semantic_hits": self.stats["semantic_hits"],
+                "answer_cache_misses": self.stats["misses"],
+                "answer_cache_hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "answer_cache_invalidations": self.stats["invalidations"],
+            }
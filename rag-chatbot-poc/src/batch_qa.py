@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import AsyncIterator, Dict, List, Optional
+
+from .answer_cache import AnswerCache
+from .concurrency import GenerationLimiter, run_blocking
+from .context_builder import ContextBuilder
+from .llm_handler import is_error_response
+from .llm_router import answering_model
+from .metrics import metrics
+from .workspaces import DEFAULT_WORKSPACE
+
+
+def parse_questions(items: List) -> List[Dict]:
+    """Questions d'un lot : chaînes, ou objets avec `question` (ou `message`) et un `id` facultatif."""
+    if not isinstance(items, list) or not items:
+        raise ValueError("Le lot doit contenir une liste non vide de questions.")
+    questions = []
+    for index, item in enumerate(items):
+        if isinstance(item, dict):
+            text = item.get("question") or item.get("message")
+            question_id = item.get("id", index)
+        else:
+            text, question_id = item, index
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError(f"Question {index} vide ou invalide.")
+        questions.append({"index": index, "id": question_id, "question": text})
+    return questions
+
+
+class BatchAnswerer:
+    """Répond à une série de questions (évaluation hors ligne, génération de FAQ).
+
+    Les questions sont recherchées par lots de `retrieval_batch_size` : un seul encodage et
+    une seule requête vectorielle par lot. Les générations sont lancées au fil de l'eau avec
+    au plus `concurrency` appels au LLM simultanés, et les réponses sont produites dans
+    l'ordre où elles se terminent. Le dernier élément produit est le bilan du lot, avec le
+    débit de chaque étape.
+    """
+    def __init__(self, config: Dict, rag_engine, context_builder: ContextBuilder,
+                 answer_cache: AnswerCache, executor: ThreadPoolExecutor):
+        self.logger = logging.getLogger(__name__)
+        batch_config = config.get('batch', {})
+        self.retrieval_batch_size = batch_config.get('retrieval_batch_size', 32)
+        self.concurrency = batch_config.get('concurrency', 4)
+        self.max_questions = batch_config.get('max_questions', 1000)
+        self.rag_engine = rag_engine
+        self.context_builder = context_builder
+        self.answer_cache = answer_cache
+        self.executor = executor
+
+    async def retrieve(self, queries: List[str], model: str, workspace: str = DEFAULT_WORKSPACE, where: Optional[Dict] = None) -> List[Dict]:
+        """Recherche les chunks pertinents et prépare le contexte de chaque requête, hors de la boucle asyncio."""
+        with metrics.stage("retrieve"):
+            # Encodage à part : avec le micro-batching, il attend son lot sans occuper un thread de `executor`
+            embeddings = await run_blocking(self.rag_engine.query_encoder or self.executor, self.rag_engine.encode, queries)
+            search_results = await run_blocking(
+                self.executor, self.rag_engine.search_batch, queries,
+                n_results=self.context_builder.candidates, workspace=workspace, where=where, query_embeddings=embeddings
+            )
+        query_embeddings = [None] * len(queries)
+        if (self.answer_cache.enabled and self.answer_cache.semantic) or self.context_builder.mmr:
+            query_embeddings = list(embeddings)
+        with metrics.stage("context"):
+            built = await run_blocking(self.executor, self._build_contexts, search_results, model, query_embeddings)
+        return [{
+            "context": item['context'],
+            "sources": list(set([res['metadata']['filename'] for res in item['results']])),
+            "chunk_ids": [res['id'] for res in item['results']],
+            "doc_ids": {res['metadata']['doc_id'] for res in item['results']},
+            "query_embedding": query_embedding,
+        } for item, query_embedding in zip(built, query_embeddings)]
+
+    def _build_contexts(self, search_results: List[List[Dict]], model: str, query_embeddings: List) -> List[Dict]:
+        return [self.context_builder.build(results, model, query_embedding, self.rag_engine.encode)
+                for results, query_embedding in zip(search_results, query_embeddings)]
+
+    def store(self, query: str, retrieval: Dict, model: str, response_text: str):
+        if not is_error_response(response_text):
+            self.answer_cache.put(query, retrieval['chunk_ids'], model, response_text, retrieval['doc_ids'], retrieval['query_embedding'])
+
+    async def answer(self, questions: List[Dict], handler, workspace: str = DEFAULT_WORKSPACE, where: Optional[Dict] = None,
+                     concurrency: Optional[int] = None, limiter: Optional[GenerationLimiter] = None) -> AsyncIterator[Dict]:
+        """Réponses du lot au fil de l'eau, puis `{"summary": ...}`.
+
+        `limiter` partage les créneaux de génération avec les requêtes interactives du serveur :
+        les questions du lot attendent un créneau libre et laissent passer ces requêtes devant
+        elles. Une question dont la recherche ou la génération échoue est renvoyée en erreur,
+        sans interrompre le lot.
+        """
+        concurrency = max(1, concurrency or self.concurrency)
+        model = handler.get_current_model()
+        stats = {
+            "questions": len(questions), "answered": 0, "cached": 0, "errors": 0,
+            "retrieve_seconds": 0.0, "generate_seconds": 0.0,
+        }
+        pending: asyncio.Queue = asyncio.Queue(maxsize=max(self.retrieval_batch_size, concurrency))
+        finished: asyncio.Queue = asyncio.Queue()
+        start = time.perf_counter()
+
+        # Chaque question produit un résultat dans `finished`, même si la tâche qui la traite
+        # échoue ou est annulée ; les questions restées sans réponse quand plus aucune génération
+        # ne tourne sont renvoyées en erreur à la fin, au lieu d'attendre indéfiniment
+        async def retrieve_batches():
+            queued = 0
+            completed = False
+            try:
+                for offset in range(0, len(questions), self.retrieval_batch_size):
+                    batch = questions[offset:offset + self.retrieval_batch_size]
+                    batch_start = time.perf_counter()
+                    try:
+                        retrievals = await self.retrieve([question['question'] for question in batch], model, workspace, where)
+                    except Exception as e:
+                        self.logger.error(f"Échec de la recherche pour un lot de {len(batch)} question(s): {e}")
+                        retrievals = [e] * len(batch)
+                    stats["retrieve_seconds"] += time.perf_counter() - batch_start
+                    for question, retrieval in zip(batch, retrievals):
+                        await pending.put((question, retrieval))
+                        queued += 1
+                for _ in range(concurrency):
+                    await pending.put(None)
+                completed = True
+            finally:
+                for question in questions[queued:]:
+                    stats["errors"] += 1
+                    finished.put_nowait(self._error_result(question, "Recherche des documents interrompue."))
+                if not completed:
+                    # Sans marqueurs de fin, les générations attendraient indéfiniment la suite
+                    for worker in workers:
+                        worker.cancel()
+
+        async def generate():
+            while True:
+                item = await pending.get()
+                if item is None:
+                    return
+                result = None
+                try:
+                    result = await self._answer_one(*item, handler, model, limiter, stats)
+                except Exception as e:
+                    self.logger.error(f"Erreur pour la question {item[0]['id']}: {e}", exc_info=True)
+                finally:
+                    if result is None:
+                        stats["errors"] += 1
+                        result = self._error_result(item[0], "Erreur pendant la génération de la réponse.")
+                    finished.put_nowait(result)
+
+        workers = [asyncio.create_task(generate()) for _ in range(concurrency)]
+        tasks = [asyncio.create_task(retrieve_batches())] + workers
+        remaining = {question['index']: question for question in questions}
+        try:
+            while remaining:
+                if finished.empty():
+                    running = [worker for worker in workers if not worker.done()]
+                    if not running:
+                        break
+                    getter = asyncio.ensure_future(finished.get())
+                    await asyncio.wait([getter, *running], return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    result = getter.result()
+                else:
+                    result = finished.get_nowait()
+                remaining.pop(result.get('index'), None)
+                yield result
+            for question in remaining.values():
+                stats["errors"] += 1
+                yield self._error_result(question, "Erreur pendant la génération de la réponse.")
+        finally:
+            # Client déconnecté ou lot abandonné : les recherches et générations en cours sont annulées
+            for task in tasks:
+                task.cancel()
+        yield {"summary": self._summary(stats, time.perf_counter() - start, concurrency)}
+
+    @staticmethod
+    def _error_result(question: Dict, error: str) -> Dict:
+        return {"index": question['index'], "id": question['id'], "question": question['question'], "error": error}
+
+    async def _answer_one(self, question: Dict, retrieval, handler, model: str, limiter: Optional[GenerationLimiter], stats: Dict) -> Dict:
+        result = {"index": question['index'], "id": question['id'], "question": question['question']}
+        if isinstance(retrieval, Exception):
+            stats["errors"] += 1
+            return self._error_result(question, "Erreur pendant la recherche des documents.")
+        result["sources"] = retrieval['sources']
+        cached_answer = self.answer_cache.get(question['question'], retrieval['chunk_ids'], model, retrieval['query_embedding'])
+        if cached_answer is not None:
+            stats["answered"] += 1
+            stats["cached"] += 1
+            metrics.inc("rag_chat_answers_total", endpoint="chat_batch", cached="true")
+            return {**result, "response": cached_answer, "cached": True}
+        generation_start = time.perf_counter()
+        try:
+            async with limiter.slot(background=True) if limiter is not None else nullcontext():
+                with metrics.stage("generate"):
+                    response_text = await handler.agenerate_response(retrieval['context'], question['question'])
+        except Exception as e:
+            self.logger.error(f"Erreur de génération pour la question {question['id']}: {e}")
+            stats["errors"] += 1
+            return {**result, "error": "Erreur pendant la génération de la réponse."}
+        seconds = time.perf_counter() - generation_start
+        stats["generate_seconds"] += seconds
+        metrics.inc("rag_chat_answers_total", endpoint="chat_batch", cached="false")
+        if is_error_response(response_text):
+            stats["errors"] += 1
+        else:
+            stats["answered"] += 1
+            self.store(question['question'], retrieval, answering_model(model), response_text)
+        return {**result, "response": response_text, "cached": False, "generate_seconds": round(seconds, 3)}
+
+    @staticmethod
+    def _summary(stats: Dict, elapsed: float, concurrency: int) -> Dict:
+        generated = stats["answered"] - stats["cached"]
+        return {
+            **stats,
+            "retrieve_seconds": round(stats["retrieve_seconds"], 3),
+            "generate_seconds": round(stats["generate_seconds"], 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "concurrency": concurrency,
+            # Débits par étape : la recherche est séquentielle, les générations se recouvrent
+            "retrieve_questions_per_second": round(stats["questions"] / stats["retrieve_seconds"], 2) if stats["retrieve_seconds"] else None,
+            "generate_seconds_per_answer": round(stats["generate_seconds"] / generated, 3) if generated else None,
+            "questions_per_second": round(stats["questions"] / elapsed, 2) if elapsed else None,
+        }
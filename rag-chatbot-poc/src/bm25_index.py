@@ -0,0 +1,331 @@
+import heapq
+import logging
+import math
+import os
+import pickle
+import re
+import struct
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from filelock import FileLock
+
+# Conserve les identifiants composés (L123-4, REF-2024/01, 3.2.1) en plus de leurs parties
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+# Table de suppression des accents latins, bien plus rapide qu'une normalisation NFKD par texte
+ACCENT_TABLE = {
+    code: unicodedata.normalize('NFKD', chr(code))[0]
+    for code in range(0x00C0, 0x0250)
+    if unicodedata.normalize('NFKD', chr(code)) != chr(code)
+}
+
+
+def tokenize(text: str) -> List[str]:
+    normalized = text.lower().translate(ACCENT_TABLE)
+    tokens = []
+    for token in TOKEN_PATTERN.findall(normalized):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./]", token) if part)
+    return tokens
+
+
+class BM25Index:
+    """Index inversé BM25 sur les chunks, synchronisé avec la collection vectorielle.
+
+    Les postings sont stockés dans des `array` compacts (slot, fréquence) lus sans copie par
+    NumPy pour un scoring vectorisé. Les suppressions marquent simplement le slot comme mort ;
+    l'index est compacté quand la proportion de slots morts dépasse `compaction_ratio`.
+    Les modifications passent par `update`, qui verrouille le fichier pour les autres
+    processus. Elles sont ajoutées au journal de l'instantané courant (identifiants et textes
+    ajoutés, identifiants supprimés) : une écriture coûte la taille du lot, pas celle de
+    l'index. L'instantané n'est réécrit que lorsque le journal dépasse `max_log_ratio` fois
+    sa taille. Chaque processus rejoue la fin du journal écrite par les autres et recharge
+    l'instantané lorsqu'il a été réécrit.
+    """
+    VERSION = 2
+    # En-tête d'un enregistrement du journal : taille de l'enregistrement picklé qui suit
+    _RECORD_HEADER = struct.Struct('<I')
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, compaction_ratio: float = 0.2, max_df_ratio: float = 0.5,
+                 max_log_ratio: float = 0.5):
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self.compaction_ratio = compaction_ratio
+        self.max_df_ratio = max_df_ratio
+        self.max_log_ratio = max_log_ratio
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(f"{self.path}.lock")
+        self._loaded_mtime = None
+        # Instantané chargé et position atteinte dans son journal
+        self._generation = 0
+        self._log_offset = 0
+        # Opérations d'un `batch_update` en cours, écrites dans le journal à la fin du bloc
+        self._batch = None
+        self.clear()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def clear(self):
+        with self._lock:
+            self._slot_ids: List[str] = []
+            self._slots: Dict[str, int] = {}
+            self._postings: Dict[str, Tuple[array, array]] = {}
+            self._lengths = array('f')
+            self._alive = array('b')
+            self._total_length = 0.0
+
+    def update(self, add_ids: List[str] = (), add_texts: List[str] = (), remove_ids: List[str] = ()):
+        """Applique des ajouts et suppressions puis persiste l'index, sous verrou inter-processus."""
+        with self.batch_update(), self._lock:
+            self.remove(remove_ids)
+            self.add(add_ids, add_texts)
+
+    @contextmanager
+    def batch_update(self):
+        """Regroupe plusieurs `add`/`remove` en un seul enregistrement du journal.
+
+        Seul le verrou fichier est conservé pendant le bloc : les recherches du processus
+        restent possibles entre deux lots.
+        """
+        with self._file_lock:
+            self.refresh()
+            self._batch = []
+            try:
+                yield self
+            finally:
+                operations, self._batch = self._batch, None
+                self._persist(operations)
+
+    def rebuild(self, pages: Iterable[Tuple[List[str], List[str]]]):
+        """Reconstruit entièrement l'index à partir de lots (identifiants, textes)."""
+        with self._file_lock, self._lock:
+            self.clear()
+            for chunk_ids, texts in pages:
+                self.add(chunk_ids, texts)
+            self.save()
+
+    def refresh(self):
+        """Rattrape les écritures des autres processus : fin du journal ou nouvel instantané."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if mtime != self._loaded_mtime:
+                self.clear()
+                self._load()
+            else:
+                self._replay_log()
+
+    def _log_path(self, generation: int) -> Path:
+        return self.path.with_name(f"{self.path.stem}.{generation}.log")
+
+    def _replay_log(self):
+        """Applique les enregistrements du journal ajoutés depuis la dernière lecture."""
+        try:
+            with open(self._log_path(self._generation), 'rb') as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            # Instantané réécrit entre-temps : il sera rechargé au prochain passage
+            return
+        position = 0
+        header = self._RECORD_HEADER
+        while position + header.size <= len(data):
+            (length,) = header.unpack_from(data, position)
+            if position + header.size + length > len(data):
+                # Enregistrement en cours d'écriture par un autre processus
+                break
+            for operation in pickle.loads(data[position + header.size:position + header.size + length]):
+                if operation[0] == "add":
+                    self._add(operation[1], operation[2])
+                else:
+                    self._remove(operation[1])
+            position += header.size + length
+        self._log_offset += position
+
+    def _persist(self, operations: List[tuple]):
+        """Ajoute les opérations d'un lot au journal, ou réécrit l'instantané si le journal est devenu trop gros."""
+        if not operations:
+            return
+        record = pickle.dumps(operations, protocol=pickle.HIGHEST_PROTOCOL)
+        log_path = self._log_path(self._generation)
+        try:
+            snapshot_size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            snapshot_size = None
+        if snapshot_size is None or self._log_offset + len(record) > self.max_log_ratio * snapshot_size:
+            self.save()
+            return
+        with open(log_path, 'ab') as f:
+            # Coupe un enregistrement laissé incomplet par une écriture interrompue
+            f.truncate(self._log_offset)
+            f.write(self._RECORD_HEADER.pack(len(record)) + record)
+        self._log_offset += self._RECORD_HEADER.size + len(record)
+
+    def add(self, chunk_ids: List[str], texts: List[str]):
+        with self._lock:
+            if self._batch is not None and chunk_ids:
+                self._batch.append(("add", list(chunk_ids), list(texts)))
+            self._add(chunk_ids, texts)
+
+    def _add(self, chunk_ids: List[str], texts: List[str]):
+        with self._lock:
+            for chunk_id, text in zip(chunk_ids, texts):
+                if chunk_id in self._slots:
+                    self._remove_one(chunk_id)
+                slot = len(self._slot_ids)
+                self._slot_ids.append(chunk_id)
+                self._slots[chunk_id] = slot
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                self._lengths.append(length)
+                self._alive.append(1)
+                self._total_length += length
+                for term, tf in terms.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array('i'), array('H'))
+                    postings[0].append(slot)
+                    postings[1].append(min(tf, 65535))
+
+    def remove(self, chunk_ids: List[str]):
+        with self._lock:
+            if self._batch is not None and chunk_ids:
+                self._batch.append(("remove", list(chunk_ids)))
+            self._remove(chunk_ids)
+
+    def _remove(self, chunk_ids: List[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                if chunk_id in self._slots:
+                    self._remove_one(chunk_id)
+            if self.dead_ratio() > self.compaction_ratio:
+                self.compact()
+
+    def _remove_one(self, chunk_id: str):
+        slot = self._slots.pop(chunk_id)
+        self._alive[slot] = 0
+        self._total_length -= self._lengths[slot]
+
+    def dead_ratio(self) -> float:
+        return 1.0 - len(self._slots) / len(self._slot_ids) if self._slot_ids else 0.0
+
+    def compact(self):
+        """Renumérote les slots vivants et purge les postings des chunks supprimés."""
+        with self._lock:
+            alive = np.frombuffer(self._alive, dtype=np.int8).astype(bool)
+            new_slots = np.cumsum(alive) - 1
+            postings = {}
+            for term, (slots, tfs) in self._postings.items():
+                slots_np = np.frombuffer(slots, dtype=np.int32)
+                keep = alive[slots_np]
+                if keep.any():
+                    postings[term] = (array('i', new_slots[slots_np[keep]].astype(np.int32).tobytes()),
+                                      array('H', np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes()))
+            self._postings = postings
+            self._slot_ids = [chunk_id for chunk_id, is_alive in zip(self._slot_ids, alive) if is_alive]
+            self._slots = {chunk_id: slot for slot, chunk_id in enumerate(self._slot_ids)}
+            self._lengths = array('f', np.frombuffer(self._lengths, dtype=np.float32)[alive].tobytes())
+            self._alive = array('b', [1]) * len(self._slot_ids)
+            self.logger.info(f"Index BM25 compacté : {len(self._slot_ids)} chunks.")
+
+    def search(self, query: str, n_results: int = 10, allowed_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Renvoie les (chunk_id, score) les mieux classés pour la requête, parmi `allowed_ids` s'il est donné."""
+        with self._lock:
+            num_chunks = len(self._slots)
+            terms = [term for term in set(tokenize(query)) if term in self._postings]
+            if not num_chunks or not terms:
+                return []
+            # Les termes présents presque partout (idf ~ 0) n'apportent rien au classement :
+            # une requête qui n'en contient pas d'autres est laissée à la recherche vectorielle
+            terms = [term for term in terms if len(self._postings[term][0]) <= self.max_df_ratio * num_chunks]
+            if not terms:
+                return []
+            lengths = np.frombuffer(self._lengths, dtype=np.float32)
+            length_norm = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / num_chunks))
+            scores = np.zeros(len(self._slot_ids), dtype=np.float32)
+            for term in terms:
+                slots = np.frombuffer(self._postings[term][0], dtype=np.int32)
+                tfs = np.frombuffer(self._postings[term][1], dtype=np.uint16).astype(np.float32)
+                # La fréquence documentaire inclut les slots morts jusqu'au prochain compactage
+                idf = math.log(1 + (num_chunks - len(slots) + 0.5) / (len(slots) + 0.5))
+                scores[slots] += idf * tfs * (self.k1 + 1) / (tfs + length_norm[slots])
+            scores *= np.frombuffer(self._alive, dtype=np.int8)
+            if allowed_ids is not None:
+                # Filtre appliqué avant la sélection des meilleurs : les chunks exclus ne prennent pas de place
+                allowed = np.zeros(len(self._slot_ids), dtype=bool)
+                allowed[[self._slots[chunk_id] for chunk_id in allowed_ids if chunk_id in self._slots]] = True
+                scores *= allowed
+
+            k = min(n_results, int(np.count_nonzero(scores)))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._slot_ids[slot], float(scores[slot])) for slot in top]
+
+    def save(self):
+        """Réécrit l'instantané complet, avec un journal neuf (à appeler sous le verrou fichier)."""
+        with self._lock:
+            if self._slot_ids and self.dead_ratio() > 0:
+                self.compact()
+            generation = self._generation + 1
+            state = {"version": self.VERSION, "generation": generation, "slot_ids": self._slot_ids,
+                     "lengths": self._lengths, "postings": self._postings}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+            self._generation, self._log_offset = generation, 0
+            # Journaux des instantanés précédents (y compris un homonyme laissé par un autre processus) :
+            # leur contenu est dans le nouvel instantané
+            for log_path in self.path.parent.glob(f"{self.path.stem}.*.log"):
+                log_path.unlink(missing_ok=True)
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+            if state.get("version") != self.VERSION:
+                self.logger.warning("Index BM25 dans un format obsolète, il sera reconstruit.")
+                return
+            self._slot_ids = state["slot_ids"]
+            self._slots = {chunk_id: slot for slot, chunk_id in enumerate(self._slot_ids)}
+            self._lengths = state["lengths"]
+            self._postings = state["postings"]
+            self._alive = array('b', [1]) * len(self._slot_ids)
+            self._total_length = float(sum(self._lengths))
+            self._generation, self._log_offset = state.get("generation", 0), 0
+            self._replay_log()
+            self.logger.info(f"Index BM25 chargé : {len(self)} chunks.")
+        except Exception as e:
+            self.logger.error(f"Impossible de charger l'index BM25 ({e}), il sera reconstruit.")
+            self.clear()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fusionne plusieurs classements d'identifiants par Reciprocal Rank Fusion."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+    return heapq.nlargest(len(scores), scores.items(), key=lambda item: item[1])
@@ -0,0 +1,104 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class ChatSessionStore:
+    """Historique des conversations à plusieurs tours, conservé par session dans la base SQLite.
+
+    Seuls les questions et réponses sont conservées, pas le contexte documentaire de chaque
+    tour : l'historique envoyé au LLM reste court et ne change qu'en s'allongeant, ce qui
+    permet à Ollama de réutiliser le préfixe déjà lu. Au-delà de `max_turns` échanges ou de
+    `max_chars` caractères, les plus anciens sont oubliés. La base est partagée par tous les
+    workers : les tours d'une conversation peuvent être servis par des workers différents.
+    Les sessions expirent après `ttl_seconds` d'inactivité.
+    """
+    def __init__(self, config: Dict):
+        self.logger = logging.getLogger(__name__)
+        session_config = config.get('sessions', {})
+        self.enabled = session_config.get('enabled', True)
+        self.max_sessions = session_config.get('max_sessions', 1000)
+        self.ttl_seconds = session_config.get('ttl_seconds', 1800)
+        self.max_turns = session_config.get('max_turns', 6)
+        self.max_chars = session_config.get('max_chars', 6000)
+        self._lock = threading.Lock()
+
+        db_path = config['database']['path']
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        # Transactions explicites : la lecture et la réécriture d'une session ne s'entrelacent pas entre workers
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            "session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_at ON chat_sessions(updated_at)")
+
+    @staticmethod
+    def validate_id(session_id) -> Optional[str]:
+        """Identifiant de session fourni par le client ; ValueError s'il est invalide."""
+        if session_id in (None, ""):
+            return None
+        if not isinstance(session_id, str) or not _SESSION_ID_PATTERN.fullmatch(session_id):
+            raise ValueError("`session_id` invalide (lettres, chiffres, '-' et '_', 64 caractères au plus).")
+        return session_id
+
+    def history(self, session_id: Optional[str]) -> List[Dict]:
+        """Messages des tours précédents (rôles user/assistant), du plus ancien au plus récent."""
+        if not self.enabled or session_id is None:
+            return []
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages FROM chat_sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def append(self, session_id: Optional[str], query: str, answer: str):
+        if not self.enabled or session_id is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT messages FROM chat_sessions WHERE session_id = ? AND updated_at >= ?",
+                    (session_id, now - self.ttl_seconds)
+                ).fetchone()
+                messages = (json.loads(row[0]) if row else []) + [{"role": "user", "content": query}, {"role": "assistant", "content": answer}]
+                # Les tours les plus anciens sont retirés par paires question/réponse
+                while len(messages) > 2 and (len(messages) > 2 * self.max_turns or sum(len(m["content"]) for m in messages) > self.max_chars):
+                    messages = messages[2:]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO chat_sessions (session_id, messages, updated_at) VALUES (?, ?, ?)",
+                    (session_id, json.dumps(messages, ensure_ascii=False), now)
+                )
+                # Sessions expirées, puis les moins récemment actives au-delà de `max_sessions`
+                self._conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+                self._conn.execute(
+                    "DELETE FROM chat_sessions WHERE session_id IN "
+                    "(SELECT session_id FROM chat_sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM chat_sessions WHERE updated_at >= ?", (time.time() - self.ttl_seconds,)
+            ).fetchone()[0]
+        return {"chat_sessions": count}
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional
+
+from .metrics import metrics
+
+class OverloadedError(Exception):
+    """Levée quand la file d'attente de génération est pleine ou trop lente."""
+
+
+class GenerationLimiter:
+    """Limite le nombre de générations LLM simultanées avec une file d'attente bornée.
+
+    Un créneau libéré revient d'abord aux requêtes interactives en attente, puis aux travaux
+    de fond (questions par lots), chacune des deux files étant servie dans l'ordre d'arrivée.
+    """
+    def __init__(self, max_inflight: int, max_queued: int, queue_timeout: float):
+        self.logger = logging.getLogger(__name__)
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.queued = 0
+        self.background_queued = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._background_waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self):
+        if self.inflight < self.max_inflight and not self._waiters:
+            self.inflight += 1
+            return
+        if self.queued >= self.max_queued:
+            self.logger.warning("File d'attente de génération pleine, requête rejetée.")
+            raise OverloadedError("Trop de requêtes en cours, réessayez plus tard.")
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            if not await self._wait(self._waiters, self.queue_timeout):
+                self.logger.warning(f"Aucun créneau de génération libéré en {self.queue_timeout}s.")
+                raise OverloadedError("Délai d'attente dépassé dans la file de génération.")
+        finally:
+            self.queued -= 1
+            metrics.record_stage("queue_wait", time.perf_counter() - start)
+
+    async def acquire_background(self):
+        """Créneau pour un travail de fond (questions par lots) : attend sans limite de file ni de délai,
+        et laisse passer devant lui les requêtes interactives en attente."""
+        if self.inflight < self.max_inflight and not self._waiters and not self._background_waiters:
+            self.inflight += 1
+            return
+        self.background_queued += 1
+        try:
+            await self._wait(self._background_waiters)
+        finally:
+            self.background_queued -= 1
+
+    async def _wait(self, waiters: Deque[asyncio.Future], timeout: Optional[float] = None) -> bool:
+        """Attend qu'un `release()` transmette son créneau ; False si `timeout` expire avant."""
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            done, _ = await asyncio.wait([waiter], timeout=timeout)
+        except asyncio.CancelledError:
+            # Créneau transmis au moment de l'annulation : il passe au suivant
+            if waiter.done():
+                self.release()
+            raise
+        finally:
+            if waiter in waiters:
+                waiters.remove(waiter)
+        if not done:
+            waiter.cancel()
+        return bool(done)
+
+    def release(self):
+        # Le créneau passe directement au prochain en attente : `inflight` ne change pas
+        for waiters in (self._waiters, self._background_waiters):
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.inflight -= 1
+
+    @asynccontextmanager
+    async def slot(self, background: bool = False):
+        if background:
+            await self.acquire_background()
+        else:
+            await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict:
+        return {
+            "inflight_generations": self.inflight,
+            "queued_generations": self.queued,
+            "queued_background_generations": self.background_queued,
+            "max_inflight_generations": self.max_inflight,
+            "max_queued_generations": self.max_queued,
+        }
+
+
+def create_embedding_executor(config: Dict) -> ThreadPoolExecutor:
+    """Pool dédié aux opérations bloquantes d'embedding et de recherche vectorielle."""
+    workers = config.get('concurrency', {}).get('embedding_workers', 2)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding")
+
+
+def create_generation_limiter(config: Dict) -> GenerationLimiter:
+    cfg = config.get('concurrency', {})
+    return GenerationLimiter(
+        max_inflight=cfg.get('max_inflight_generations', 4),
+        max_queued=cfg.get('max_queued_generations', 16),
+        queue_timeout=cfg.get('queue_timeout', 30),
+    )
+
+
+# Tâches soumises par run_blocking et pas encore démarrées, par pool
+_queued_tasks: Dict[ThreadPoolExecutor, int] = {}
+_queued_lock = threading.Lock()
+
+
+def queue_depth(executor: ThreadPoolExecutor) -> int:
+    """Nombre de tâches de `run_blocking` en attente d'un thread du pool."""
+    with _queued_lock:
+        return _queued_tasks.get(executor, 0)
+
+
+async def run_blocking(executor: ThreadPoolExecutor, func: Callable, *args, **kwargs):
+    """Exécute une fonction bloquante dans le pool donné sans bloquer la boucle asyncio."""
+    loop = asyncio.get_running_loop()
+    # Le contexte est propagé au thread pour que les étapes chronométrées y soient rattachées à la requête
+    context = contextvars.copy_context()
+    started = False
+
+    def call():
+        nonlocal started
+        with _queued_lock:
+            if not started:
+                started = True
+                _queued_tasks[executor] -= 1
+        return context.run(func, *args, **kwargs)
+
+    with _queued_lock:
+        _queued_tasks[executor] = _queued_tasks.get(executor, 0) + 1
+    try:
+        return await loop.run_in_executor(executor, call)
+    finally:
+        with _queued_lock:
+            # Attente annulée avant que la tâche ne démarre : elle ne sera jamais exécutée
+            if not started:
+                started = True
+                _queued_tasks[executor] -= 1
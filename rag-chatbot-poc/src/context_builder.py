@@ -0,0 +1,137 @@
+import logging
+import re
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class ContextBuilder:
+    """Construit le contexte envoyé au LLM à partir des chunks récupérés, dans un budget de tokens.
+
+    Les quasi-doublons sont écartés, l'ordre peut être diversifié par MMR, puis les chunks
+    sont ajoutés tant que le budget du modèle le permet. Deux chunks consécutifs d'un même
+    document sont fusionnés en un seul passage, sans répéter leur recouvrement.
+    Les tokens sont estimés à partir du nombre de caractères, le LLM n'exposant pas son tokenizer.
+    """
+    def __init__(self, config: Dict):
+        self.logger = logging.getLogger(__name__)
+        context_config = config.get('context', {})
+        self.candidates = context_config.get('candidates', 10)
+        self.token_budget = context_config.get('token_budget', 1500)
+        self.model_budgets = context_config.get('model_budgets', {})
+        self.chars_per_token = context_config.get('chars_per_token', 4)
+        self.dedup_threshold = context_config.get('dedup_threshold', 0.8)
+        self.mmr = context_config.get('mmr', False)
+        self.mmr_lambda = context_config.get('mmr_lambda', 0.7)
+        self.max_overlap = config.get('embedding', {}).get('chunk_overlap', 200)
+
+    def budget_for(self, model: str) -> int:
+        # "mistral:7b-instruct" utilise le budget de "mistral" s'il n'a pas le sien
+        if model in self.model_budgets:
+            return self.model_budgets[model]
+        return self.model_budgets.get(model.split(':')[0], self.token_budget)
+
+    def estimate_tokens(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+    @staticmethod
+    def compress(text: str) -> str:
+        """Supprime les espaces et lignes vides superflus (fréquents dans les PDF et les tableaux)."""
+        text = re.sub(r"[ \t]{2,}", " ", text)
+        return re.sub(r"\n\s*\n+", "\n", text).strip()
+
+    def build(self, results: List[Dict], model: str, query_embedding: Optional[np.ndarray] = None,
+              encode: Optional[Callable[[List[str]], np.ndarray]] = None) -> Dict:
+        """Sélectionne et assemble les chunks ; renvoie le contexte et les chunks retenus."""
+        candidates = self._deduplicate(results)
+        if self.mmr and encode is not None and query_embedding is not None and len(candidates) > 1:
+            embeddings = encode([candidate['content'] for candidate in candidates])
+            candidates = self._mmr_order(candidates, query_embedding, embeddings)
+
+        budget = self.budget_for(model)
+        passages: List[Dict] = []
+        used_tokens = 0
+        for result in candidates:
+            passage, merged_text = self._find_neighbour(passages, result)
+            if passage is not None:
+                cost = self.estimate_tokens(merged_text) - self.estimate_tokens(passage['text'])
+            else:
+                cost = self.estimate_tokens(result['content'])
+            if not passages and cost > budget:
+                # Le meilleur chunk est toujours envoyé, tronqué au budget s'il le dépasse à lui seul
+                result = {**result, "content": result['content'][:int(budget * self.chars_per_token)]}
+                cost = budget
+            elif used_tokens + cost > budget:
+                # Un chunk trop long est ignoré ; un suivant plus court peut encore entrer dans le budget
+                continue
+            used_tokens += cost
+            if passage is not None:
+                passage['text'] = merged_text
+                passage['results'].append(result)
+                passage['first'] = min(passage['first'], result['metadata'].get('chunk_id', 0))
+                passage['last'] = max(passage['last'], result['metadata'].get('chunk_id', 0))
+            else:
+                position = result['metadata'].get('chunk_id', 0)
+                passages.append({"doc_id": result['metadata'].get('doc_id'), "text": result['content'],
+                                 "first": position, "last": position, "results": [result]})
+
+        selected = [res for passage in passages for res in passage['results']]
+        context = "\n\n".join(self.compress(passage['text']) for passage in passages)
+        self.logger.info(f"Contexte : {len(selected)}/{len(results)} chunks, {len(passages)} passage(s), ~{self.estimate_tokens(context)} tokens (budget {budget})")
+        return {"context": context, "results": selected}
+
+    def _find_neighbour(self, passages: List[Dict], result: Dict):
+        """Passage du même document contigu au chunk, et le texte fusionné correspondant."""
+        doc_id = result['metadata'].get('doc_id')
+        position = result['metadata'].get('chunk_id')
+        if position is None:
+            return None, None
+        for passage in passages:
+            if passage['doc_id'] != doc_id:
+                continue
+            if position == passage['last'] + 1:
+                return passage, self._join(passage['text'], result['content'])
+            if position == passage['first'] - 1:
+                return passage, self._join(result['content'], passage['text'])
+        return None, None
+
+    def _join(self, before: str, after: str) -> str:
+        # Le découpage fait commencer un chunk par la fin du précédent : ce recouvrement n'est gardé qu'une fois
+        for size in range(min(self.max_overlap, len(before), len(after)), 0, -1):
+            if before.endswith(after[:size]):
+                return before + after[size:]
+        return before + "\n" + after
+
+    @staticmethod
+    def _shingles(text: str) -> set:
+        words = re.findall(r"\w+", text.lower())
+        return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+    def _deduplicate(self, results: List[Dict]) -> List[Dict]:
+        """Écarte les chunks dont le contenu recouvre presque entièrement un chunk mieux classé."""
+        kept, kept_shingles = [], []
+        for result in results:
+            shingles = self._shingles(result['content'])
+            if any(len(shingles & other) / max(1, len(shingles | other)) >= self.dedup_threshold for other in kept_shingles):
+                continue
+            kept.append(result)
+            kept_shingles.append(shingles)
+        return kept
+
+    def _mmr_order(self, results: List[Dict], query_embedding: np.ndarray, embeddings: np.ndarray) -> List[Dict]:
+        """Maximal Marginal Relevance : alterne pertinence pour la question et différence avec les chunks déjà choisis."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        relevance = embeddings @ (query / max(np.linalg.norm(query), 1e-12))
+        similarity = embeddings @ embeddings.T
+        remaining = list(range(len(results)))
+        order = []
+        while remaining:
+            if order:
+                redundancy = similarity[np.ix_(remaining, order)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            order.append(remaining.pop(int(np.argmax(scores))))
+        return [results[index] for index in order]
@@ -0,0 +1,300 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .workspaces import DEFAULT_WORKSPACE
+
+
+class DocumentRegistry:
+    """Catalogue persistant des documents indexés (SQLite, `database.path`).
+
+    Source de vérité pour les identifiants de documents : les `doc_id` sont dérivés
+    d'une clé AUTOINCREMENT et ne sont donc jamais réutilisés, même entre processus.
+    """
+    def __init__(self, config: Dict):
+        self.logger = logging.getLogger(__name__)
+        db_path = config['database']['path']
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL UNIQUE,
+                filename TEXT NOT NULL,
+                file_hash TEXT,
+                file_type TEXT,
+                file_size INTEGER DEFAULT 0,
+                chunk_count INTEGER DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                upload_date TEXT NOT NULL,
+                workspace TEXT NOT NULL DEFAULT 'default'
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_file_hash ON documents (file_hash);
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                job_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS index_maintenance (
+                workspace TEXT PRIMARY KEY,
+                deleted_chunks INTEGER NOT NULL DEFAULT 0,
+                compacted_at REAL,
+                write_version INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        # Catalogues créés avant les espaces de travail : tous les documents sont dans l'espace par défaut
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if 'workspace' not in columns:
+            self._conn.execute(f"ALTER TABLE documents ADD COLUMN workspace TEXT NOT NULL DEFAULT '{DEFAULT_WORKSPACE}'")
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(index_maintenance)")}
+        if 'write_version' not in columns:
+            self._conn.execute("ALTER TABLE index_maintenance ADD COLUMN write_version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("DROP INDEX IF EXISTS idx_documents_filename")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_workspace_filename ON documents (workspace, filename)")
+        self._conn.commit()
+
+    @staticmethod
+    def chunk_metadata(document: Dict, file_hash: str, indexed_at: Optional[float] = None) -> Dict:
+        """Métadonnées recopiées sur chaque chunk du document dans la base vectorielle (et filtrables à la recherche)."""
+        return {
+            "id": document['id'], "doc_id": document['doc_id'], "filename": document['filename'], "file_hash": file_hash,
+            "file_type": document.get('file_type') or "", "upload_ts": int(indexed_at if indexed_at is not None else time.time()),
+        }
+
+    @staticmethod
+    def indexed_at(document: Dict) -> float:
+        """Date de la dernière indexation du document, en timestamp (conservée par une réindexation)."""
+        return datetime.strptime(document['upload_date'], "%Y-%m-%d %H:%M").timestamp()
+
+    def _fetch_one(self, where: str, params: tuple) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT * FROM documents WHERE {where} LIMIT 1", params).fetchone()
+        return dict(row) if row else None
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        return self._fetch_one("doc_id = ?", (doc_id,))
+
+    def get_by_filename(self, filename: str, workspace: str = DEFAULT_WORKSPACE) -> Optional[Dict]:
+        return self._fetch_one("workspace = ? AND filename = ? ORDER BY id DESC", (workspace, filename))
+
+    def get_by_hash(self, file_hash: str, workspace: str = DEFAULT_WORKSPACE) -> Optional[Dict]:
+        """Document de l'espace de travail déjà indexé avec exactement ce contenu, s'il existe."""
+        return self._fetch_one("file_hash = ? AND workspace = ? AND status = 'indexed'", (file_hash, workspace))
+
+    def resolve(self, filename: str, workspace: str = DEFAULT_WORKSPACE) -> Dict:
+        """Réutilise le document enregistré sous ce nom dans l'espace de travail, sinon en crée un nouveau."""
+        existing = self.get_by_filename(filename, workspace)
+        return existing if existing else self.allocate(filename, workspace)
+
+    def allocate(self, filename: str, workspace: str = DEFAULT_WORKSPACE) -> Dict:
+        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        file_type = Path(filename).suffix.lstrip('.').upper()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO documents (doc_id, filename, file_type, upload_date, workspace) VALUES (?, ?, ?, ?, ?)",
+                (f"pending_{workspace}_{filename}_{now}", filename, file_type, now, workspace)
+            )
+            row_id = cursor.lastrowid
+            self._conn.execute("UPDATE documents SET doc_id = ? WHERE id = ?", (f"doc_{row_id}", row_id))
+            self._conn.commit()
+        return self.get(f"doc_{row_id}")
+
+    def mark_indexed(self, doc_id: str, file_hash: str, file_size: int, chunk_count: int) -> Dict:
+        # Le hash n'est enregistré qu'une fois l'indexation réussie, pour ne jamais ignorer un fichier à tort
+        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        with self._lock:
+            self._conn.execute(
+                "UPDATE documents SET file_hash = ?, file_size = ?, chunk_count = ?, status = 'indexed', upload_date = ? WHERE doc_id = ?",
+                (file_hash, file_size, chunk_count, now, doc_id)
+            )
+            self._conn.commit()
+        return self.get(doc_id)
+
+    def update_index_info(self, doc_id: str, file_hash: str, chunk_count: int):
+        """Met à jour un document réindexé, sans changer sa date d'indexation."""
+        with self._lock:
+            self._conn.execute("UPDATE documents SET file_hash = ?, chunk_count = ? WHERE doc_id = ?", (file_hash, chunk_count, doc_id))
+            self._conn.commit()
+
+    def delete(self, doc_id: str):
+        self.delete_many([doc_id])
+
+    def delete_many(self, doc_ids: List[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+            self._conn.commit()
+
+    def count_by_hash(self, file_hash: str) -> int:
+        """Nombre de documents, tous espaces de travail confondus, qui ont exactement ce contenu."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents WHERE file_hash = ?", (file_hash,)).fetchone()[0]
+
+    @staticmethod
+    def _workspace_clause(workspace: Optional[str]) -> Tuple[str, tuple]:
+        # workspace=None : tous les espaces de travail
+        return ("", ()) if workspace is None else (" AND workspace = ?", (workspace,))
+
+    def count(self, workspace: Optional[str] = None) -> int:
+        clause, params = self._workspace_clause(workspace)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM documents WHERE status = 'indexed'{clause}", params).fetchone()[0]
+
+    def list(self, page: int = 1, page_size: int = 50, workspace: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """Renvoie une page de documents indexés (les plus récents d'abord) et le nombre total."""
+        offset = max(page - 1, 0) * page_size
+        clause, params = self._workspace_clause(workspace)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM documents WHERE status = 'indexed'{clause} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + (page_size, offset)
+            ).fetchall()
+            total = self._conn.execute(f"SELECT COUNT(*) FROM documents WHERE status = 'indexed'{clause}", params).fetchone()[0]
+        return [dict(row) for row in rows], total
+
+    def indexed_documents(self, workspace: Optional[str] = None) -> List[Dict]:
+        """Tous les documents indexés, du plus ancien au plus récent."""
+        clause, params = self._workspace_clause(workspace)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM documents WHERE status = 'indexed'{clause} ORDER BY id", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def workspace_counts(self) -> Dict[str, int]:
+        """Nombre de documents indexés par espace de travail."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT workspace, COUNT(*) AS documents FROM documents WHERE status = 'indexed' GROUP BY workspace ORDER BY workspace"
+            ).fetchall()
+        return {row['workspace']: row['documents'] for row in rows}
+
+    def chunk_counts(self) -> Dict[str, int]:
+        """Nombre de chunks des documents indexés, par espace de travail."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT workspace, SUM(chunk_count) AS chunks FROM documents WHERE status = 'indexed' GROUP BY workspace"
+            ).fetchall()
+        return {row['workspace']: row['chunks'] or 0 for row in rows}
+
+    def reconcile(self, indexed_documents: Dict[str, Dict]):
+        """Aligne le catalogue sur le contenu réel de la base vectorielle.
+
+        `indexed_documents` associe chaque doc_id présent dans la collection à son nom de
+        fichier, son hash, son espace de travail et son nombre de chunks.
+        """
+        with self._lock:
+            known = {row['doc_id']: dict(row) for row in self._conn.execute("SELECT * FROM documents")}
+            added = updated = removed = 0
+            now = datetime.now().strftime("%Y-%m-%d %H:%M")
+            # Les anciens doc_N passent en premier pour conserver leur identifiant numérique
+            ordered = sorted(indexed_documents.items(), key=lambda item: re.fullmatch(r"doc_\d+", item[0]) is None)
+            for doc_id, info in ordered:
+                row = known.get(doc_id)
+                if row is None:
+                    match = re.fullmatch(r"doc_(\d+)", doc_id)
+                    row_id = int(match.group(1)) if match else None
+                    if row_id is not None and self._conn.execute("SELECT 1 FROM documents WHERE id = ?", (row_id,)).fetchone():
+                        row_id = None
+                    self._conn.execute(
+                        "INSERT INTO documents (id, doc_id, filename, file_hash, file_type, chunk_count, status, upload_date, workspace) "
+                        "VALUES (?, ?, ?, ?, ?, ?, 'indexed', ?, ?)",
+                        (row_id, doc_id, info['filename'], info.get('file_hash'), Path(info['filename']).suffix.lstrip('.').upper(), info['chunk_count'], now,
+                         info.get('workspace', DEFAULT_WORKSPACE))
+                    )
+                    added += 1
+                elif (row['status'] != 'indexed' or row['chunk_count'] != info['chunk_count']
+                      or row['workspace'] != info.get('workspace', DEFAULT_WORKSPACE)):
+                    self._conn.execute(
+                        "UPDATE documents SET chunk_count = ?, status = 'indexed', workspace = ? WHERE doc_id = ?",
+                        (info['chunk_count'], info.get('workspace', DEFAULT_WORKSPACE), doc_id)
+                    )
+                    updated += 1
+            # Les documents en cours d'indexation (statut pending) ne sont pas concernés, ni les documents
+            # indexés sans aucun chunk (image, fichier vide), absents de la base vectorielle par nature
+            for doc_id in set(known) - set(indexed_documents):
+                if known[doc_id]['status'] == 'indexed' and known[doc_id]['chunk_count']:
+                    self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                    removed += 1
+            self._conn.commit()
+        if added or updated or removed:
+            self.logger.info(f"Catalogue réconcilié avec la base vectorielle : {added} ajouté(s), {updated} mis à jour, {removed} supprimé(s).")
+
+    def save_job(self, job: Dict):
+        """Partage l'état d'un job d'ingestion entre les workers."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO ingestion_jobs (job_id, state) VALUES (?, ?)", (job['job_id'], json.dumps(job)))
+            self._conn.commit()
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM ingestion_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row['state']) if row else None
+
+    def prune_jobs(self, older_than: float) -> int:
+        """Supprime les jobs d'ingestion terminés avant le timestamp `older_than`."""
+        with self._lock:
+            rows = self._conn.execute("SELECT job_id, state FROM ingestion_jobs").fetchall()
+            expired = [(row['job_id'],) for row in rows if (json.loads(row['state']).get('finished_at') or older_than) < older_than]
+            self._conn.executemany("DELETE FROM ingestion_jobs WHERE job_id = ?", expired)
+            self._conn.commit()
+        return len(expired)
+
+    # --- Maintenance de l'index ---
+
+    def record_deleted_chunks(self, workspace: str, count: int):
+        """Compte les chunks supprimés de la collection d'un espace de travail depuis sa dernière compaction."""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO index_maintenance (workspace) VALUES (?)", (workspace,))
+            self._conn.execute("UPDATE index_maintenance SET deleted_chunks = deleted_chunks + ? WHERE workspace = ?", (count, workspace))
+            self._conn.commit()
+
+    def record_write(self, workspace: str):
+        """Compte une écriture dans la collection d'un espace de travail, quel que soit le processus qui la fait."""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO index_maintenance (workspace) VALUES (?)", (workspace,))
+            self._conn.execute("UPDATE index_maintenance SET write_version = write_version + 1 WHERE workspace = ?", (workspace,))
+            self._conn.commit()
+
+    def write_version(self, workspace: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT write_version FROM index_maintenance WHERE workspace = ?", (workspace,)).fetchone()
+        return row['write_version'] if row else 0
+
+    def mark_compacted(self, workspace: str):
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO index_maintenance (workspace) VALUES (?)", (workspace,))
+            self._conn.execute("UPDATE index_maintenance SET deleted_chunks = 0, compacted_at = ? WHERE workspace = ?", (time.time(), workspace))
+            self._conn.commit()
+
+    def maintenance_state(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM index_maintenance").fetchall()
+        return {row['workspace']: dict(row) for row in rows}
+
+    def file_size(self) -> int:
+        """Taille du fichier SQLite et de son journal WAL, en octets."""
+        with self._lock:
+            path = Path(self._conn.execute("PRAGMA database_list").fetchone()['file'])
+        return sum(candidate.stat().st_size for candidate in (path, Path(f"{path}-wal")) if candidate.exists())
+
+    def free_page_ratio(self) -> float:
+        with self._lock:
+            pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            free = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return free / pages if pages else 0.0
+
+    def vacuum(self):
+        """Réécrit la base SQLite sans ses pages libres (catalogue, jobs, cache d'embeddings)."""
+        with self._lock:
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,11 +1,17 @@
+import hashlib
 from pathlib import Path
-import PyPDF2
-from docx import Document as DocxDocument
-import openpyxl
-from pptx import Presentation
+from typing import Dict, Iterator, List, Tuple
 import logging
 
+# Un segment est un morceau de texte accompagné de sa position dans le fichier (page, feuille, diapositive)
+Segment = Tuple[Dict, str]
+
 class DocumentProcessor:
+    # Taille cible des segments pour les formats sans pagination naturelle (texte, Word, lignes Excel)
+    SEGMENT_CHARS = 50000
+    # À incrémenter quand l'extraction change : le texte déjà extrait et conservé est alors ignoré
+    EXTRACTOR_VERSION = 1
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.extractors = {
@@ -16,50 +22,88 @@ class DocumentProcessor:
             '.txt': self._extract_txt,
         }
 
-    def extract_text(self, file_path: str) -> str:
+    @staticmethod
+    def compute_file_hash(file_path: str) -> str:
+        """Hash SHA-256 du contenu du fichier, lu par blocs."""
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def iter_segments(self, file_path: str) -> Iterator[Segment]:
+        """Extrait le texte segment par segment, sans jamais charger tout le texte en mémoire."""
         file_ext = Path(file_path).suffix.lower()
         extractor = self.extractors.get(file_ext)
-        if extractor:
-            try:
-                self.logger.info(f"Extraction du texte du fichier : {file_path}")
-                return extractor(file_path)
-            except Exception as e:
-                self.logger.error(f"Erreur lors de l'extraction de {file_path}: {e}")
-                raise ValueError(f"Impossible de traiter le fichier : {e}")
-        self.logger.warning(f"Type de fichier non supporté : {file_ext}")
-        raise ValueError(f"Type de fichier non supporté : {file_ext}")
+        if not extractor:
+            self.logger.warning(f"Type de fichier non supporté : {file_ext}")
+            raise ValueError(f"Type de fichier non supporté : {file_ext}")
+        self.logger.info(f"Extraction du texte du fichier : {file_path}")
+        try:
+            yield from extractor(file_path)
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'extraction de {file_path}: {e}")
+            raise ValueError(f"Impossible de traiter le fichier : {e}")
+
+    def extract_text(self, file_path: str) -> str:
+        return "\n".join(text for _, text in self.iter_segments(file_path))
+
+    def _group_lines(self, lines, location: Dict) -> Iterator[Segment]:
+        buffer: List[str] = []
+        size = 0
+        for line in lines:
+            buffer.append(line)
+            size += len(line) + 1
+            if size >= self.SEGMENT_CHARS:
+                yield dict(location), "\n".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield dict(location), "\n".join(buffer)
 
-    def _extract_pdf(self, file_path: str) -> str:
-        text = ""
+    # Les bibliothèques de chaque format ne sont importées qu'à la première extraction
+    def _extract_pdf(self, file_path: str) -> Iterator[Segment]:
+        import PyPDF2
         with open(file_path, 'rb') as file:
             reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                text += page.extract_text() or ""
-        return text
+            for page_number, page in enumerate(reader.pages, start=1):
+                text = page.extract_text() or ""
+                if text.strip():
+                    yield {"page": page_number}, text
 
-    def _extract_docx(self, file_path: str) -> str:
+    def _extract_docx(self, file_path: str) -> Iterator[Segment]:
+        from docx import Document as DocxDocument
         doc = DocxDocument(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
+        yield from self._group_lines((para.text for para in doc.paragraphs), {})
 
-    def _extract_excel(self, file_path: str) -> str:
-        workbook = openpyxl.load_workbook(file_path)
-        text = ""
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            text += f"Feuille: {sheet_name}\n"
-            for row in sheet.iter_rows():
-                text += "\t".join([str(cell.value or "") for cell in row]) + "\n"
-        return text
+    def _extract_excel(self, file_path: str) -> Iterator[Segment]:
+        import openpyxl
+        # read_only : les lignes sont lues à la demande au lieu de charger tout le classeur
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet_name in workbook.sheetnames:
+                lines = [f"Feuille: {sheet_name}"]
+                size = 0
+                row_start = row_end = 1
+                for row_end, row in enumerate(workbook[sheet_name].iter_rows(values_only=True), start=1):
+                    line = "\t".join([str(value or "") for value in row])
+                    lines.append(line)
+                    size += len(line) + 1
+                    if size >= self.SEGMENT_CHARS:
+                        yield {"sheet": sheet_name, "row_start": row_start, "row_end": row_end}, "\n".join(lines)
+                        lines, size, row_start = [], 0, row_end + 1
+                if lines and row_start <= row_end:
+                    yield {"sheet": sheet_name, "row_start": row_start, "row_end": row_end}, "\n".join(lines)
+        finally:
+            workbook.close()
 
-    def _extract_pptx(self, file_path: str) -> str:
+    def _extract_pptx(self, file_path: str) -> Iterator[Segment]:
+        from pptx import Presentation
         prs = Presentation(file_path)
-        text = ""
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-        return text
+        for slide_number, slide in enumerate(prs.slides, start=1):
+            texts = [shape.text for shape in slide.shapes if hasattr(shape, "text")]
+            if any(text.strip() for text in texts):
+                yield {"slide": slide_number}, "\n".join(texts)
 
-    def _extract_txt(self, file_path: str) -> str:
+    def _extract_txt(self, file_path: str) -> Iterator[Segment]:
         with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
\ No newline at end of file
+            yield from self._group_lines((line.rstrip("\n") for line in file), {})
@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Fichiers produits par l'export, dans embedding.onnx.cache_dir/<nom du modèle>
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+EXPORT_CONFIG_FILE = "embedding_config.json"
+
+
+def load_embedding_model(config: Dict):
+    """Charge le modèle d'embedding selon `embedding.backend` ; tous exposent `encode` comme SentenceTransformer."""
+    embedding_config = config['embedding']
+    backend = embedding_config.get('backend', 'torch')
+    model_name = embedding_config['model_name']
+    if backend == 'torch':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend in ('onnx', 'onnx-int8'):
+        onnx_config = embedding_config.get('onnx', {})
+        quantized = backend == 'onnx-int8'
+        model_dir = export_onnx_model(model_name, onnx_config.get('cache_dir', 'data/models'), quantized=quantized)
+        return OnnxEmbeddingModel(model_dir, quantized=quantized, threads=onnx_config.get('threads', 0))
+    raise ValueError(f"Backend d'embedding inconnu : {backend} (attendu : {', '.join(BACKENDS)})")
+
+
+def embedding_cache_key(embedding_config: Dict) -> str:
+    """Identifiant du modèle dans le cache d'embeddings : les vecteurs int8 diffèrent légèrement des vecteurs float32."""
+    model_name = embedding_config['model_name']
+    if embedding_config.get('backend', 'torch') == 'onnx-int8':
+        return f"{model_name}:int8"
+    return model_name
+
+
+def export_onnx_model(model_name: str, cache_dir: str, quantized: bool = False) -> Path:
+    """Exporte le modèle SentenceTransformer en ONNX (et sa version int8) au premier usage.
+
+    Seul le transformer est exporté ; la tokenisation, le pooling et la normalisation
+    sont refaits par OnnxEmbeddingModel à partir de la configuration enregistrée à côté.
+    """
+    return prepare_onnx_model(model_name, cache_dir, _export_transformer, quantized=quantized)
+
+
+def prepare_onnx_model(model_name: str, cache_dir: str, exporter: Callable[[str, Path], None], quantized: bool = False) -> Path:
+    """Répertoire du modèle exporté dans `cache_dir`, en l'exportant avec `exporter` s'il n'existe pas encore."""
+    logger = logging.getLogger(__name__)
+    model_dir = Path(cache_dir) / re.sub(r"[^\w.-]", "_", model_name)
+    model_path = model_dir / ONNX_MODEL_FILE
+    if not model_path.exists():
+        logger.info(f"Export ONNX du modèle {model_name} vers {model_dir}")
+        exporter(model_name, model_dir)
+    int8_path = model_dir / ONNX_INT8_MODEL_FILE
+    if quantized and not int8_path.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logger.info(f"Quantification int8 du modèle {model_name}")
+        tmp_path = int8_path.with_suffix(".tmp")
+        quantize_dynamic(str(model_path), str(tmp_path), weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return model_dir
+
+
+def _export_transformer(model_name: str, model_dir: Path):
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    tokenizer = transformer.tokenizer
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in tokenizer.model_input_names]
+    pooling = next((module for module in st_model if type(module).__name__ == "Pooling"), None)
+    export_config = {
+        "model_name": model_name,
+        "input_names": input_names,
+        "pooling": pooling.get_pooling_mode_str() if pooling is not None else "mean",
+        "normalize": any(type(module).__name__ == "Normalize" for module in st_model),
+        "max_seq_length": st_model.max_seq_length,
+        "dimension": st_model.get_sentence_embedding_dimension(),
+        "pad_token_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token,
+    }
+
+    sample = tokenizer(["warm-up"], return_tensors="pt")
+    export_transformer_to_onnx(transformer.auto_model, tokenizer, "last_hidden_state", sample, model_dir, export_config)
+
+
+def export_transformer_to_onnx(hf_model, tokenizer, output_name: str, sample, model_dir: Path, export_config: Dict):
+    """Exporte un modèle Hugging Face en ONNX (axes lot et séquence dynamiques) avec son tokenizer et sa configuration."""
+    import torch
+
+    input_names = export_config["input_names"]
+
+    class TransformerOutput(torch.nn.Module):
+        # Les entrées sont positionnelles dans l'export ONNX : on les renomme pour le modèle Hugging Face
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return getattr(self.model(**dict(zip(input_names, inputs))), output_name)
+
+    model_dir.mkdir(parents=True, exist_ok=True)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch"} if output_name == "logits" else {0: "batch", 1: "sequence"}
+    tmp_path = model_dir / (ONNX_MODEL_FILE + ".tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            TransformerOutput(hf_model.eval()),
+            tuple(sample[name] for name in input_names),
+            str(tmp_path),
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            do_constant_folding=True,
+        )
+    tokenizer.save_pretrained(str(model_dir))
+    (model_dir / EXPORT_CONFIG_FILE).write_text(json.dumps(export_config, indent=2), encoding="utf-8")
+    # Le modèle est écrit en dernier : sa présence signifie que l'export est complet
+    os.replace(tmp_path, model_dir / ONNX_MODEL_FILE)
+
+
+def create_onnx_session(model_path: Path, threads: int = 0):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def pad_encodings(encodings, pad_token_id: int) -> Dict[str, np.ndarray]:
+    """Entrées du modèle pour un lot d'encodages `tokenizers`, complétés à la longueur du plus long."""
+    length = max(len(encoding.ids) for encoding in encodings)
+    input_ids = np.full((len(encodings), length), pad_token_id or 0, dtype=np.int64)
+    attention_mask = np.zeros((len(encodings), length), dtype=np.int64)
+    token_type_ids = np.zeros((len(encodings), length), dtype=np.int64)
+    for row, encoding in enumerate(encodings):
+        size = len(encoding.ids)
+        input_ids[row, :size] = encoding.ids
+        attention_mask[row, :size] = 1
+        token_type_ids[row, :size] = encoding.type_ids
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+
+
+class OnnxEmbeddingModel:
+    """Encodeur ONNX Runtime (CPU) compatible avec SentenceTransformer.encode."""
+    def __init__(self, model_dir: Path, quantized: bool = False, threads: int = 0):
+        from tokenizers import Tokenizer
+
+        self.logger = logging.getLogger(__name__)
+        model_dir = Path(model_dir)
+        self.export_config = json.loads((model_dir / EXPORT_CONFIG_FILE).read_text(encoding="utf-8"))
+        self.input_names = self.export_config["input_names"]
+        self.dimension = self.export_config["dimension"]
+
+        # Pas de padding à la tokenisation : chaque lot est complété à la longueur de son plus long texte
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.export_config["max_seq_length"])
+        self.tokenizer.no_padding()
+
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        self.session = create_onnx_session(model_dir / model_file, threads)
+        self.logger.info(f"Modèle d'embedding ONNX chargé : {model_dir / model_file}")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(list(texts))
+        # Textes triés par longueur : les lots contiennent des textes de taille proche, donc peu de padding
+        order = sorted(range(len(encodings)), key=lambda index: len(encodings[index].ids))
+        vectors = np.empty((len(encodings), self.dimension), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            vectors[batch] = self._encode_batch([encodings[index] for index in batch])
+        return vectors
+
+    def _encode_batch(self, encodings) -> np.ndarray:
+        inputs = pad_encodings(encodings, self.export_config["pad_token_id"])
+        attention_mask = inputs["attention_mask"]
+        hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+
+        if self.export_config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        elif self.export_config["pooling"] == "max":
+            pooled = np.where(attention_mask[..., None] > 0, hidden, -np.inf).max(axis=1)
+        else:
+            mask = attention_mask[..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.export_config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+class MicroBatcher:
+    """Regroupe les petits appels concurrents à `encode` en un seul passage dans le modèle.
+
+    Les requêtes de chat encodent une seule question : sous charge, plusieurs threads
+    arrivent en même temps et un lot de N questions coûte à peine plus qu'une seule.
+    Le thread de fond attend au plus `max_wait_ms` les appels déjà en cours, jamais
+    lorsqu'un appel est seul. Les gros lots (ingestion) sont passés directement au modèle.
+    """
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.logger = logging.getLogger(__name__)
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "Queue[Optional[tuple]]" = Queue()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.stats = {"microbatch_batches": 0, "microbatch_requests": 0}
+        self._thread = threading.Thread(target=self._run, name="embedding-microbatcher", daemon=True)
+        self._thread.start()
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        texts = list(texts)
+        if len(texts) >= self.max_batch_size:
+            return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+        future: Future = Future()
+        with self._lock:
+            self._waiting += 1
+        self._queue.put((texts, future))
+        return future.result()
+
+    def _collect(self, first: tuple) -> List[tuple]:
+        pending = [first]
+        count = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch_size:
+            with self._lock:
+                if self._waiting <= len(pending):
+                    break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            pending.append(item)
+            count += len(item[0])
+        with self._lock:
+            self._waiting -= len(pending)
+        return pending
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            pending = self._collect(first)
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            try:
+                vectors = np.asarray(self.model.encode(texts, batch_size=len(texts), show_progress_bar=False), dtype=np.float32)
+            except Exception as e:
+                self.logger.error(f"Erreur d'encodage du micro-lot ({len(pending)} requête(s)) : {e}")
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.stats["microbatch_batches"] += 1
+            self.stats["microbatch_requests"] += len(pending)
+            offset = 0
+            for item_texts, future in pending:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Cache d'embeddings sur disque (SQLite) avec un LRU en mémoire devant.
+
+    Les entrées sont indexées par (nom du modèle, hash du texte) ; celles d'un autre
+    modèle sont purgées à l'ouverture puisqu'elles ne peuvent plus servir.
+    """
+    def __init__(self, db_path: str, model_name: str, memory_size: int = 10000):
+        self.logger = logging.getLogger(__name__)
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "encode_seconds": 0.0, "encoded_texts": 0}
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        purged = self._conn.execute("DELETE FROM embedding_cache WHERE model != ?", (model_name,)).rowcount
+        self._conn.commit()
+        if purged:
+            self.logger.info(f"Cache d'embeddings : {purged} entrée(s) d'un ancien modèle supprimée(s).")
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        missing = []
+        with self._lock:
+            for text_hash in hashes:
+                vector = self._memory.get(text_hash)
+                if vector is not None:
+                    self._memory.move_to_end(text_hash)
+                    found[text_hash] = vector
+                else:
+                    missing.append(text_hash)
+            self.stats["memory_hits"] += len(found)
+
+            # SQLite limite le nombre de paramètres par requête
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embedding_cache WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[text_hash] = vector
+                    self._remember(text_hash, vector)
+                self.stats["disk_hits"] += len(rows)
+            self.stats["misses"] += len(hashes) - len(found)
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray], encode_seconds: float = 0.0):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(self.model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes()) for text_hash, vector in vectors.items()]
+            )
+            self._conn.commit()
+            for text_hash, vector in vectors.items():
+                self._remember(text_hash, np.asarray(vector, dtype=np.float32))
+            self.stats["encode_seconds"] += encode_seconds
+            self.stats["encoded_texts"] += len(vectors)
+
+    def _remember(self, text_hash: str, vector: np.ndarray):
+        self._memory[text_hash] = vector
+        self._memory.move_to_end(text_hash)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            lookups = hits + self.stats["misses"]
+            avg_encode = self.stats["encode_seconds"] / self.stats["encoded_texts"] if self.stats["encoded_texts"] else 0.0
+            return {
+                "embedding_cache_hits": hits,
+                "embedding_cache_misses": self.stats["misses"],
+                "embedding_cache_hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "embedding_cache_memory_entries": len(self._memory),
+                # Estimation : temps moyen d'encodage observé multiplié par le nombre de hits
+                "embedding_cache_saved_seconds": round(hits * avg_encode, 3),
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
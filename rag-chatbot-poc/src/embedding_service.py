@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Variables d'environnement positionnées par le lanceur multi-workers et lues par chaque worker
+SERVICE_ADDRESS_ENV = "RAG_EMBEDDING_SERVICE"
+SERVICE_AUTHKEY_ENV = "RAG_EMBEDDING_AUTHKEY"
+
+
+def get_service_address() -> Optional[Tuple[Tuple[str, int], bytes]]:
+    """Adresse et clé du service d'embedding partagé, si ce processus est un worker."""
+    address = os.environ.get(SERVICE_ADDRESS_ENV)
+    if not address:
+        return None
+    host, port = address.rsplit(":", 1)
+    return (host, int(port)), bytes.fromhex(os.environ[SERVICE_AUTHKEY_ENV])
+
+
+def serve_embeddings(config: Dict, address: Tuple[str, int], authkey: bytes):
+    """Point d'entrée du processus qui héberge l'unique modèle d'embedding de la machine."""
+    from .embedding_backends import MicroBatcher, load_embedding_model
+
+    logger = logging.getLogger(__name__)
+    embedding_config = config['embedding']
+    logger.info(f"Service d'embedding : chargement du modèle {embedding_config['model_name']} (backend {embedding_config.get('backend', 'torch')})")
+    batching_config = embedding_config.get('micro_batching', {})
+    # Les petites requêtes de tous les workers sont traitées par un seul thread, regroupées si possible
+    model = MicroBatcher(
+        load_embedding_model(config),
+        max_batch_size=batching_config.get('max_batch_size', 32),
+        max_wait_ms=batching_config.get('max_wait_ms', 5) if batching_config.get('enabled', False) else 0,
+    )
+
+    def handle(connection):
+        with connection:
+            while True:
+                try:
+                    texts, batch_size = connection.recv()
+                except EOFError:
+                    return
+                try:
+                    vectors = model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+                    connection.send(("ok", np.asarray(vectors, dtype=np.float32)))
+                except Exception as e:
+                    logger.error(f"Service d'embedding : erreur d'encodage ({e})")
+                    connection.send(("error", str(e)))
+
+    # Backlog large : chaque worker ouvre une connexion par thread de son pool d'embedding
+    with Listener(address, backlog=128, authkey=authkey) as listener:
+        logger.info(f"Service d'embedding à l'écoute sur {address[0]}:{address[1]}")
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=handle, args=(connection,), daemon=True).start()
+
+
+class RemoteEmbeddingModel:
+    """Remplaçant de SentenceTransformer.encode qui délègue au service d'embedding partagé."""
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _connection(self):
+        # Une connexion par thread : les requêtes d'un même thread sont séquentielles
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = Client(self.address, authkey=self.authkey)
+        return connection
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        try:
+            connection = self._connection()
+            connection.send((list(texts), batch_size))
+            status, payload = connection.recv()
+        except (EOFError, OSError):
+            # Connexion perdue (redémarrage du service) : on réessaie une fois avec une nouvelle
+            self._local.connection = None
+            connection = self._connection()
+            connection.send((list(texts), batch_size))
+            status, payload = connection.recv()
+        if status != "ok":
+            raise RuntimeError(f"Erreur du service d'embedding : {payload}")
+        return payload
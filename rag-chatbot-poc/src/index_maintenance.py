@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .multiworker import get_chroma_server
+
+
+class IndexMaintenance:
+    """Compaction de la base vectorielle et nettoyage du catalogue SQLite.
+
+    Les chunks supprimés (documents supprimés ou remplacés, chunks disparus d'un document
+    réindexé) occupent l'index tant qu'il n'est pas réécrit ; avec ChromaDB, le graphe HNSW
+    continue de grossir et la recherche de ralentir. Quand la part de chunks supprimés d'un
+    espace de travail dépasse `tombstone_ratio`, sa collection est compactée. Le catalogue
+    est ensuite purgé des anciens jobs d'ingestion et réécrit (VACUUM) s'il contient trop
+    de pages libres. Chaque compaction mesure la taille de l'index et la latence de la
+    recherche vectorielle avant et après.
+
+    Avec ChromaDB en mode multi-workers, les autres workers garderaient une référence vers
+    l'ancienne collection : la compaction n'y est faite que par `python run.py compact`,
+    serveur arrêté.
+    """
+    def __init__(self, config: Dict, rag_engine, registry):
+        self.logger = logging.getLogger(__name__)
+        maintenance_config = config.get('maintenance', {})
+        self.enabled = maintenance_config.get('enabled', True)
+        self.check_interval = maintenance_config.get('check_interval', 3600)
+        self.tombstone_ratio = maintenance_config.get('tombstone_ratio', 0.2)
+        self.min_deleted_chunks = maintenance_config.get('min_deleted_chunks', 100)
+        self.latency_queries = maintenance_config.get('latency_queries', 20)
+        self.job_retention_days = maintenance_config.get('job_retention_days', 30)
+        self.rag_engine = rag_engine
+        self.registry = registry
+        # Écritures de tous les processus, comptées par le catalogue (voir `RAGEngine.compact`)
+        rag_engine.write_version = registry.write_version
+        self.shared_chroma = config['database']['vector_db'].get('type', 'chromadb') == 'chromadb' and get_chroma_server() is not None
+        self.last_report: Optional[Dict] = None
+        self._run_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="maintenance")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def workspace_stats(self, workspace: Optional[str] = None) -> List[Dict]:
+        """Chunks vivants et supprimés de chaque espace de travail (tous si `workspace` est None)."""
+        state = self.registry.maintenance_state()
+        stats = []
+        for name in self.rag_engine.list_workspaces():
+            if workspace is not None and name != workspace:
+                continue
+            chunks = self.rag_engine.count(name)
+            # ChromaDB ne sait pas compter ses chunks supprimés : le catalogue les a comptés
+            deleted = self.rag_engine.tombstones(name)
+            if deleted is None:
+                deleted = state.get(name, {}).get('deleted_chunks', 0)
+            stats.append({
+                "workspace": name, "chunks": chunks, "deleted_chunks": deleted,
+                "tombstone_ratio": round(deleted / (chunks + deleted), 4) if chunks + deleted else 0.0,
+                "compacted_at": state.get(name, {}).get('compacted_at'),
+            })
+        return stats
+
+    def needs_compaction(self, stats: Dict) -> bool:
+        return stats["deleted_chunks"] >= self.min_deleted_chunks and stats["tombstone_ratio"] > self.tombstone_ratio
+
+    def get_status(self) -> Dict:
+        return {
+            "running": self._run_lock.locked(),
+            "tombstone_ratio_threshold": self.tombstone_ratio,
+            "workspaces": self.workspace_stats(),
+            "last_report": self.last_report,
+        }
+
+    def submit(self, workspace: Optional[str] = None, force: bool = False) -> bool:
+        """Lance un passage de maintenance en arrière-plan ; False si un passage est déjà en cours."""
+        if self._run_lock.locked():
+            return False
+        self._executor.submit(self._run_logged, workspace, force)
+        return True
+
+    def _run_logged(self, workspace: Optional[str], force: bool):
+        try:
+            self.run(workspace, force)
+        except Exception as e:
+            self.logger.error(f"Échec de la maintenance de l'index: {e}", exc_info=True)
+
+    def run(self, workspace: Optional[str] = None, force: bool = False, allow_shared: bool = False) -> Optional[Dict]:
+        """Compacte les espaces de travail au-delà du seuil (tous si `force`), puis nettoie le catalogue.
+
+        Renvoie le rapport du passage, None si un autre passage est en cours.
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            report = {"started_at": time.time(), "workspaces": [], "metadata": None}
+            for stats in self.workspace_stats(workspace):
+                if not force and not self.needs_compaction(stats):
+                    continue
+                if self.shared_chroma and not allow_shared:
+                    report["workspaces"].append({**stats, "skipped": "ChromaDB partagé par plusieurs workers : utiliser `python run.py compact`, serveur arrêté."})
+                    continue
+                report["workspaces"].append(self._compact(stats))
+            report["metadata"] = self._clean_metadata(force or any("after" in item for item in report["workspaces"]))
+            report["finished_at"] = time.time()
+            self.last_report = report
+            return report
+        finally:
+            self._run_lock.release()
+
+    def _compact(self, stats: Dict) -> Dict:
+        workspace = stats["workspace"]
+        # Mêmes requêtes avant et après, pour des latences comparables
+        embeddings = self.rag_engine.sample_embeddings(workspace, self.latency_queries)
+        before = {"index_bytes": self.rag_engine.index_size(workspace), **self.rag_engine.search_latency(workspace, embeddings)}
+        start = time.perf_counter()
+        try:
+            self.rag_engine.compact(workspace)
+        except Exception as e:
+            self.logger.error(f"Échec de la compaction de l'espace de travail '{workspace}': {e}")
+            return {**stats, "before": before, "error": str(e)}
+        seconds = time.perf_counter() - start
+        self.registry.mark_compacted(workspace)
+        after = {"index_bytes": self.rag_engine.index_size(workspace), **self.rag_engine.search_latency(workspace, embeddings)}
+        self.logger.info(
+            f"Espace de travail '{workspace}' compacté en {seconds:.1f}s : {stats['deleted_chunks']} chunks supprimés retirés, "
+            f"index {before['index_bytes'] / 1e6:.1f} Mo -> {after['index_bytes'] / 1e6:.1f} Mo, "
+            f"p95 de la recherche {before['search_p95_ms']} ms -> {after['search_p95_ms']} ms."
+        )
+        return {**stats, "seconds": round(seconds, 3), "before": before, "after": after}
+
+    def _clean_metadata(self, vacuum: bool) -> Dict:
+        """Purge les jobs d'ingestion terminés depuis `job_retention_days` et réécrit la base SQLite si besoin."""
+        pruned_jobs = self.registry.prune_jobs(time.time() - self.job_retention_days * 86400)
+        free_ratio = self.registry.free_page_ratio()
+        result = {"pruned_jobs": pruned_jobs, "free_page_ratio": round(free_ratio, 4), "size_before": self.registry.file_size()}
+        result["vacuumed"] = bool(vacuum or pruned_jobs or free_ratio > self.tombstone_ratio)
+        if result["vacuumed"]:
+            self.registry.vacuum()
+        result["size_after"] = self.registry.file_size()
+        return result
+
+    def start_background(self):
+        """Vérifie toutes les `check_interval` secondes si un espace de travail doit être compacté."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="index-maintenance", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.check_interval):
+            self._run_logged(None, False)
+
+    def shutdown(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,299 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .document_processor import DocumentProcessor
+from .text_store import ExtractedTextStore
+from .workspaces import DEFAULT_WORKSPACE, documents_dir
+
+_worker_processor: Optional[DocumentProcessor] = None
+
+
+def _extract_in_worker(file_path: str, file_hash: str, text_store: ExtractedTextStore) -> int:
+    """Extraction exécutée dans un processus du pool (un DocumentProcessor par processus).
+
+    Les segments sont écrits au fur et à mesure dans le magasin de texte extrait : le texte ne
+    transite jamais en entier par la mémoire. Un contenu déjà extrait n'est pas relu.
+    Renvoie le nombre de caractères extraits.
+    """
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = DocumentProcessor()
+    info = text_store.info(file_hash)
+    if info is None:
+        info = text_store.save(file_hash, Path(file_path).name, _worker_processor.iter_segments(file_path))
+    return info['chars']
+
+
+class BulkIngestionManager:
+    """Ingestion en masse : extraction parallèle puis embedding et insertion par gros lots."""
+    def __init__(self, config: Dict, rag_engine, registry, on_indexed: Optional[Callable[[Dict], None]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.rag_engine = rag_engine
+        self.registry = registry
+        self.on_indexed = on_indexed
+        self.text_store = ExtractedTextStore(config)
+        self.config = config
+        ingestion_cfg = config.get('ingestion', {})
+        self.extraction_workers = ingestion_cfg.get('extraction_workers', 4)
+        self.chunk_batch_size = ingestion_cfg.get('chunk_batch_size', 2000)
+        self.supported_extensions = set(DocumentProcessor().extractors)
+        self.jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestion")
+        # Les chunks supprimés (réindexation, suppression) sont comptés pour déclencher la compaction de l'index
+        rag_engine.on_chunks_deleted = registry.record_deleted_chunks
+        # Une compaction lancée par un autre processus sait ainsi que la collection a changé pendant sa copie
+        rag_engine.on_write = registry.record_write
+
+    def list_files(self, directory: str) -> List[str]:
+        return sorted(str(p) for p in Path(directory).rglob('*') if p.is_file() and p.suffix.lower() in self.supported_extensions)
+
+    def submit(self, file_paths: List[str], workspace: str = DEFAULT_WORKSPACE) -> str:
+        """Démarre un job en arrière-plan et renvoie son identifiant."""
+        job = self._create_job(file_paths, workspace)
+        self._executor.submit(self.run, job['job_id'], file_paths, workspace)
+        return job['job_id']
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job:
+                return dict(job, errors=list(job['errors']))
+        # Job lancé par un autre worker
+        return self.registry.get_job(job_id)
+
+    def delete(self, doc_ids: List[str]) -> Dict:
+        """Supprime des documents indexés : chunks, entrée du catalogue, fichier d'origine et texte extrait.
+
+        Les chunks sont supprimés en une requête par espace de travail. Le texte extrait n'est
+        effacé que si aucun autre document n'a le même contenu.
+        """
+        documents, missing = [], []
+        for doc_id in dict.fromkeys(doc_ids):
+            document = self.registry.get(doc_id)
+            # Un document en cours d'indexation n'est pas supprimable
+            if document is None or document['status'] != 'indexed':
+                missing.append(doc_id)
+            else:
+                documents.append(document)
+        by_workspace: Dict[str, List[str]] = {}
+        for document in documents:
+            by_workspace.setdefault(document['workspace'], []).append(document['doc_id'])
+        deleted_chunks = 0
+        for workspace, workspace_doc_ids in by_workspace.items():
+            deleted_chunks += self.rag_engine.delete_documents(workspace_doc_ids, workspace)
+        self.registry.delete_many([document['doc_id'] for document in documents])
+        for document in documents:
+            (documents_dir(self.config, document['workspace']) / document['filename']).unlink(missing_ok=True)
+            self.release_text(document['file_hash'])
+        self.logger.info(f"{len(documents)} document(s) supprimé(s), {deleted_chunks} chunks retirés de l'index.")
+        return {"deleted": [document['doc_id'] for document in documents], "missing": missing, "deleted_chunks": deleted_chunks}
+
+    def release_text(self, file_hash: Optional[str]):
+        """Efface le texte extrait d'un contenu qui n'est plus celui d'aucun document."""
+        if file_hash and not self.registry.count_by_hash(file_hash):
+            self.text_store.delete(file_hash)
+
+    def ingest(self, file_paths: List[str], workspace: str = DEFAULT_WORKSPACE) -> Dict:
+        """Exécute un job de manière synchrone (utilisé par la CLI)."""
+        job = self._create_job(file_paths, workspace)
+        self.run(job['job_id'], file_paths, workspace)
+        return self.get_job(job['job_id'])
+
+    def _create_job(self, file_paths: List[str], workspace: str) -> Dict:
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "workspace": workspace,
+            "status": "pending",
+            "total_files": len(file_paths),
+            "extracted_files": 0,
+            "indexed_files": 0,
+            "failed_files": 0,
+            "skipped_files": 0,
+            "total_chunks": 0,
+            "errors": [],
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self.jobs[job['job_id']] = job
+        self.registry.save_job(job)
+        return job
+
+    def _set(self, job_id: str, **values):
+        with self._lock:
+            self.jobs[job_id].update(values)
+        self.registry.save_job(self.get_job(job_id))
+
+    def _increment(self, job_id: str, **counters):
+        with self._lock:
+            for key, value in counters.items():
+                self.jobs[job_id][key] += value
+        self.registry.save_job(self.get_job(job_id))
+
+    def _add_error(self, job_id: str, filename: Optional[str], error: str):
+        with self._lock:
+            self.jobs[job_id]['errors'].append({"file": filename, "error": error})
+        self.registry.save_job(self.get_job(job_id))
+
+    def run(self, job_id: str, file_paths: List[str], workspace: str = DEFAULT_WORKSPACE):
+        self._set(job_id, status="running", started_at=time.time())
+        pending: List[tuple] = []
+        pending_chars = 0
+        # La taille des segments en attente estime le nombre de chunks sans avoir à redécouper
+        chunk_size = self.rag_engine.config['chunk_size']
+        try:
+            with ProcessPoolExecutor(max_workers=self.extraction_workers) as pool:
+                # Les fichiers dont le contenu est déjà indexé ne sont même pas extraits
+                file_hashes = dict(zip(file_paths, pool.map(DocumentProcessor.compute_file_hash, file_paths)))
+                to_extract = [path for path in file_paths if not self.registry.get_by_hash(file_hashes[path], workspace)]
+                self._increment(job_id, skipped_files=len(file_paths) - len(to_extract))
+                futures = {pool.submit(_extract_in_worker, path, file_hashes[path], self.text_store): path for path in to_extract}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        extracted_chars = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Échec de l'extraction de {path}: {e}")
+                        self._increment(job_id, failed_files=1)
+                        self._add_error(job_id, Path(path).name, str(e))
+                        continue
+                    self._increment(job_id, extracted_files=1)
+                    document = self.registry.resolve(Path(path).name, workspace)
+                    # Deux fichiers de même nom désignent le même document : on ne les mélange pas dans un lot
+                    if any(item[2]['doc_id'] == document['doc_id'] for item in pending):
+                        self._flush(job_id, pending, workspace)
+                        pending, pending_chars = [], 0
+                    pending.append((path, file_hashes[path], document))
+                    pending_chars += extracted_chars
+                    if pending_chars >= self.chunk_batch_size * chunk_size:
+                        self._flush(job_id, pending, workspace)
+                        pending, pending_chars = [], 0
+            if pending:
+                self._flush(job_id, pending, workspace)
+            self._set(job_id, status="completed", finished_at=time.time())
+        except Exception as e:
+            self.logger.error(f"Échec du job d'ingestion {job_id}: {e}", exc_info=True)
+            self._add_error(job_id, None, str(e))
+            self._set(job_id, status="failed", finished_at=time.time())
+
+    def _flush(self, job_id: str, pending: List[tuple], workspace: str):
+        documents = [
+            (document['doc_id'], self.text_store.read(file_hash), self.registry.chunk_metadata(document, file_hash))
+            for _, file_hash, document in pending
+        ]
+        chunk_counts = self.rag_engine.add_documents(documents, workspace)
+        for path, file_hash, document in pending:
+            indexed = self.registry.mark_indexed(document['doc_id'], file_hash, Path(path).stat().st_size, chunk_counts[document['doc_id']])
+            if self.on_indexed is not None:
+                self.on_indexed(indexed)
+        self._increment(job_id, indexed_files=len(pending), total_chunks=sum(chunk_counts.values()))
+
+    def reindex(self, workspace: Optional[str] = None) -> Dict:
+        """Reconstruit les collections à partir du texte extrait conservé, sans relire les fichiers d'origine.
+
+        Sert après un changement de découpage (`chunk_size`, `chunk_overlap`) ou de modèle
+        d'embedding. Les documents sans texte conservé sont réextraits en parallèle depuis
+        `storage.documents_path` s'ils y sont encore ; un espace de travail dont un document
+        reste introuvable n'est pas reconstruit, pour ne rien perdre.
+        """
+        documents = self.registry.indexed_documents(workspace)
+        summary = {
+            "total_files": len(documents), "reextracted_files": 0, "indexed_files": 0,
+            "failed_files": 0, "total_chunks": 0, "errors": [], "started_at": time.time(),
+        }
+        by_workspace: Dict[str, List[Dict]] = {}
+        for document in documents:
+            by_workspace.setdefault(document['workspace'], []).append(document)
+        incomplete = self._restore_extracted_texts(documents, summary)
+        for name, workspace_documents in by_workspace.items():
+            if name in incomplete:
+                self.logger.error(f"Espace de travail '{name}' non reconstruit : texte introuvable pour certains documents.")
+                continue
+            try:
+                self._rebuild_workspace(name, workspace_documents, summary)
+            except Exception as e:
+                # L'ancienne collection est restée en place : les autres espaces peuvent être reconstruits
+                self.logger.error(f"Échec de la réindexation de l'espace de travail '{name}': {e}", exc_info=True)
+                summary["failed_files"] += len(workspace_documents)
+                summary["errors"].append({"file": None, "error": f"{name}: {e}"})
+        summary["finished_at"] = time.time()
+        return summary
+
+    def _restore_extracted_texts(self, documents: List[Dict], summary: Dict) -> set:
+        """Réextrait les documents sans texte conservé ; renvoie les espaces de travail incomplets."""
+        incomplete = set()
+        originals = {}
+        for document in documents:
+            if document['file_hash'] and self.text_store.has(document['file_hash']):
+                continue
+            path = documents_dir(self.config, document['workspace']) / document['filename']
+            if path.is_file():
+                originals[str(path)] = document
+            else:
+                incomplete.add(document['workspace'])
+                summary["failed_files"] += 1
+                summary["errors"].append({"file": document['filename'], "error": "Texte extrait et fichier d'origine introuvables."})
+        if not originals:
+            return incomplete
+        self.logger.info(f"{len(originals)} document(s) sans texte conservé : réextraction depuis les fichiers d'origine.")
+        with ProcessPoolExecutor(max_workers=self.extraction_workers) as pool:
+            file_hashes = dict(zip(originals, pool.map(DocumentProcessor.compute_file_hash, originals)))
+            futures = {}
+            for path, document in originals.items():
+                if document['file_hash'] and file_hashes[path] != document['file_hash']:
+                    incomplete.add(document['workspace'])
+                    summary["failed_files"] += 1
+                    summary["errors"].append({"file": document['filename'], "error": "Fichier d'origine modifié depuis son indexation."})
+                    continue
+                document['file_hash'] = file_hashes[path]
+                futures[pool.submit(_extract_in_worker, path, file_hashes[path], self.text_store)] = document
+            for future in as_completed(futures):
+                document = futures[future]
+                try:
+                    future.result()
+                    summary["reextracted_files"] += 1
+                except Exception as e:
+                    incomplete.add(document['workspace'])
+                    summary["failed_files"] += 1
+                    summary["errors"].append({"file": document['filename'], "error": str(e)})
+        return incomplete
+
+    def _rebuild_workspace(self, workspace: str, documents: List[Dict], summary: Dict):
+        self.logger.info(f"Réindexation de l'espace de travail '{workspace}' : {len(documents)} document(s).")
+        # Le texte des documents suivants est décompressé en parallèle pendant l'encodage du document courant
+        prefetch = ThreadPoolExecutor(max_workers=self.extraction_workers, thread_name_prefix="reindex")
+        futures = {}
+
+        def segments_of(index: int):
+            for ahead in range(index, min(index + self.extraction_workers, len(documents))):
+                if ahead not in futures:
+                    futures[ahead] = prefetch.submit(lambda file_hash: list(self.text_store.read(file_hash)), documents[ahead]['file_hash'])
+            yield from futures.pop(index).result()
+
+        batch = [
+            (document['doc_id'], segments_of(index),
+             self.registry.chunk_metadata(document, document['file_hash'], indexed_at=self.registry.indexed_at(document)))
+            for index, document in enumerate(documents)
+        ]
+        try:
+            with self.rag_engine.rebuilding(workspace):
+                chunk_counts = self.rag_engine.add_documents(batch, workspace)
+        finally:
+            for future in futures.values():
+                future.cancel()
+            prefetch.shutdown(wait=False)
+        for document in documents:
+            self.registry.update_index_info(document['doc_id'], document['file_hash'], chunk_counts[document['doc_id']])
+        # Collection neuve : plus aucun chunk supprimé n'y occupe de place
+        self.registry.mark_compacted(workspace)
+        summary["indexed_files"] += len(documents)
+        summary["total_chunks"] += sum(chunk_counts.values())
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
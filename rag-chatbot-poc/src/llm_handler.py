@@ -1,8 +1,32 @@
 import requests
+import httpx
+import json
 import logging
-from typing import Dict
+from typing import AsyncIterator, Dict, List, Optional
 import os
-import google.generativeai as genai
+
+from .metrics import metrics
+from .ollama_client import get_ollama_client
+
+def record_token_usage(model: str, prompt_tokens, completion_tokens):
+    """Comptabilise les tokens rapportés par le fournisseur (absents en mode simple)."""
+    metrics.inc("rag_llm_tokens_total", prompt_tokens or 0, model=model, kind="prompt")
+    metrics.inc("rag_llm_tokens_total", completion_tokens or 0, model=model, kind="completion")
+
+# Instructions fixes, envoyées en message système : Ollama réutilise leur préfixe d'une requête à l'autre
+SYSTEM_PROMPT = ("Tu es un assistant intelligent. Réponds à la question en te basant EXCLUSIVEMENT sur le contexte fourni. "
+                 "Si l'information n'est pas dans le contexte, dis-le clairement.")
+
+class ErrorResponse(str):
+    """Message d'erreur d'un gestionnaire LLM : affiché comme une réponse, mais marqué comme échec.
+
+    Le marqueur est porté par le type et non par le texte : une vraie réponse commençant par
+    « Désolé, » reste une réponse, et un flux interrompu par une erreur est reconnu même
+    après des tokens valides.
+    """
+
+def is_error_response(text: str) -> bool:
+    return isinstance(text, ErrorResponse)
 
 # --- GESTIONNAIRE SIMPLE (FALLBACK) ---
 class SimpleLLMHandler:
@@ -10,11 +34,17 @@ class SimpleLLMHandler:
         self.logger = logging.getLogger(__name__)
     def get_current_model(self) -> str:
         return "Template Simple"
-    def generate_response(self, context: str, query: str) -> str:
+    def preload(self): pass
+    def generate_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
         self.logger.info("Génération de réponse avec le SimpleLLMHandler (mode template).")
         if not context or len(context.strip()) < 10:
             return "Je n'ai pas trouvé d'informations pertinentes dans les documents."
         return f"""Basé sur les documents, voici un extrait : "{context[:800]}..." """
+    async def agenerate_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
+        return self.generate_response(context, query)
+    async def astream_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        yield self.generate_response(context, query)
+    async def aclose(self): pass
 
 # --- GESTIONNAIRE POUR GEMINI ---
 class GeminiAPIHandler:
@@ -24,27 +54,61 @@ class GeminiAPIHandler:
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("Clé API Gemini non trouvée. Définissez la variable d'environnement GEMINI_API_KEY.")
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(self.config['model'])
         self.logger.info(f"Gestionnaire Gemini initialisé avec le modèle : {self.config['model']}")
     def get_current_model(self) -> str:
         return self.config['model']
-    def generate_response(self, context: str, query: str) -> str:
-        prompt = f"""Instructions : Tu es un assistant intelligent. Réponds à la question en te basant uniquement sur le contexte fourni. Si l'information n'est pas dans le contexte, dis-le clairement.
+    def preload(self): pass
+    def _build_prompt(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
+        # Échanges précédents de la session : questions et réponses seulement, sans leur contexte
+        previous = "".join(f"{'Question' if message['role'] == 'user' else 'Réponse'} : {message['content']}\n" for message in history or [])
+        if previous:
+            previous = f"Échanges précédents :\n{previous}\n"
+        return f"""Instructions : {SYSTEM_PROMPT}
 
-Contexte :
+{previous}Contexte :
 ---
 {context}
 ---
 
 Question : "{query}"
 """
+    def _record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            record_token_usage(self.get_current_model(), usage.prompt_token_count, usage.candidates_token_count)
+    def generate_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
         try:
-            response = self.model.generate_content(prompt)
+            response = self.model.generate_content(self._build_prompt(context, query, history))
+            self._record_usage(response)
             return response.text.strip()
         except Exception as e:
             self.logger.error(f"Erreur avec l'API Gemini: {e}")
-            return "Désolé, une erreur est survenue avec l'API Gemini."
+            return ErrorResponse("Désolé, une erreur est survenue avec l'API Gemini.")
+    async def agenerate_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
+        try:
+            response = await self.model.generate_content_async(self._build_prompt(context, query, history))
+            self._record_usage(response)
+            return response.text.strip()
+        except Exception as e:
+            self.logger.error(f"Erreur avec l'API Gemini: {e}")
+            return ErrorResponse("Désolé, une erreur est survenue avec l'API Gemini.")
+    async def astream_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        try:
+            response = await self.model.generate_content_async(self._build_prompt(context, query, history), stream=True)
+            chunk = None
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+            # Le dernier morceau porte l'usage cumulé de la génération
+            if chunk is not None:
+                self._record_usage(chunk)
+        except Exception as e:
+            self.logger.error(f"Erreur avec l'API Gemini: {e}")
+            yield ErrorResponse("Désolé, une erreur est survenue avec l'API Gemini.")
+    async def aclose(self): pass
     def set_model(self, model_name: str): pass
 
 # --- GESTIONNAIRE POUR OLLAMA ---
@@ -56,34 +120,74 @@ class EnhancedOllamaLLMHandler:
         self.current_model = ollama_cfg['model']
         self.temperature = ollama_cfg['temperature']
         self.max_tokens = ollama_cfg['max_tokens']
+        # Durée pendant laquelle Ollama garde le modèle chargé après une requête ("30m", -1 : indéfiniment)
+        self.keep_alive = ollama_cfg.get('keep_alive', '30m')
+        # Connexions partagées avec le gestionnaire de modèles et les gestionnaires rechargés
+        self.client = get_ollama_client(config)
     def get_current_model(self) -> str:
         return self.current_model
     def set_model(self, model_name: str):
         self.current_model = model_name
     def is_available(self) -> bool:
+        return self.client.is_available()
+    def preload(self):
+        """Charge le modèle courant dans Ollama avant la première question (démarrage, changement de modèle)."""
+        self.client.preload(self.current_model, self.keep_alive)
+    def _build_payload(self, context: str, query: str, history: Optional[List[Dict]] = None, stream: bool = False) -> Dict:
+        # Préfixe stable (message système, puis échanges précédents sans leur contexte) : Ollama
+        # n'a à lire que le dernier message ; le contexte documentaire n'accompagne que la question posée
+        user_message = f'Contexte :\n---\n{context}\n---\n\nQuestion : "{query}"'
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, *(history or []), {"role": "user", "content": user_message}]
+        return {"model": self.current_model, "messages": messages, "stream": stream, "keep_alive": self.keep_alive,
+                "options": {"temperature": self.temperature, "num_predict": self.max_tokens}}
+    def _record(self, data: Dict):
+        record_token_usage(self.current_model, data.get("prompt_eval_count"), data.get("eval_count"))
+        self.client.record_generation(self.current_model, data)
+    def generate_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
         try:
-            requests.get(f"{self.base_url}/api/tags", timeout=3)
-            return True
-        except requests.RequestException:
-            return False
-    def generate_response(self, context: str, query: str) -> str:
-        prompt = f"""[INST] Tu es un assistant intelligent. Réponds à la question en te basant EXCLUSIVEMENT sur le contexte fourni. Si l'information n'est pas dans le contexte, dis-le clairement.
-
-Contexte :
----
-{context}
----
-
-Question : "{query}" [/INST]
-"""
-        try:
-            response = requests.post(f"{self.base_url}/api/generate", json={"model": self.current_model, "prompt": prompt, "stream": False, "options": {"temperature": self.temperature, "num_predict": self.max_tokens}}, timeout=180)
+            response = self.client.post("/api/chat", self._build_payload(context, query, history))
             response.raise_for_status()
-            return response.json().get("response", "").strip()
+            data = response.json()
+            self._record(data)
+            return data.get("message", {}).get("content", "").strip()
         except requests.exceptions.ReadTimeout:
-            return "Désolé, la génération a pris trop de temps (timeout)."
+            return ErrorResponse("Désolé, la génération a pris trop de temps (timeout).")
+        except Exception as e:
+            return ErrorResponse(f"Désolé, erreur de communication avec Ollama: {e}")
+    async def agenerate_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
+        try:
+            response = await self.client.get_async_client().post("/api/chat", json=self._build_payload(context, query, history))
+            response.raise_for_status()
+            data = response.json()
+            self._record(data)
+            return data.get("message", {}).get("content", "").strip()
+        except httpx.TimeoutException:
+            return ErrorResponse("Désolé, la génération a pris trop de temps (timeout).")
         except Exception as e:
-            return f"Désolé, erreur de communication avec Ollama: {e}"
+            return ErrorResponse(f"Désolé, erreur de communication avec Ollama: {e}")
+    async def astream_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        try:
+            payload = self._build_payload(context, query, history, stream=True)
+            async with self.client.get_async_client().stream("POST", "/api/chat", json=payload) as response:
+                response.raise_for_status()
+                # Ollama renvoie un objet JSON par ligne jusqu'au message "done"
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    content = data.get("message", {}).get("content")
+                    if content:
+                        yield content
+                    if data.get("done"):
+                        # Pas de break : la réponse est lue jusqu'au bout pour que la connexion retourne au pool
+                        self._record(data)
+        except httpx.TimeoutException:
+            yield ErrorResponse("Désolé, la génération a pris trop de temps (timeout).")
+        except Exception as e:
+            yield ErrorResponse(f"Désolé, erreur de communication avec Ollama: {e}")
+    async def aclose(self):
+        # Le pool de connexions survit au gestionnaire : il est fermé à l'arrêt du serveur
+        pass
 
 # --- LA FACTORY (L'USINE QUI CHOISIT) ---
 def get_llm_handler(config: Dict):
@@ -114,6 +218,16 @@ def get_llm_handler(config: Dict):
             logger.warning("Passage au mode de réponse simplifié.")
             return SimpleLLMHandler(config)
             
+    elif provider == 'router':
+        logger.info("Choix du fournisseur LLM : routeur multi-backends")
+        try:
+            from .llm_router import LLMRouter
+            return LLMRouter(config)
+        except Exception as e:
+            logger.error(f"Échec de l'initialisation du routeur LLM: {e}")
+            logger.warning("Passage au mode de réponse simplifié.")
+            return SimpleLLMHandler(config)
+
     else:
         logger.info("Fournisseur non reconnu. Passage au mode de réponse simplifié.")
         return SimpleLLMHandler(config)
\ No newline at end of file
@@ -0,0 +1,427 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+
+from .llm_handler import EnhancedOllamaLLMHandler, ErrorResponse, GeminiAPIHandler, SimpleLLMHandler, is_error_response
+from .metrics import metrics
+
+NO_BACKEND_RESPONSE = ErrorResponse("Désolé, aucun fournisseur LLM n'a pu répondre.")
+
+# Modèle du backend qui a produit la dernière réponse de la requête en cours
+_answered_by: ContextVar[Optional[str]] = ContextVar("llm_answered_by", default=None)
+
+
+def answering_model(default: str) -> str:
+    """Modèle qui a réellement répondu dans la requête en cours (clé du cache de réponses).
+
+    Un routeur peut répondre avec un autre backend que le préféré ; hors routeur, `default`.
+    """
+    return _answered_by.get() or default
+
+
+class BackendHealth:
+    """Latences récentes, taux d'erreur et disjoncteur d'un backend LLM.
+
+    Le disjoncteur s'ouvre après `failure_threshold` échecs consécutifs : le backend n'est
+    plus sollicité pendant `open_seconds`, puis une seule requête d'essai décide de sa
+    réouverture. Conservé d'un rechargement du routeur à l'autre (voir `get_backend_health`).
+    """
+    def __init__(self, window: int, min_samples: int, failure_threshold: int, open_seconds: float):
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.latencies = deque(maxlen=window)
+        self.first_token_latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def state(self, now: Optional[float] = None) -> str:
+        if not self.open_until:
+            return "closed"
+        return "half_open" if (now or time.monotonic()) >= self.open_until else "open"
+
+    def try_acquire(self) -> bool:
+        """Le backend peut-il recevoir une requête ? En demi-ouverture, une seule requête d'essai passe."""
+        with self._lock:
+            state = self.state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency: float, first_token: bool = False):
+        with self._lock:
+            (self.first_token_latencies if first_token else self.latencies).append(latency)
+            if first_token:
+                # La fin du flux dira si la génération a réussi
+                return
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            self.trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Enregistre un échec ; renvoie True si le disjoncteur vient de s'ouvrir."""
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            was_trial = self.trial_in_flight
+            self.trial_in_flight = False
+            if was_trial or self.consecutive_failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + self.open_seconds
+                return True
+            return False
+
+    def release(self, latency: Optional[float] = None, first_token: bool = False):
+        """Requête abandonnée (perdante d'une requête doublée, client parti) : ni succès ni échec.
+
+        Le temps déjà écoulé compte comme mesure de latence (un minorant) : sans elle, un backend
+        toujours doublé ne garderait que ses réponses rapides et paraîtrait le plus rapide.
+        """
+        with self._lock:
+            if latency is not None:
+                (self.first_token_latencies if first_token else self.latencies).append(latency)
+            self.trial_in_flight = False
+
+    def percentile(self, q: float, first_token: bool = False) -> Optional[float]:
+        samples = list(self.first_token_latencies if first_token else self.latencies)
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.percentile(samples, q))
+
+    def error_rate(self) -> float:
+        outcomes = list(self.outcomes)
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def get_stats(self) -> Dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        first_token_p50 = self.percentile(50, first_token=True)
+        return {
+            "state": self.state(),
+            "samples": len(self.latencies),
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "first_token_p50_seconds": round(first_token_p50, 3) if first_token_p50 is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+        }
+
+
+# État de santé par backend, partagé par les routeurs successifs (rechargement de config.yaml)
+_health: Dict[str, BackendHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_backend_health(name: str, router_cfg: Dict) -> BackendHealth:
+    with _health_lock:
+        health = _health.get(name)
+        if health is None:
+            health = _health[name] = BackendHealth(
+                window=router_cfg.get('window', 200),
+                min_samples=router_cfg.get('min_samples', 20),
+                failure_threshold=router_cfg.get('failure_threshold', 3),
+                open_seconds=router_cfg.get('open_seconds', 30),
+            )
+        return health
+
+
+class Backend:
+    def __init__(self, name: str, handler, health: BackendHealth, follows_active_model: bool, last_resort: bool = False):
+        self.name = name
+        self.handler = handler
+        self.health = health
+        # Modèle Ollama non fixé dans la config du routeur : suit le modèle actif du panel d'admin
+        self.follows_active_model = follows_active_model
+        # Mode simple : répond instantanément mais sans LLM, n'est essayé qu'après tous les autres
+        self.last_resort = last_resort
+
+
+def _create_backend(config: Dict, backend_cfg: Dict, router_cfg: Dict) -> Backend:
+    """Gestionnaire d'un backend : sa section du routeur complète celle de son fournisseur (llm.ollama, llm.gemini)."""
+    provider = backend_cfg.get('provider', '').lower()
+    overrides = {key: value for key, value in backend_cfg.items() if key not in ('provider', 'name')}
+    section = {**config['llm'].get(provider, {}), **overrides}
+    backend_config = {**config, 'llm': {**config['llm'], provider: section}}
+    if provider == 'ollama':
+        handler = EnhancedOllamaLLMHandler(backend_config)
+        default_name = f"ollama:{section.get('url')}"
+    elif provider == 'gemini':
+        handler = GeminiAPIHandler(backend_config)
+        default_name = f"gemini:{section.get('model')}"
+    elif provider == 'simple':
+        handler = SimpleLLMHandler(backend_config)
+        default_name = "simple"
+    else:
+        raise ValueError(f"Fournisseur inconnu dans llm.router.backends : {provider}")
+    name = backend_cfg.get('name', default_name)
+    return Backend(name, handler, get_backend_health(name, router_cfg), provider == 'ollama' and 'model' not in overrides,
+                   last_resort=provider == 'simple')
+
+
+class LLMRouter:
+    """Répartit les générations entre plusieurs backends (hôtes Ollama, Gemini, mode simple).
+
+    Les backends sont essayés du plus rapide au plus lent d'après leur latence médiane récente,
+    ceux qui n'ont pas encore assez de mesures dans l'ordre de la configuration, et le mode
+    simple toujours en dernier. Si la réponse
+    du premier dépasse le percentile `hedge_percentile` de ses latences, la même requête est
+    envoyée au suivant et la première réponse valide l'emporte (en streaming : le premier
+    token). Un backend en échec (réponse `ErrorResponse`) cède immédiatement la place au
+    suivant ; après plusieurs échecs consécutifs, son disjoncteur l'écarte un moment.
+    """
+    def __init__(self, config: Dict):
+        self.logger = logging.getLogger(__name__)
+        router_cfg = config['llm'].get('router', {})
+        self.hedge_percentile = router_cfg.get('hedge_percentile', 95)
+        self.hedge_min_delay = router_cfg.get('hedge_min_delay', 1.0)
+        self.hedge_max_delay = router_cfg.get('hedge_max_delay', 20.0)
+        self.max_hedges = router_cfg.get('max_hedges', 1)
+        self.backends: List[Backend] = []
+        for backend_cfg in router_cfg.get('backends', []):
+            try:
+                self.backends.append(_create_backend(config, backend_cfg, router_cfg))
+            except Exception as e:
+                # Un backend mal configuré (clé API absente...) n'empêche pas les autres de servir
+                self.logger.error(f"Backend LLM {backend_cfg.get('name', backend_cfg.get('provider'))} ignoré : {e}")
+        if not self.backends:
+            raise ValueError("Aucun backend utilisable dans llm.router.backends.")
+        self.logger.info(f"Routeur LLM initialisé avec {len(self.backends)} backend(s) : {', '.join(b.name for b in self.backends)}")
+
+    def get_current_model(self) -> str:
+        # Modèle du backend préféré : il détermine le budget de contexte et la recherche dans le cache
+        # de réponses ; une réponse y est rangée sous le modèle qui l'a produite (`answering_model`)
+        return self.backends[0].handler.get_current_model()
+
+    def set_model(self, model_name: str):
+        for backend in self.backends:
+            if backend.follows_active_model:
+                backend.handler.set_model(model_name)
+
+    def is_available(self) -> bool:
+        return any(backend.health.state() != "open" for backend in self.backends)
+
+    def _ranked_backends(self) -> List[Backend]:
+        def expected_latency(backend: Backend) -> float:
+            p50 = backend.health.percentile(50)
+            # Sans mesures suffisantes : après les backends mesurés, dans l'ordre de la configuration
+            return float('inf') if p50 is None else p50 * (1 + 4 * backend.health.error_rate())
+        # Le mode simple, toujours rapide, passerait sinon devant les vrais LLM dès qu'il a servi de repli
+        ranked = sorted((backend for backend in self.backends if not backend.last_resort), key=expected_latency)
+        return ranked + [backend for backend in self.backends if backend.last_resort]
+
+    def _hedge_delay(self, backend: Backend, first_token: bool = False) -> float:
+        deadline = backend.health.percentile(self.hedge_percentile, first_token)
+        if deadline is None:
+            return self.hedge_max_delay
+        return min(max(deadline, self.hedge_min_delay), self.hedge_max_delay)
+
+    def _next_backend(self, candidates: List[Backend]) -> Optional[Backend]:
+        """Retire de `candidates` le prochain backend dont le disjoncteur laisse passer une requête."""
+        while candidates:
+            backend = candidates.pop(0)
+            if backend.health.try_acquire():
+                return backend
+        return None
+
+    def _record_failure(self, backend: Backend, response: str):
+        metrics.inc("rag_llm_backend_requests_total", backend=backend.name, outcome="error")
+        self.logger.warning(f"Échec du backend LLM {backend.name} : {response[:200]}")
+        if backend.health.record_failure():
+            self.logger.warning(f"Disjoncteur ouvert pour le backend LLM {backend.name} ({backend.health.open_seconds}s).")
+
+    def _record_success(self, backend: Backend, seconds: float):
+        backend.health.record_success(seconds)
+        metrics.inc("rag_llm_backend_requests_total", backend=backend.name, outcome="success")
+        metrics.observe("rag_llm_backend_duration_seconds", seconds, backend=backend.name)
+
+    def _answered(self, backend: Backend):
+        _answered_by.set(backend.handler.get_current_model())
+
+    def _abandon(self, backend: Backend, seconds: Optional[float] = None, first_token: bool = False):
+        backend.health.release(seconds, first_token)
+        metrics.inc("rag_llm_backend_requests_total", backend=backend.name, outcome="cancelled")
+
+    def preload(self):
+        for backend in self.backends:
+            backend.handler.preload()
+
+    def generate_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
+        """Version synchrone : bascule d'un backend à l'autre en cas d'échec, sans requête doublée."""
+        candidates = self._ranked_backends()
+        response = NO_BACKEND_RESPONSE
+        while (backend := self._next_backend(candidates)) is not None:
+            start = time.perf_counter()
+            try:
+                response = backend.handler.generate_response(context, query, history)
+            except Exception as e:
+                response = ErrorResponse(f"Désolé, erreur du backend {backend.name}: {e}")
+            if not is_error_response(response):
+                self._record_success(backend, time.perf_counter() - start)
+                self._answered(backend)
+                return response
+            self._record_failure(backend, response)
+        return response
+
+    async def _generate_on(self, backend: Backend, context: str, query: str, history: Optional[List[Dict]]) -> str:
+        start = time.perf_counter()
+        try:
+            response = await backend.handler.agenerate_response(context, query, history)
+        except asyncio.CancelledError:
+            self._abandon(backend, time.perf_counter() - start)
+            raise
+        except Exception as e:
+            response = ErrorResponse(f"Désolé, erreur du backend {backend.name}: {e}")
+        if is_error_response(response):
+            self._record_failure(backend, response)
+        else:
+            self._record_success(backend, time.perf_counter() - start)
+        return response
+
+    async def agenerate_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> str:
+        loop = asyncio.get_running_loop()
+        candidates = self._ranked_backends()
+        running: Dict[asyncio.Task, Backend] = {}
+        response = NO_BACKEND_RESPONSE
+        hedges = 0
+        deadline = None
+
+        def launch() -> bool:
+            nonlocal deadline
+            backend = self._next_backend(candidates)
+            if backend is None:
+                return False
+            running[asyncio.create_task(self._generate_on(backend, context, query, history))] = backend
+            deadline = loop.time() + self._hedge_delay(backend)
+            return True
+
+        launch()
+        try:
+            while running:
+                can_hedge = hedges < self.max_hedges and candidates
+                timeout = max(0.0, deadline - loop.time()) if can_hedge else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Délai de couverture dépassé : la même requête part vers le backend suivant
+                    slow = next(reversed(running.values()))
+                    if launch():
+                        hedges += 1
+                        metrics.inc("rag_llm_hedged_requests_total", backend=slow.name)
+                        self.logger.info(f"Requête doublée : {slow.name} n'a pas répondu dans son délai de couverture.")
+                    continue
+                for task in done:
+                    backend = running.pop(task)
+                    if not is_error_response(task.result()):
+                        self._answered(backend)
+                        return task.result()
+                    response = task.result()
+                if not running:
+                    # Bascule : plus aucune requête en cours, on passe au backend suivant
+                    launch()
+            return response
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def astream_response(self, context: str, query: str, history: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        """Flux du premier backend à produire un token valide ; les autres flux sont abandonnés."""
+        loop = asyncio.get_running_loop()
+        candidates = self._ranked_backends()
+        # Tâche attendant le premier token d'un flux -> (backend, flux, début)
+        pending: Dict[asyncio.Task, tuple] = {}
+        response = NO_BACKEND_RESPONSE
+        hedges = 0
+        deadline = None
+
+        def launch() -> bool:
+            nonlocal deadline
+            backend = self._next_backend(candidates)
+            if backend is None:
+                return False
+            stream = backend.handler.astream_response(context, query, history)
+            pending[asyncio.create_task(stream.__anext__())] = (backend, stream, time.perf_counter())
+            deadline = loop.time() + self._hedge_delay(backend, first_token=True)
+            return True
+
+        winner = None
+        launch()
+        try:
+            while pending and winner is None:
+                can_hedge = hedges < self.max_hedges and candidates
+                timeout = max(0.0, deadline - loop.time()) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    slow = next(reversed(pending.values()))[0]
+                    if launch():
+                        hedges += 1
+                        metrics.inc("rag_llm_hedged_requests_total", backend=slow.name)
+                        self.logger.info(f"Flux doublé : pas de premier token de {slow.name} dans son délai de couverture.")
+                    continue
+                for task in done:
+                    backend, stream, start = pending.pop(task)
+                    try:
+                        token = task.result()
+                    except StopAsyncIteration:
+                        token = ErrorResponse(f"Désolé, réponse vide du backend {backend.name}.")
+                    except Exception as e:
+                        token = ErrorResponse(f"Désolé, erreur du backend {backend.name}: {e}")
+                    if winner is None and not is_error_response(token):
+                        winner = (backend, stream, start, token)
+                        continue
+                    await stream.aclose()
+                    if is_error_response(token):
+                        response = token
+                        self._record_failure(backend, token)
+                    else:
+                        self._abandon(backend, time.perf_counter() - start, first_token=True)
+                if winner is None and not pending:
+                    launch()
+        finally:
+            for task, (backend, stream, start) in pending.items():
+                task.cancel()
+                with contextlib.suppress(BaseException):
+                    await task
+                await stream.aclose()
+                self._abandon(backend, time.perf_counter() - start, first_token=True)
+
+        if winner is None:
+            yield response
+            return
+        backend, stream, start, token = winner
+        backend.health.record_success(time.perf_counter() - start, first_token=True)
+        self._answered(backend)
+        tokens = [token]
+        try:
+            yield token
+            async for token in stream:
+                tokens.append(token)
+                yield token
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client parti pendant le flux : ni succès ni échec pour le backend
+            self._abandon(backend, time.perf_counter() - start)
+            raise
+        finally:
+            await stream.aclose()
+        if any(is_error_response(token) for token in tokens):
+            # Erreur survenue en cours de flux, après des tokens déjà envoyés : pas de bascule possible
+            self._record_failure(backend, tokens[-1])
+        else:
+            self._record_success(backend, time.perf_counter() - start)
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.handler.aclose()
+
+    def get_stats(self) -> List[Dict]:
+        return [{"name": backend.name, "model": backend.handler.get_current_model(), **backend.health.get_stats()}
+                for backend in self.backends]
@@ -0,0 +1,213 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Bornes des histogrammes de durée (secondes), de l'embedding d'une requête à une génération complète
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "rag_stage_duration_seconds": ("histogram", "Durée de chaque étape du pipeline RAG (extraction, split, encode, search, generate...)."),
+    "rag_http_request_duration_seconds": ("histogram", "Durée des requêtes HTTP par route."),
+    "rag_chat_answers_total": ("counter", "Réponses de /api/chat et /api/chat/stream, servies ou non par le cache."),
+    "rag_llm_tokens_total": ("counter", "Tokens consommés (prompt) et générés (completion) tels que rapportés par le LLM."),
+    "rag_llm_first_token_seconds": ("histogram", "Délai avant le premier token selon Ollama (chargement du modèle + lecture du prompt), à froid ou à chaud."),
+    "rag_llm_backend_duration_seconds": ("histogram", "Durée des générations réussies par backend du routeur LLM."),
+    "rag_llm_backend_requests_total": ("counter", "Appels aux backends du routeur LLM par issue (success, error, cancelled)."),
+    "rag_llm_hedged_requests_total": ("counter", "Requêtes doublées vers un autre backend après dépassement du délai de couverture."),
+}
+
+# Durées par étape de la requête HTTP en cours, pour l'en-tête Server-Timing
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Métriques du processus exposées au format Prometheus sur /metrics.
+
+    Chaque étape instrumentée avec `stage()` alimente un histogramme, la durée cumulée de
+    la requête HTTP en cours (en-tête Server-Timing) et, si OpenTelemetry est activé, un span.
+    Les valeurs instantanées (files d'attente, caches) sont lues au moment de l'export par
+    les collecteurs enregistrés avec `register_collector`.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+        self._tracer = None
+
+    def configure(self, config: Dict):
+        metrics_cfg = config.get('metrics', {})
+        self.enabled = metrics_cfg.get('enabled', True)
+        otel_cfg = metrics_cfg.get('opentelemetry', {})
+        if otel_cfg.get('enabled', False):
+            self._tracer = self._create_tracer(otel_cfg)
+
+    def _create_tracer(self, otel_cfg: Dict):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            self.logger.warning("OpenTelemetry n'est pas installé, les traces sont désactivées.")
+            return None
+        endpoint = otel_cfg.get('otlp_endpoint')
+        if endpoint:
+            try:
+                from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                provider = TracerProvider(resource=Resource.create({"service.name": otel_cfg.get('service_name', 'rag-chatbot')}))
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint, insecure=True)))
+                trace.set_tracer_provider(provider)
+                self.logger.info(f"Export des traces OpenTelemetry vers {endpoint}")
+            except ImportError:
+                self.logger.warning("SDK ou exporteur OTLP OpenTelemetry absent, les traces ne seront pas exportées.")
+        return trace.get_tracer("rag-chatbot")
+
+    def instrument_app(self, app):
+        """Ajoute les spans HTTP d'OpenTelemetry à l'application FastAPI, si les traces sont activées."""
+        if self._tracer is None:
+            return
+        try:
+            from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        except ImportError:
+            self.logger.warning("opentelemetry-instrumentation-fastapi absent, seules les étapes internes sont tracées.")
+            return
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics,static")
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled or not value:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_stage(self, stage: str, seconds: float):
+        self.observe("rag_stage_duration_seconds", seconds, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Chronomètre une étape du pipeline."""
+        span = self._tracer.start_as_current_span(stage) if self._tracer is not None else nullcontext()
+        start = time.perf_counter()
+        with span:
+            try:
+                yield
+            finally:
+                self.record_stage(stage, time.perf_counter() - start)
+
+    def timed_iter(self, stage: str, iterable: Iterable) -> Iterator:
+        """Itère en attribuant à `stage` le temps passé à produire chaque élément (extraction paresseuse)."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.record_stage(stage, time.perf_counter() - start)
+            yield item
+
+    def register_collector(self, collector: Callable[[], Dict[str, float]]):
+        """Ajoute une source de jauges lue à chaque export (ex. `get_stats` d'un composant)."""
+        self._collectors.append(collector)
+
+    def start_request(self) -> Dict[str, float]:
+        timings: Dict[str, float] = {}
+        _request_timings.set(timings)
+        return timings
+
+    @staticmethod
+    def server_timing_header(timings: Dict[str, float]) -> str:
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+    def render(self) -> str:
+        """Export au format texte Prometheus."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            counters = sorted(self._counters.items(), key=lambda item: item[0])
+            described = set()
+            for (name, labels), histogram in histograms:
+                self._describe(lines, described, name, "histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+            for (name, labels), value in counters:
+                self._describe(lines, described, name, "counter")
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for collector in self._collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                self.logger.error(f"Erreur lors de la collecte des métriques : {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"rag_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _describe(lines: List[str], described: set, name: str, default_type: str):
+        if name in described:
+            return
+        described.add(name)
+        metric_type, help_text = METRIC_HELP.get(name, (default_type, name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+
+# Registre unique du processus, partagé par le moteur RAG, les gestionnaires LLM et l'application web
+metrics = MetricsRegistry()
@@ -1,8 +1,9 @@
-import requests
 import logging
 from typing import Dict, List
 from pathlib import Path
 import yaml
+from run import CONFIG_PATH
+from .ollama_client import get_ollama_client
 
 class OllamaModelManager:
     """Gestionnaire pour les modèles Ollama."""
@@ -10,33 +11,24 @@ class OllamaModelManager:
         self.config = config
         self.base_url = config.get('llm', {}).get('ollama', {}).get('url')
         self.logger = logging.getLogger(__name__)
+        # L'état d'Ollama est lu en mémoire, rafraîchi en arrière-plan par le client partagé
+        self.client = get_ollama_client(config)
 
     def is_ollama_available(self) -> bool:
         if not self.base_url:
             return False
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=3)
-            return response.status_code == 200
-        except requests.RequestException:
-            return False
+        return self.client.is_available()
 
     def get_installed_models(self) -> List[Dict]:
-        if not self.is_ollama_available():
-            return []
-        try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            response.raise_for_status()
-            data = response.json()
-            return [{'name': m['name'].split(':')[0], 'full_name': m['name']} for m in data.get('models', [])]
-        except Exception as e:
-            self.logger.error(f"Erreur de récupération des modèles installés: {e}")
+        if not self.base_url:
             return []
+        return [{'name': m['name'].split(':')[0], 'full_name': m['name'], 'size': m.get('size')} for m in self.client.installed_models()]
 
     def get_available_models(self) -> List[Dict]:
         if not self.is_ollama_available():
             return []
-        # Utilise .get() pour un accès sûr
-        available_models = self.config.get('llm', {}).get('available_models', []).copy()
+        # Utilise .get() pour un accès sûr ; copie des entrées pour ne pas modifier la configuration
+        available_models = [dict(model) for model in self.config.get('llm', {}).get('available_models', [])]
         installed_names = [model['name'] for model in self.get_installed_models()]
         for model in available_models:
             model['installed'] = model['name'] in installed_names
@@ -45,7 +37,7 @@ class OllamaModelManager:
     def set_active_model(self, model_name: str) -> bool:
         try:
             # Cette fonction modifie directement le fichier config.yaml
-            config_path = Path('config/config.yaml')
+            config_path = Path(CONFIG_PATH)
             with open(config_path, 'r', encoding='utf-8') as f:
                 config_data = yaml.safe_load(f)
             
@@ -0,0 +1,117 @@
+import logging
+import multiprocessing
+import os
+import secrets
+import shutil
+import subprocess
+import time
+from multiprocessing.connection import Client
+from typing import Dict, Optional, Tuple
+
+from .embedding_service import SERVICE_ADDRESS_ENV, SERVICE_AUTHKEY_ENV, serve_embeddings
+
+# Positionnée par le lanceur : les workers utilisent alors le serveur ChromaDB partagé
+CHROMA_SERVER_ENV = "RAG_CHROMA_SERVER"
+
+
+def get_chroma_server() -> Optional[Tuple[str, int]]:
+    address = os.environ.get(CHROMA_SERVER_ENV)
+    if not address:
+        return None
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def _run_embedding_service(config: Dict, address: Tuple[str, int], authkey: bytes):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    serve_embeddings(config, address, authkey)
+
+
+class SharedServices:
+    """Services partagés par tous les workers d'une machine : modèle d'embedding et ChromaDB.
+
+    Chaque worker uvicorn est un processus distinct ; sans ces services, chacun chargerait
+    son propre SentenceTransformer et garderait en mémoire une copie figée de l'index HNSW.
+    """
+    def __init__(self, config: Dict):
+        self.logger = logging.getLogger(__name__)
+        self.config = config
+        self.embedding_process = None
+        self.chroma_process = None
+
+    def start(self):
+        self._start_embedding_service()
+        # Le stockage NumPy est partagé par les fichiers mappés en mémoire, sans serveur
+        if self.config['database']['vector_db'].get('type', 'chromadb') == 'chromadb':
+            self._start_chroma_server()
+
+    def _start_embedding_service(self):
+        service_cfg = self.config['embedding'].get('service', {})
+        address = (service_cfg.get('host', '127.0.0.1'), service_cfg.get('port', 8765))
+        authkey = secrets.token_bytes(32)
+        context = multiprocessing.get_context("spawn")
+        self.embedding_process = context.Process(target=_run_embedding_service, args=(self.config, address, authkey), daemon=True)
+        self.embedding_process.start()
+
+        deadline = time.time() + service_cfg.get('startup_timeout', 120)
+        while True:
+            try:
+                Client(address, authkey=authkey).close()
+                break
+            except OSError:
+                if time.time() > deadline or not self.embedding_process.is_alive():
+                    raise RuntimeError("Le service d'embedding n'a pas démarré.")
+                time.sleep(0.5)
+        os.environ[SERVICE_ADDRESS_ENV] = f"{address[0]}:{address[1]}"
+        os.environ[SERVICE_AUTHKEY_ENV] = authkey.hex()
+        self.logger.info(f"Service d'embedding partagé prêt sur {address[0]}:{address[1]}")
+
+    def _start_chroma_server(self):
+        db_config = self.config['database']['vector_db']
+        server_cfg = db_config.get('server', {})
+        host, port = server_cfg.get('host', '127.0.0.1'), server_cfg.get('port', 8001)
+        if server_cfg.get('start', True):
+            chroma_bin = shutil.which("chroma")
+            if chroma_bin is None:
+                raise RuntimeError("Commande 'chroma' introuvable : impossible de démarrer le serveur ChromaDB partagé.")
+            self.chroma_process = subprocess.Popen(
+                [chroma_bin, "run", "--path", db_config['path'], "--host", host, "--port", str(port)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+
+        import chromadb
+        deadline = time.time() + server_cfg.get('startup_timeout', 60)
+        while True:
+            try:
+                chromadb.HttpClient(host=host, port=port).heartbeat()
+                break
+            except Exception:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Le serveur ChromaDB ne répond pas sur {host}:{port}.")
+                time.sleep(0.5)
+        os.environ[CHROMA_SERVER_ENV] = f"{host}:{port}"
+        self.logger.info(f"Serveur ChromaDB partagé prêt sur {host}:{port}")
+
+    def stop(self):
+        if self.embedding_process is not None and self.embedding_process.is_alive():
+            self.embedding_process.terminate()
+        if self.chroma_process is not None:
+            self.chroma_process.terminate()
+            self.chroma_process.wait(timeout=10)
+
+
+def run_multi_worker(config: Dict):
+    """Démarre les services partagés puis uvicorn avec `app.workers` processus."""
+    import uvicorn
+
+    services = SharedServices(config)
+    services.start()
+    try:
+        uvicorn.run(
+            "src.web_app:app",
+            host=config['app']['host'],
+            port=config['app']['port'],
+            workers=config['app']['workers']
+        )
+    finally:
+        services.stop()
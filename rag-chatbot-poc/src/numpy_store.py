@@ -0,0 +1,643 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from filelock import FileLock
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+CURRENT_FILE = "CURRENT"
+
+_OPERATORS = {
+    "$eq": lambda value, expected: value == expected,
+    "$ne": lambda value, expected: value != expected,
+    "$in": lambda value, expected: value in expected,
+    "$nin": lambda value, expected: value not in expected,
+    "$gt": lambda value, expected: value is not None and value > expected,
+    "$gte": lambda value, expected: value is not None and value >= expected,
+    "$lt": lambda value, expected: value is not None and value < expected,
+    "$lte": lambda value, expected: value is not None and value <= expected,
+}
+
+
+def matches_where(metadata: Dict, where: Dict) -> bool:
+    """Évalue un filtre `where` au format ChromaDB sur les métadonnées d'un chunk."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, expected in condition.items():
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Opérateur de filtre non supporté : {operator}")
+                if not _OPERATORS[operator](metadata.get(key), expected):
+                    return False
+    return True
+
+
+def _doc_ids_in(where: Dict) -> Optional[set]:
+    """Documents auxquels un filtre se restreint forcément, pour ne parcourir que leurs chunks."""
+    condition = where.get("doc_id")
+    if condition is not None:
+        if not isinstance(condition, dict):
+            return {condition}
+        if "$eq" in condition:
+            return {condition["$eq"]}
+        if "$in" in condition:
+            return set(condition["$in"])
+    for clause in where.get("$and", []):
+        doc_ids = _doc_ids_in(clause)
+        if doc_ids is not None:
+            return doc_ids
+    return None
+
+
+class NumpyCollection:
+    """Collection de chunks dans des fichiers mappés en mémoire, interrogée avec NumPy.
+
+    Les vecteurs (float32, float16, ou int8 quantifiés vecteur par vecteur), leurs normes, les
+    textes et un journal des opérations (ajouts, métadonnées, suppressions) sont écrits en ajout
+    seul dans une génération de fichiers. Chaque processus mappe les mêmes fichiers et ne rejoue
+    que la fin du journal : les pages de vecteurs sont partagées par le cache du système.
+    Une nouvelle génération est réécrite quand trop de chunks ont été supprimés, ou pour
+    (re)partitionner la collection (IVF) quand elle dépasse `exact_search_limit` chunks ;
+    le fichier CURRENT désigne la génération active.
+
+    La recherche est exacte et vectorisée en dessous de `exact_search_limit` chunks ; au-delà,
+    seules les `nprobe` partitions les plus proches de la requête sont parcourues.
+    Expose le sous-ensemble de l'API des collections ChromaDB utilisé par RAGEngine.
+    """
+    VERSION = 1
+    # Lignes traitées par bloc lors d'un parcours complet (bornent la mémoire temporaire)
+    BLOCK_ROWS = 65536
+    FILTER_CACHE_SIZE = 64
+
+    def __init__(self, client: "NumpyVectorClient", name: str, options: Dict):
+        self.logger = logging.getLogger(__name__)
+        self.client = client
+        self.name = name
+        self.dtype = options.get('dtype', 'float32')
+        if self.dtype not in DTYPES:
+            raise ValueError(f"Type de vecteurs non supporté : {self.dtype} ({', '.join(DTYPES)})")
+        self.exact_search_limit = options.get('exact_search_limit', 200000)
+        self.nprobe = options.get('nprobe', 32)
+        self.compaction_ratio = options.get('compaction_ratio', 0.3)
+        self._lock = threading.RLock()
+        self._bind(client.root)
+        self._reset()
+
+    def _bind(self, root: Path):
+        self.directory = root / self.name
+        self._file_lock = FileLock(str(root / f"{self.name}.lock"))
+
+    def _reset(self):
+        self._generation: Optional[str] = None
+        self._storage_dtype = self.dtype
+        self._journal_pos = 0
+        self._dim: Optional[int] = None
+        self._ids: List[str] = []
+        self._slots: Dict[str, int] = {}
+        self._metadatas: List[Optional[Dict]] = []
+        self._text_offsets = array('q')
+        self._text_lengths = array('q')
+        self._text_end = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._doc_slots: Dict[str, set] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._ivf_rows = 0
+        self._vectors = self._norms = self._scales = self._lists = None
+        self._mapped_rows = 0
+        self._filter_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    # --- État partagé entre processus ---
+
+    def _gen_dir(self) -> Path:
+        return self.directory / self._generation
+
+    def _refresh(self):
+        """Rattrape les écritures des autres processus : nouvelle génération ou fin du journal."""
+        try:
+            generation = (self.directory / CURRENT_FILE).read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            generation = None
+        if generation != self._generation:
+            # Lu avant de quitter l'état courant : une génération déjà supprimée n'en laisse pas un à moitié chargé
+            meta = json.loads((self.directory / generation / "meta.json").read_text(encoding='utf-8')) if generation else None
+            self._reset()
+            self._generation = generation
+            if generation is None:
+                return
+            if meta.get('version') != self.VERSION:
+                raise ValueError(f"Collection {self.name} dans un format non supporté (version {meta.get('version')}).")
+            self._storage_dtype = meta['dtype']
+            if meta.get('ivf_rows'):
+                self._centroids = np.load(self._gen_dir() / "centroids.npy")
+                self._ivf_rows = meta['ivf_rows']
+        if self._generation is None:
+            return
+        journal_path = self._gen_dir() / "journal.jsonl"
+        size = journal_path.stat().st_size if journal_path.exists() else 0
+        if size > self._journal_pos:
+            with open(journal_path, 'rb') as f:
+                f.seek(self._journal_pos)
+                data = f.read(size - self._journal_pos)
+            # Une ligne en cours d'écriture par un autre processus sera lue au prochain passage
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                self._apply(json.loads(line))
+            self._journal_pos += end
+            self._filter_cache.clear()
+        self._map()
+
+    def _apply(self, op: Dict):
+        if op['op'] == 'add':
+            self._dim = op['dim']
+            start = len(self._ids)
+            if len(self._alive) < start + len(op['rows']):
+                alive = np.zeros(max(1024, 2 * (start + len(op['rows']))), dtype=bool)
+                alive[:start] = self._alive[:start]
+                self._alive = alive
+            for chunk_id, metadata, length in op['rows']:
+                if chunk_id in self._slots:
+                    self._kill(self._slots[chunk_id])
+                slot = len(self._ids)
+                self._ids.append(chunk_id)
+                self._slots[chunk_id] = slot
+                self._metadatas.append(metadata)
+                self._text_offsets.append(self._text_end)
+                self._text_lengths.append(length)
+                self._text_end += length
+                self._alive[slot] = True
+                self._doc_slots.setdefault(metadata.get('doc_id'), set()).add(slot)
+        elif op['op'] == 'update':
+            for chunk_id, metadata in zip(op['ids'], op['metadatas']):
+                slot = self._slots.get(chunk_id)
+                if slot is None:
+                    continue
+                self._doc_slots.get(self._metadatas[slot].get('doc_id'), set()).discard(slot)
+                self._metadatas[slot] = metadata
+                self._doc_slots.setdefault(metadata.get('doc_id'), set()).add(slot)
+        elif op['op'] == 'delete':
+            for chunk_id in op['ids']:
+                if chunk_id in self._slots:
+                    self._kill(self._slots[chunk_id])
+
+    def _kill(self, slot: int):
+        del self._slots[self._ids[slot]]
+        self._alive[slot] = False
+        doc_slots = self._doc_slots.get(self._metadatas[slot].get('doc_id'))
+        if doc_slots is not None:
+            doc_slots.discard(slot)
+            if not doc_slots:
+                del self._doc_slots[self._metadatas[slot].get('doc_id')]
+        self._metadatas[slot] = {}
+
+    def _map(self):
+        rows = len(self._ids)
+        if rows == self._mapped_rows or rows == 0:
+            return
+        # Lecture seule : les pages sont partagées entre processus par le cache du système
+        gen_dir = self._gen_dir()
+        self._vectors = np.memmap(gen_dir / "vectors.bin", dtype=DTYPES[self._storage_dtype], mode='r', shape=(rows, self._dim))
+        self._norms = np.memmap(gen_dir / "norms.bin", dtype=np.float32, mode='r', shape=(rows,))
+        if self._storage_dtype == 'int8':
+            self._scales = np.memmap(gen_dir / "scales.bin", dtype=np.float32, mode='r', shape=(rows,))
+        if self._centroids is not None:
+            self._lists = np.memmap(gen_dir / "lists.bin", dtype=np.int32, mode='r', shape=(rows,))
+        self._mapped_rows = rows
+
+    # --- Écritures ---
+
+    @contextmanager
+    def _write(self):
+        with self._lock, self._file_lock:
+            self._refresh()
+            if self._generation is None:
+                generation = self._next_generation()
+                self._start_generation(generation, self.dtype, None, 0)
+                self._activate(generation)
+            self._truncate_tails()
+            yield
+            self._refresh()
+            self._maybe_rewrite()
+
+    @staticmethod
+    def _next_generation_name(current: Optional[str]) -> str:
+        return f"gen_{int(current.split('_')[1]) + 1 if current else 1:06d}"
+
+    def _next_generation(self) -> str:
+        return self._next_generation_name(self._generation)
+
+    def _start_generation(self, generation: str, dtype: str, centroids: Optional[np.ndarray], ivf_rows: int):
+        gen_dir = self.directory / generation
+        gen_dir.mkdir(parents=True, exist_ok=True)
+        if centroids is not None:
+            np.save(gen_dir / "centroids.npy", centroids)
+        meta = {"version": self.VERSION, "dtype": dtype, "ivf_rows": ivf_rows}
+        (gen_dir / "meta.json").write_text(json.dumps(meta), encoding='utf-8')
+        for filename in ("vectors.bin", "norms.bin", "scales.bin", "lists.bin", "texts.bin", "journal.jsonl"):
+            (gen_dir / filename).touch()
+        return gen_dir
+
+    def _activate(self, generation: str):
+        tmp_path = self.directory / f"{CURRENT_FILE}.tmp"
+        tmp_path.write_text(generation, encoding='utf-8')
+        os.replace(tmp_path, self.directory / CURRENT_FILE)
+        # La génération remplacée reste lisible par les processus et les recherches qui ne l'ont pas
+        # encore quittée : elle n'est supprimée qu'à la réécriture suivante, avec les plus anciennes
+        # (une génération encore mappée ailleurs, sous Windows, sera supprimée plus tard)
+        for path in self.directory.glob("gen_*"):
+            if path.name not in (generation, self._generation):
+                shutil.rmtree(path, ignore_errors=True)
+        self._refresh()
+
+    def _truncate_tails(self):
+        """Coupe les données écrites par une écriture interrompue avant sa ligne de journal."""
+        rows = len(self._ids)
+        itemsize = np.dtype(DTYPES[self._storage_dtype]).itemsize
+        expected = {
+            "vectors.bin": rows * (self._dim or 0) * itemsize,
+            "norms.bin": rows * 4,
+            "scales.bin": rows * 4 if self._storage_dtype == 'int8' else 0,
+            "lists.bin": rows * 4 if self._centroids is not None else 0,
+            "texts.bin": self._text_end,
+        }
+        for filename, size in expected.items():
+            path = self._gen_dir() / filename
+            if path.stat().st_size > size:
+                os.truncate(path, size)
+
+    def _append(self, filename: str, data: bytes):
+        with open(self._gen_dir() / filename, 'ab') as f:
+            f.write(data)
+
+    def _append_journal(self, op: Dict):
+        self._append("journal.jsonl", (json.dumps(op, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8'))
+
+    def _encode(self, vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if dtype == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(DTYPES[dtype]), None
+
+    def _decode(self, rows, vectors: Optional[np.ndarray] = None, scales: Optional[np.ndarray] = None) -> np.ndarray:
+        if vectors is None:
+            vectors, scales = self._vectors, self._scales
+        decoded = np.asarray(vectors[rows], dtype=np.float32)
+        if scales is not None:
+            decoded = decoded * scales[rows][:, None]
+        return decoded
+
+    def add(self, ids: Sequence[str], embeddings, documents: Optional[Sequence[str]] = None, metadatas: Optional[Sequence[Dict]] = None):
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        documents = documents if documents is not None else [""] * len(ids)
+        metadatas = metadatas if metadatas is not None else [{}] * len(ids)
+        texts = [document.encode('utf-8') for document in documents]
+        with self._write():
+            if self._dim is not None and vectors.shape[1] != self._dim:
+                raise ValueError(f"Dimension des embeddings ({vectors.shape[1]}) différente de celle de la collection ({self._dim}).")
+            encoded, scales = self._encode(vectors, self._storage_dtype)
+            self._append("vectors.bin", encoded.tobytes())
+            self._append("norms.bin", np.einsum('ij,ij->i', vectors, vectors).astype(np.float32).tobytes())
+            if scales is not None:
+                self._append("scales.bin", scales.tobytes())
+            if self._centroids is not None:
+                self._append("lists.bin", self._assign(vectors, self._centroids).tobytes())
+            self._append("texts.bin", b"".join(texts))
+            # La ligne de journal valide l'ajout : elle est écrite en dernier
+            self._append_journal({
+                "op": "add", "dim": vectors.shape[1],
+                "rows": [[chunk_id, metadata, len(text)] for chunk_id, metadata, text in zip(ids, metadatas, texts)],
+            })
+
+    def update(self, ids: Sequence[str], metadatas: Sequence[Dict]):
+        with self._write():
+            self._append_journal({"op": "update", "ids": list(ids), "metadatas": list(metadatas)})
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None):
+        with self._write():
+            if ids is not None:
+                targets = [chunk_id for chunk_id in ids if chunk_id in self._slots]
+                if where:
+                    targets = [chunk_id for chunk_id in targets if matches_where(self._metadatas[self._slots[chunk_id]], where)]
+            elif where:
+                targets = [self._ids[slot] for slot in self._filtered_slots(where)]
+            else:
+                targets = []
+            if targets:
+                self._append_journal({"op": "delete", "ids": targets})
+
+    def _maybe_rewrite(self):
+        total, alive = len(self._ids), len(self._slots)
+        partition = alive > self.exact_search_limit and (self._centroids is None or alive > 2 * self._ivf_rows)
+        if partition or (total and 1 - alive / total > self.compaction_ratio):
+            self._rewrite(partition or self._centroids is not None)
+
+    def _rewrite(self, partition: bool):
+        """Réécrit les chunks vivants dans une nouvelle génération (compaction, partitionnement IVF)."""
+        slots = np.flatnonzero(self._alive[:len(self._ids)])
+        centroids = self._train_partitions(slots) if partition and len(slots) else None
+        generation = self._next_generation()
+        self.logger.info(f"Collection {self.name} : réécriture de {len(slots)} chunks ({generation}{', partitionnement IVF' if centroids is not None else ''}).")
+        self._start_generation(generation, self._storage_dtype, centroids, len(slots) if centroids is not None else 0)
+        old_dir, old_generation = self._gen_dir(), self._generation
+        self._generation = generation
+        try:
+            with open(old_dir / "texts.bin", 'rb') as texts:
+                for start in range(0, len(slots), self.BLOCK_ROWS):
+                    block = slots[start:start + self.BLOCK_ROWS]
+                    self._append("vectors.bin", np.ascontiguousarray(self._vectors[block]).tobytes())
+                    self._append("norms.bin", np.ascontiguousarray(self._norms[block]).tobytes())
+                    if self._storage_dtype == 'int8':
+                        self._append("scales.bin", np.ascontiguousarray(self._scales[block]).tobytes())
+                    if centroids is not None:
+                        self._append("lists.bin", self._assign(self._decode(block), centroids).tobytes())
+                    rows, block_texts = [], []
+                    for slot in block:
+                        texts.seek(self._text_offsets[slot])
+                        block_texts.append(texts.read(self._text_lengths[slot]))
+                        rows.append([self._ids[slot], self._metadatas[slot], self._text_lengths[slot]])
+                    self._append("texts.bin", b"".join(block_texts))
+                    self._append_journal({"op": "add", "dim": self._dim, "rows": rows})
+        except BaseException:
+            self._generation = old_generation
+            shutil.rmtree(self.directory / generation, ignore_errors=True)
+            raise
+        self._generation = old_generation
+        self._activate(generation)
+
+    def compact(self):
+        """Réécrit la génération courante sans ses chunks supprimés, quel que soit `compaction_ratio`."""
+        with self._write():
+            if len(self._ids) > len(self._slots):
+                self._rewrite(self._centroids is not None)
+
+    def tombstones(self) -> int:
+        """Chunks supprimés encore présents dans les fichiers de la génération courante."""
+        with self._lock:
+            self._refresh()
+            return len(self._ids) - len(self._slots)
+
+    def _train_partitions(self, slots: np.ndarray, iterations: int = 10) -> np.ndarray:
+        """K-means sur un échantillon des vecteurs : environ racine(n) partitions."""
+        rng = np.random.default_rng(0)
+        nlist = max(16, int(np.sqrt(len(slots))))
+        sample = np.sort(rng.choice(slots, size=min(len(slots), nlist * 64), replace=False))
+        vectors = self._decode(sample)
+        centroids = vectors[rng.choice(len(vectors), size=min(nlist, len(vectors)), replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._assign(vectors, centroids)
+            order = np.argsort(assignments, kind='stable')
+            counts = np.bincount(assignments, minlength=len(centroids))
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            filled = counts > 0
+            sums = np.add.reduceat(vectors[order], starts[filled], axis=0)
+            # Une partition vide garde son centre précédent
+            centroids[filled] = sums / counts[filled][:, None]
+        return centroids.astype(np.float32)
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 8192) -> np.ndarray:
+        """Partition la plus proche (distance L2) de chaque vecteur."""
+        half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_rows):
+            scores = vectors[start:start + block_rows] @ centroids.T - half_norms
+            assignments[start:start + block_rows] = np.argmax(scores, axis=1)
+        return assignments
+
+    # --- Lectures ---
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._slots)
+
+    def _filtered_slots(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Slots vivants satisfaisant le filtre (None sans filtre), mis en cache jusqu'à la prochaine écriture."""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        slots = self._filter_cache.get(key)
+        if slots is not None:
+            self._filter_cache.move_to_end(key)
+            return slots
+        doc_ids = _doc_ids_in(where)
+        if doc_ids is not None:
+            candidates = sorted(set().union(*(self._doc_slots.get(doc_id, ()) for doc_id in doc_ids)))
+        else:
+            candidates = np.flatnonzero(self._alive[:len(self._ids)])
+        slots = np.fromiter((slot for slot in candidates if matches_where(self._metadatas[slot], where)), dtype=np.int64)
+        self._filter_cache[key] = slots
+        if len(self._filter_cache) > self.FILTER_CACHE_SIZE:
+            self._filter_cache.popitem(last=False)
+        return slots
+
+    def _rows(self, slots, include: Sequence[str]) -> Dict:
+        slots = [int(slot) for slot in slots if self._alive[slot]]
+        result = {"ids": [self._ids[slot] for slot in slots], "documents": None, "metadatas": None, "embeddings": None}
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[slot] for slot in slots]
+        if "documents" in include:
+            documents = []
+            with open(self._gen_dir() / "texts.bin", 'rb') as texts:
+                for slot in slots:
+                    texts.seek(self._text_offsets[slot])
+                    documents.append(texts.read(self._text_lengths[slot]).decode('utf-8'))
+            result["documents"] = documents
+        if "embeddings" in include:
+            result["embeddings"] = self._decode(slots) if slots else np.zeros((0, self._dim or 0), dtype=np.float32)
+        return result
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None, include: Optional[Sequence[str]] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None) -> Dict:
+        include = include if include is not None else ["documents", "metadatas"]
+        try:
+            return self._get(ids, where, include, limit, offset)
+        except FileNotFoundError:
+            # Génération supprimée par un autre processus entre la lecture de CURRENT et celle des fichiers
+            return self._get(ids, where, include, limit, offset)
+
+    def _get(self, ids: Optional[Sequence[str]], where: Optional[Dict], include: Sequence[str],
+             limit: Optional[int], offset: Optional[int]) -> Dict:
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                slots = [self._slots[chunk_id] for chunk_id in ids if chunk_id in self._slots]
+                if where:
+                    slots = [slot for slot in slots if matches_where(self._metadatas[slot], where)]
+            else:
+                slots = self._filtered_slots(where)
+                if slots is None:
+                    slots = np.flatnonzero(self._alive[:len(self._ids)])
+            slots = slots[offset or 0:]
+            if limit is not None:
+                slots = slots[:limit]
+            return self._rows(slots, include)
+
+    def query(self, query_embeddings, n_results: int = 10, where: Optional[Dict] = None, include: Optional[Sequence[str]] = None) -> Dict:
+        include = include if include is not None else ["documents", "metadatas", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries.reshape(len(queries), -1)
+        try:
+            return self._query(queries, n_results, where, include)
+        except FileNotFoundError:
+            # Génération supprimée par un autre processus pendant la lecture : une seule nouvelle
+            # tentative, sur l'état courant relu par _search
+            return self._query(queries, n_results, where, include)
+
+    def _query(self, queries: np.ndarray, n_results: int, where: Optional[Dict], include: Sequence[str]) -> Dict:
+        while True:
+            generation, found = self._search(queries, n_results, where)
+            with self._lock:
+                # Collection réécrite pendant la recherche : les slots ont changé, on recommence
+                if generation == self._generation:
+                    results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+                    for slots, distances in found:
+                        rows = self._rows(slots, include)
+                        # Un chunk supprimé entre la recherche et la lecture est écarté avec sa distance
+                        kept = [index for index, slot in enumerate(slots) if self._alive[slot]]
+                        results["ids"].append(rows["ids"])
+                        results["documents"].append(rows["documents"])
+                        results["metadatas"].append(rows["metadatas"])
+                        results["distances"].append([float(distances[index]) for index in kept])
+                    return results
+
+    def _search(self, queries: np.ndarray, n_results: int, where: Optional[Dict]) -> Tuple[Optional[str], List[Tuple[np.ndarray, np.ndarray]]]:
+        # Instantané de l'état sous verrou ; le calcul se fait ensuite sans bloquer les autres recherches
+        with self._lock:
+            self._refresh()
+            generation, rows = self._generation, self._mapped_rows
+            if rows == 0 or not self._slots:
+                empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+                return generation, [empty] * len(queries)
+            if queries.shape[1] != self._dim:
+                raise ValueError(f"Dimension de la requête ({queries.shape[1]}) différente de celle de la collection ({self._dim}).")
+            alive = self._alive[:rows]
+            candidates = self._filtered_slots(where)
+            centroids, lists = self._centroids, self._lists
+            view = (self._vectors, self._norms, self._scales)
+            searched = len(candidates) if candidates is not None else len(self._slots)
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+
+        if centroids is None or searched <= self.exact_search_limit:
+            if candidates is not None:
+                return generation, [self._score_slots(view, candidates, query, float(norm), n_results) for query, norm in zip(queries, query_norms)]
+            # Parcours exhaustif : chaque bloc n'est décodé qu'une fois pour toutes les requêtes du lot
+            return generation, self._scan(view, alive, queries, query_norms, n_results)
+
+        found = []
+        half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+        for query, query_norm in zip(queries, query_norms):
+            probes = np.argsort(-(centroids @ query - half_norms))[:self.nprobe]
+            mask = np.isin(lists[:rows], probes) & alive
+            if candidates is not None:
+                mask &= np.isin(np.arange(rows), candidates)
+            slots = np.flatnonzero(mask)
+            if len(slots) < n_results:
+                # Trop peu de chunks dans les partitions sondées : recherche exacte
+                slots = candidates if candidates is not None else np.flatnonzero(alive)
+            found.append(self._score_slots(view, slots, query, float(query_norm), n_results))
+        return generation, found
+
+    @staticmethod
+    def _merge_top(best: Tuple[np.ndarray, np.ndarray], slots: np.ndarray, distances: np.ndarray, k: int):
+        slots = np.concatenate((best[0], slots))
+        distances = np.concatenate((best[1], distances))
+        if len(distances) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+            slots, distances = slots[top], distances[top]
+        return slots, distances
+
+    def _distances(self, vectors: np.ndarray, norms: np.ndarray, query: np.ndarray, query_norm: float) -> np.ndarray:
+        # Distance L2 au carré, comme l'espace par défaut de ChromaDB
+        return np.maximum(norms - 2.0 * (vectors @ query) + query_norm, 0.0)
+
+    def _scan(self, view: Tuple, alive: np.ndarray, queries: np.ndarray, query_norms: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Recherche exacte sur toute la collection, par blocs contigus de la projection mémoire."""
+        vectors, norms, scales = view
+        best = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))] * len(queries)
+        for start in range(0, len(alive), self.BLOCK_ROWS):
+            stop = min(start + self.BLOCK_ROWS, len(alive))
+            block_alive = np.flatnonzero(alive[start:stop])
+            if not len(block_alive):
+                continue
+            block = self._decode(slice(start, stop), vectors, scales)[block_alive]
+            distances = np.maximum(norms[start:stop][block_alive] - 2.0 * (queries @ block.T) + query_norms[:, None], 0.0)
+            best = [self._merge_top(current, block_alive + start, row, k) for current, row in zip(best, distances)]
+        return [self._sorted(slots, distances) for slots, distances in best]
+
+    @staticmethod
+    def _sorted(slots: np.ndarray, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(distances, kind='stable')
+        return slots[order], distances[order]
+
+    def _score_slots(self, view: Tuple, slots: np.ndarray, query: np.ndarray, query_norm: float, k: int):
+        vectors, norms, scales = view
+        best = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        for start in range(0, len(slots), self.BLOCK_ROWS):
+            block = np.asarray(slots[start:start + self.BLOCK_ROWS], dtype=np.int64)
+            distances = self._distances(self._decode(block, vectors, scales), norms[block], query, query_norm)
+            best = self._merge_top(best, block, distances, k)
+        return self._sorted(*best)
+
+    def modify(self, name: str):
+        self.client._rename(self, name)
+
+
+class NumpyVectorClient:
+    """Collections NumPy d'un répertoire ; même interface que les clients ChromaDB utilisés par RAGEngine."""
+    def __init__(self, path: str, options: Optional[Dict] = None):
+        self.root = Path(path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.options = options or {}
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict] = None) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                (self.root / name).mkdir(parents=True, exist_ok=True)
+                collection = self._collections[name] = NumpyCollection(self, name, self.options)
+            return collection
+
+    def get_collection(self, name: str) -> NumpyCollection:
+        if not (self.root / name).is_dir():
+            raise ValueError(f"Collection {name} introuvable.")
+        return self.get_or_create_collection(name)
+
+    def list_collections(self) -> List[NumpyCollection]:
+        return [self.get_or_create_collection(path.name) for path in sorted(self.root.iterdir()) if path.is_dir()]
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            collection = self._collections.pop(name, None)
+        with FileLock(str(self.root / f"{name}.lock")):
+            shutil.rmtree(self.root / name, ignore_errors=True)
+        if collection is not None:
+            with collection._lock:
+                collection._reset()
+
+    def _rename(self, collection: NumpyCollection, name: str):
+        with self._lock, collection._lock, collection._file_lock, FileLock(str(self.root / f"{name}.lock")):
+            if (self.root / name).exists():
+                raise ValueError(f"La collection {name} existe déjà.")
+            os.rename(collection.directory, self.root / name)
+            self._collections.pop(collection.name, None)
+            collection.name = name
+            collection._bind(self.root)
+            self._collections[name] = collection
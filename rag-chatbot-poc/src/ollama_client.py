@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import metrics
+
+# Un client par URL d'Ollama, partagé par les gestionnaires LLM successifs et le gestionnaire de modèles
+_clients: Dict[str, "OllamaClient"] = {}
+_clients_lock = threading.Lock()
+
+# load_duration au-delà duquel une génération est comptée comme un démarrage à froid (modèle chargé pour elle)
+COLD_LOAD_SECONDS = 0.25
+
+
+def get_ollama_client(config: Dict) -> "OllamaClient":
+    ollama_cfg = config.get('llm', {}).get('ollama', {})
+    url = ollama_cfg.get('url')
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            client = _clients[url] = OllamaClient(ollama_cfg)
+        return client
+
+
+def get_generation_stats() -> Dict:
+    """Démarrages à froid et à chaud de tous les hôtes Ollama, avec leur délai moyen avant le premier token."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    totals = {"cold": [0, 0.0], "warm": [0, 0.0]}
+    for client in clients:
+        with client._status_lock:
+            for start, (count, seconds) in client.generation_stats.items():
+                totals[start][0] += count
+                totals[start][1] += seconds
+    stats = {}
+    for start, (count, seconds) in totals.items():
+        stats[f"ollama_{start}_generations"] = count
+        stats[f"ollama_{start}_first_token_avg_seconds"] = round(seconds / count, 3) if count else 0.0
+    return stats
+
+
+async def close_ollama_clients():
+    """Arrête les rafraîchissements et ferme les connexions (arrêt du serveur)."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    for client in clients:
+        await client.aclose()
+
+
+class OllamaClient:
+    """Connexions HTTP réutilisées (keep-alive) vers Ollama et état du service gardé en mémoire.
+
+    Les appels synchrones passent par une `requests.Session` et les appels asynchrones par un
+    `httpx.AsyncClient`, tous deux avec un pool de connexions. Les erreurs de connexion sont
+    réessayées ; une génération qui a commencé ne l'est jamais. L'état (disponibilité, modèles
+    installés) vient d'un seul appel à /api/tags, rafraîchi en arrière-plan.
+    """
+    def __init__(self, ollama_cfg: Dict):
+        self.logger = logging.getLogger(__name__)
+        self.base_url = ollama_cfg.get('url')
+        self.timeout = ollama_cfg.get('timeout', 180)
+        self.connect_timeout = ollama_cfg.get('connect_timeout', 3)
+        self.status_timeout = ollama_cfg.get('status_timeout', 3)
+        self.refresh_interval = ollama_cfg.get('status_refresh_interval', 15)
+        retries = ollama_cfg.get('retries', 2)
+        pool_size = ollama_cfg.get('pool_size', 10)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, connect=retries, read=0, status=0, backoff_factor=0.2),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._async_retries = retries
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+        self._status = {"available": False, "models": [], "checked_at": None, "error": None}
+        # Par type de démarrage : [nombre de générations, somme des délais avant le premier token]
+        self.generation_stats = {"cold": [0, 0.0], "warm": [0, 0.0]}
+        self._status_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def post(self, path: str, payload: Dict) -> requests.Response:
+        return self.session.post(f"{self.base_url}{path}", json=payload, timeout=(self.connect_timeout, self.timeout))
+
+    def preload(self, model: str, keep_alive) -> bool:
+        """Charge le modèle en mémoire sans rien générer (requête /api/chat sans message)."""
+        if not self.base_url:
+            return False
+        start = time.perf_counter()
+        try:
+            response = self.post("/api/chat", {"model": model, "messages": [], "keep_alive": keep_alive})
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.logger.warning(f"Préchargement du modèle {model} impossible ({self.base_url}) : {e}")
+            return False
+        self.logger.info(f"Modèle {model} chargé dans Ollama en {time.perf_counter() - start:.1f}s ({self.base_url})")
+        return True
+
+    def record_generation(self, model: str, data: Dict):
+        """Délai avant le premier token (chargement du modèle + lecture du prompt) d'après le bilan final d'Ollama."""
+        if "load_duration" not in data:
+            return
+        load_seconds = data.get("load_duration", 0) / 1e9
+        first_token_seconds = load_seconds + data.get("prompt_eval_duration", 0) / 1e9
+        start = "cold" if load_seconds > COLD_LOAD_SECONDS else "warm"
+        with self._status_lock:
+            self.generation_stats[start][0] += 1
+            self.generation_stats[start][1] += first_token_seconds
+        metrics.observe("rag_llm_first_token_seconds", first_token_seconds, model=model, start=start)
+        if start == "cold":
+            self.logger.info(f"Démarrage à froid de {model} : {load_seconds:.1f}s de chargement.")
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        # Client créé paresseusement pour être rattaché à la boucle asyncio du serveur
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=self._async_limits,
+                transport=httpx.AsyncHTTPTransport(retries=self._async_retries, limits=self._async_limits),
+            )
+        return self._async_client
+
+    def refresh_status(self) -> Dict:
+        """Interroge /api/tags une fois et met à jour l'état en mémoire."""
+        status = {"available": False, "models": [], "checked_at": time.time(), "error": None}
+        if self.base_url:
+            try:
+                response = self.session.get(f"{self.base_url}/api/tags", timeout=(self.connect_timeout, self.status_timeout))
+                response.raise_for_status()
+                status["available"] = True
+                status["models"] = response.json().get('models', [])
+            except (requests.RequestException, ValueError) as e:
+                status["error"] = str(e)
+        with self._status_lock:
+            if status["available"] != self._status["available"]:
+                self.logger.info(f"Ollama {'disponible' if status['available'] else 'indisponible'} ({self.base_url})")
+            self._status = status
+        return status
+
+    def get_status(self) -> Dict:
+        """État d'Ollama : celui en mémoire si le rafraîchissement de fond tourne, sinon un état frais."""
+        with self._status_lock:
+            status = self._status
+        if status["checked_at"] is None:
+            return self.refresh_status()
+        if self._refresh_thread is None and time.time() - status["checked_at"] > self.refresh_interval:
+            return self.refresh_status()
+        return status
+
+    def is_available(self) -> bool:
+        return self.get_status()["available"]
+
+    def installed_models(self) -> List[Dict]:
+        return self.get_status()["models"]
+
+    def start_background_refresh(self):
+        if self._refresh_thread is not None or not self.base_url:
+            return
+        # Un événement d'arrêt par thread : un ancien thread ne peut pas être relancé par erreur
+        self._stop = threading.Event()
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, args=(self._stop,), name="ollama-status", daemon=True)
+        self._refresh_thread.start()
+
+    def _refresh_loop(self, stop: threading.Event):
+        while not stop.is_set():
+            self.refresh_status()
+            stop.wait(self.refresh_interval)
+
+    async def aclose(self):
+        self._stop.set()
+        self._refresh_thread = None
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -1,72 +1,586 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import logging
-from typing import List, Dict
+import os
+import random
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
+
+from .document_processor import Segment
+from .embedding_cache import EmbeddingCache
+from .metrics import metrics
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .embedding_backends import MicroBatcher, embedding_cache_key, load_embedding_model
+from .embedding_service import RemoteEmbeddingModel, get_service_address
+from .vector_store import create_vector_client
+from .workspaces import DEFAULT_WORKSPACE, collection_name, workspace_from_collection
 
 class RAGEngine:
     def __init__(self, config: dict):
+        # Imports lourds différés : le serveur web peut ouvrir son port avant de les payer
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
         self.logger = logging.getLogger(__name__)
         self.config = config['embedding']
         db_config = config['database']['vector_db']
         
-        self.client = chromadb.PersistentClient(path=db_config['path'])
-        self.collection = self.client.get_or_create_collection(name=db_config['collection_name'])
+        self.client = create_vector_client(config)
+        self.collection_name = db_config['collection_name']
+        self.insert_batch_size = db_config.get('insert_batch_size', 1000)
+        self.encode_batch_size = self.config.get('batch_size', 64)
+        self.ingestion_stats = {"embedded_chunks": 0, "reused_chunks": 0, "deleted_chunks": 0}
         
-        self.logger.info(f"Chargement du modèle d'embedding: {self.config['model_name']}")
-        self.embedding_model = SentenceTransformer(self.config['model_name'])
+        self.query_encoder: Optional[ThreadPoolExecutor] = None
+        service = get_service_address()
+        if service:
+            self.logger.info("Utilisation du service d'embedding partagé.")
+            self.embedding_model = RemoteEmbeddingModel(*service)
+        else:
+            self.logger.info(f"Chargement du modèle d'embedding: {self.config['model_name']} (backend {self.config.get('backend', 'torch')})")
+            self.embedding_model = load_embedding_model(config)
+            batching_config = self.config.get('micro_batching', {})
+            if batching_config.get('enabled', False):
+                # Le service partagé regroupe lui-même les requêtes de tous les workers
+                self.embedding_model = MicroBatcher(
+                    self.embedding_model,
+                    max_batch_size=batching_config.get('max_batch_size', 32),
+                    max_wait_ms=batching_config.get('max_wait_ms', 5),
+                )
+                # Threads qui ne font qu'attendre le micro-lot : les encodages des questions n'occupent pas
+                # les threads d'embedding_workers pendant la fenêtre de regroupement, dont le nombre borne sinon
+                # celui des questions simultanées regroupables
+                self.query_encoder = ThreadPoolExecutor(
+                    max_workers=self.embedding_model.max_batch_size, thread_name_prefix="query-encode"
+                )
+
+        cache_config = self.config.get('cache', {})
+        self.embedding_cache = None
+        if cache_config.get('enabled', False):
+            self.embedding_cache = EmbeddingCache(
+                db_path=config['database']['path'],
+                model_name=embedding_cache_key(self.config),
+                memory_size=cache_config.get('memory_size', 10000)
+            )
         
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.config['chunk_size'],
             chunk_overlap=self.config['chunk_overlap']
         )
+
+        self.retrieval_config = config.get('retrieval', {})
+        self.retrieval_mode = self.retrieval_config.get('mode', 'vector')
+        # Une collection ChromaDB (et un index BM25) par espace de travail, ouverts à la première utilisation
+        self.vector_db_path = Path(db_config['path'])
+        self.bm25_dir = self.vector_db_path.parent
+        self._collections: Dict[str, object] = {}
+        self._bm25_indexes: Dict[str, Optional[BM25Index]] = {}
+        self._partitions_lock = threading.RLock()
+        # Écritures dans les collections (ajouts, suppressions), suspendues pendant une compaction
+        self._write_lock = threading.RLock()
+        # Appelé avec (espace de travail, nombre de chunks) après chaque suppression de chunks
+        self.on_chunks_deleted: Optional[Callable[[str, int], None]] = None
+        # Appelé avec l'espace de travail avant chaque écriture dans sa collection ; `write_version`
+        # lit le nombre d'écritures de tous les processus (catalogue SQLite), pour la compaction
+        self.on_write: Optional[Callable[[str], None]] = None
+        self.write_version: Optional[Callable[[str], int]] = None
+        self._write_versions: Dict[str, int] = {}
+        # Recherches en cours par collection (id de l'objet), attendues avant de supprimer une collection remplacée
+        self._readers: Dict[int, int] = {}
+        self._readers_done = threading.Condition(self._partitions_lock)
+        # Partition de l'espace par défaut, ouverte dès le démarrage
+        self.collection = self._collection(DEFAULT_WORKSPACE)
+        self.bm25_index = self._bm25(DEFAULT_WORKSPACE)
+        self.reranker = None
+        if self.retrieval_config.get('rerank', {}).get('enabled', False):
+            from .reranker import Reranker
+            self.reranker = Reranker(config)
         self.logger.info("Moteur RAG initialisé.")
 
-    def add_document(self, doc_id: str, text: str, metadata: dict) -> int:
-        self.logger.info(f"Découpage et embedding du document ID: {doc_id}")
-        chunks = self.text_splitter.split_text(text)
-        if not chunks:
-            self.logger.warning(f"Aucun chunk de texte n'a pu être créé pour le document {doc_id}.")
-            return 0
-            
-        embeddings = self.embedding_model.encode(chunks, show_progress_bar=False)
-        
-        num_chunks = len(chunks)
-        ids = [f"{doc_id}_{i}" for i in range(num_chunks)]
-        metadatas = [{**metadata, "chunk_id": i} for i in range(num_chunks)]
-        
-        self.collection.add(
-            documents=chunks,
-            embeddings=embeddings.tolist(),
-            metadatas=metadatas,
-            ids=ids
-        )
-        self.logger.info(f"{num_chunks} chunks ajoutés à la base de données vectorielle pour le document {doc_id}.")
-        return num_chunks
+    def _collection(self, workspace: str):
+        with self._partitions_lock:
+            collection = self._collections.get(workspace)
+            if collection is None:
+                collection = self._collections[workspace] = self.client.get_or_create_collection(name=collection_name(self.collection_name, workspace))
+            return collection
+
+    @contextmanager
+    def _reading(self, workspace: str):
+        """Collection d'un espace de travail, qui ne sera pas supprimée avant la sortie du bloc."""
+        with self._partitions_lock:
+            collection = self._collection(workspace)
+            self._readers[id(collection)] = self._readers.get(id(collection), 0) + 1
+        try:
+            yield collection
+        finally:
+            with self._partitions_lock:
+                self._readers[id(collection)] -= 1
+                if not self._readers[id(collection)]:
+                    del self._readers[id(collection)]
+                    self._readers_done.notify_all()
+
+    def _swap_collection(self, workspace: str, previous, replacement):
+        """Donne à `replacement` le nom de la collection `previous` de l'espace de travail, puis supprime celle-ci.
+
+        L'ancienne collection est renommée plutôt que supprimée d'abord : le nom reste pris sauf
+        entre les deux renommages, et les objets qui la désignent encore (recherches en cours)
+        restent valides. Elle n'est supprimée qu'une fois ces recherches terminées.
+        """
+        name = collection_name(self.collection_name, workspace)
+        retired_name = f"{name}.retired"
+        # Reste éventuel d'un remplacement interrompu
+        self.client.get_or_create_collection(name=retired_name)
+        self.client.delete_collection(name=retired_name)
+        with self._partitions_lock:
+            previous.modify(name=retired_name)
+            replacement.modify(name=name)
+            self._collections[workspace] = replacement
+            if workspace == DEFAULT_WORKSPACE:
+                self.collection = replacement
+            if not self._readers_done.wait_for(lambda: id(previous) not in self._readers, timeout=60):
+                self.logger.warning(f"Recherches toujours en cours sur l'ancienne collection {name}, supprimée quand même.")
+        self.client.delete_collection(name=retired_name)
+
+    def _record_write(self, workspace: str):
+        with self._partitions_lock:
+            self._write_versions[workspace] = self._write_versions.get(workspace, 0) + 1
+        if self.on_write is not None:
+            self.on_write(workspace)
+
+    def _write_version(self, workspace: str) -> Tuple[int, Optional[int]]:
+        """Écritures de ce processus et, si le catalogue les compte, de tous les processus."""
+        with self._partitions_lock:
+            local = self._write_versions.get(workspace, 0)
+        return local, self.write_version(workspace) if self.write_version is not None else None
+
+    def _bm25(self, workspace: str) -> Optional[BM25Index]:
+        if self.retrieval_mode != 'hybrid':
+            return None
+        with self._partitions_lock:
+            if workspace not in self._bm25_indexes:
+                filename = 'bm25_index.pkl' if workspace == DEFAULT_WORKSPACE else f'bm25_index_{workspace}.pkl'
+                self._bm25_indexes[workspace] = BM25Index(self.bm25_dir / filename)
+                if len(self._bm25_indexes[workspace]) != self._collection(workspace).count():
+                    self.rebuild_bm25_index(workspace)
+            return self._bm25_indexes[workspace]
+
+    def list_workspaces(self) -> List[str]:
+        """Espaces de travail présents dans ChromaDB (l'espace par défaut toujours en premier)."""
+        workspaces = []
+        for collection in self.client.list_collections():
+            # Selon la version de ChromaDB, des objets Collection ou directement des noms
+            workspace = workspace_from_collection(self.collection_name, getattr(collection, "name", collection))
+            if workspace is not None and workspace != DEFAULT_WORKSPACE:
+                workspaces.append(workspace)
+        return [DEFAULT_WORKSPACE] + sorted(workspaces)
+
+    def rebuild_bm25_index(self, workspace: str = DEFAULT_WORKSPACE):
+        """Reconstruit l'index lexical à partir des chunks stockés dans ChromaDB."""
+        bm25_index = self._bm25_indexes[workspace]
+        self.logger.info(f"Reconstruction de l'index BM25 de l'espace '{workspace}' depuis la base vectorielle...")
+        bm25_index.rebuild(self._iter_chunk_pages(self._collection(workspace)))
+        self.logger.info(f"Index BM25 reconstruit : {len(bm25_index)} chunks.")
+
+    @contextmanager
+    def rebuilding(self, workspace: str):
+        """Reconstruit la collection d'un espace de travail dans une collection temporaire.
+
+        Les `add_documents` du bloc y écrivent ; elle remplace l'ancienne collection à la sortie
+        du bloc, et l'index BM25 est alors reconstruit en une fois. En cas d'échec, l'ancienne
+        collection reste intacte.
+        """
+        name = collection_name(self.collection_name, workspace)
+        rebuild_name = f"{name}.rebuild"
+        # Reste éventuel d'une reconstruction interrompue
+        self.client.get_or_create_collection(name=rebuild_name)
+        self.client.delete_collection(name=rebuild_name)
+        rebuilt = self.client.get_or_create_collection(name=rebuild_name)
+        with self._partitions_lock:
+            previous = self._collection(workspace)
+            previous_bm25 = self._bm25(workspace)
+            self._collections[workspace] = rebuilt
+            # Pas de mise à jour de l'index lexical pendant la reconstruction
+            self._bm25_indexes[workspace] = None
+        try:
+            yield rebuilt
+        except BaseException:
+            with self._partitions_lock:
+                self._collections[workspace] = previous
+                self._bm25_indexes[workspace] = previous_bm25
+            self.client.delete_collection(name=rebuild_name)
+            raise
+        self._swap_collection(workspace, previous, rebuilt)
+        with self._partitions_lock:
+            self._bm25_indexes[workspace] = previous_bm25
+        if previous_bm25 is not None:
+            self.rebuild_bm25_index(workspace)
+
+    def _iter_chunk_pages(self, collection):
+        offset = 0
+        while True:
+            page = collection.get(include=["documents"], limit=self.insert_batch_size, offset=offset)
+            if not page['ids']:
+                return
+            yield page['ids'], page['documents']
+            offset += len(page['ids'])
+
+    def add_document(self, doc_id: str, segments: Iterable[Segment], metadata: dict, workspace: str = DEFAULT_WORKSPACE) -> int:
+        return self.add_documents([(doc_id, segments, metadata)], workspace)[doc_id]
+
+    # Même hash pour l'identifiant des chunks et la clé du cache d'embeddings
+    hash_text = staticmethod(EmbeddingCache.hash_text)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode des textes en passant par le cache d'embeddings lorsqu'il est activé."""
+        if self.embedding_cache is None:
+            with metrics.stage("encode"):
+                return self.embedding_model.encode(texts, batch_size=self.encode_batch_size, show_progress_bar=False)
+
+        hashes = [self.hash_text(text) for text in texts]
+        cached = self.embedding_cache.get_many(list(dict.fromkeys(hashes)))
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+        if missing:
+            start = time.perf_counter()
+            with metrics.stage("encode"):
+                vectors = self.embedding_model.encode(list(missing.values()), batch_size=self.encode_batch_size, show_progress_bar=False)
+            computed = dict(zip(missing.keys(), vectors))
+            self.embedding_cache.put_many(computed, encode_seconds=time.perf_counter() - start)
+            cached.update(computed)
+        return np.stack([cached[h] for h in hashes]).astype(np.float32)
+
+    def add_documents(self, documents: List[Tuple[str, Iterable[Segment], dict]], workspace: str = DEFAULT_WORKSPACE) -> Dict[str, int]:
+        """Indexe plusieurs documents de façon incrémentale.
+
+        Chaque chunk est identifié par le hash de son contenu : seuls les chunks nouveaux
+        sont encodés, les chunks inchangés sont conservés et les chunks disparus supprimés.
+        Les segments extraits sont découpés et insérés au fil de l'eau,
+        par lots de `insert_batch_size` chunks, pour que la mémoire reste bornée quelle que
+        soit la taille des fichiers. La position de chaque chunk (page, feuille, diapositive)
+        est ajoutée à ses métadonnées. Les documents sont indexés dans la collection de `workspace`.
+        """
+        with self._write_lock:
+            return self._add_documents(documents, workspace)
+
+    def _add_documents(self, documents: List[Tuple[str, Iterable[Segment], dict]], workspace: str) -> Dict[str, int]:
+        collection = self._collection(workspace)
+        bm25_index = self._bm25(workspace)
+        chunk_counts = {}
+        new_chunks, new_ids, new_metadatas = [], [], []
+        kept_ids, kept_metadatas, stale_ids = [], [], []
+        added_ids = []
+        counters = {"embedded_chunks": 0, "reused_chunks": 0}
 
-    def search(self, query: str, n_results: int = 5) -> List[Dict]:
+        def flush_new():
+            nonlocal new_chunks, new_ids, new_metadatas
+            if not new_ids:
+                return
+            embeddings = self.encode(new_chunks)
+            self._record_write(workspace)
+            with metrics.stage("collection_add"):
+                collection.add(documents=new_chunks, embeddings=embeddings.tolist(), metadatas=new_metadatas, ids=new_ids)
+            if bm25_index is not None:
+                # Verrou de l'index lexical pris pour ce seul lot, pas pendant l'encodage des suivants
+                with metrics.stage("bm25_update"):
+                    bm25_index.update(add_ids=new_ids, add_texts=new_chunks)
+            added_ids.extend(new_ids)
+            counters["embedded_chunks"] += len(new_ids)
+            new_chunks, new_ids, new_metadatas = [], [], []
+
+        def flush_kept():
+            nonlocal kept_ids, kept_metadatas
+            if not kept_ids:
+                return
+            self._record_write(workspace)
+            with metrics.stage("collection_update"):
+                collection.update(ids=kept_ids, metadatas=kept_metadatas)
+            counters["reused_chunks"] += len(kept_ids)
+            kept_ids, kept_metadatas = [], []
+
+        try:
+            for doc_id, segments, metadata in documents:
+                self.logger.info(f"Découpage et embedding du document ID: {doc_id}")
+                existing = self._get_chunk_hashes(collection, doc_id)
+                seen_ids = set()
+                for location, text in metrics.timed_iter("extraction", segments):
+                    with metrics.stage("split"):
+                        chunks = self.text_splitter.split_text(text)
+                    for chunk in chunks:
+                        chunk_hash = self.hash_text(chunk)
+                        chunk_id = f"{doc_id}_{chunk_hash[:16]}"
+                        # Les chunks identiques au sein d'un même document n'apportent rien à la recherche
+                        if chunk_id in seen_ids:
+                            continue
+                        seen_ids.add(chunk_id)
+                        chunk_metadata = {**metadata, **location, "chunk_id": len(seen_ids) - 1, "chunk_hash": chunk_hash}
+                        if existing.get(chunk_id) == chunk_hash:
+                            kept_ids.append(chunk_id)
+                            kept_metadatas.append(chunk_metadata)
+                            if len(kept_ids) >= self.insert_batch_size:
+                                flush_kept()
+                        else:
+                            new_chunks.append(chunk)
+                            new_ids.append(chunk_id)
+                            new_metadatas.append(chunk_metadata)
+                            if len(new_ids) >= self.insert_batch_size:
+                                flush_new()
+                chunk_counts[doc_id] = len(seen_ids)
+                if not seen_ids:
+                    self.logger.warning(f"Aucun chunk de texte n'a pu être créé pour le document {doc_id}.")
+                stale_ids.extend(chunk_id for chunk_id in existing if chunk_id not in seen_ids)
+            flush_new()
+            flush_kept()
+        except Exception:
+            # Extraction interrompue : on retire les chunks déjà insérés pour ne pas laisser de document partiel
+            self.logger.error(f"Indexation interrompue, retrait de {len(added_ids)} chunk(s) déjà insérés.")
+            self._delete_chunks(workspace, added_ids)
+            raise
+        self._delete_chunks(workspace, stale_ids)
+
+        self.ingestion_stats["embedded_chunks"] += counters["embedded_chunks"]
+        self.ingestion_stats["reused_chunks"] += counters["reused_chunks"]
+        self.ingestion_stats["deleted_chunks"] += len(stale_ids)
+        self.logger.info(f"{len(documents)} document(s) indexé(s) : {counters['embedded_chunks']} chunks encodés, {counters['reused_chunks']} réutilisés, {len(stale_ids)} supprimés.")
+        return chunk_counts
+
+    def _delete_chunks(self, workspace: str, chunk_ids: List[str]):
+        collection = self._collection(workspace)
+        if chunk_ids:
+            self._record_write(workspace)
+        for start in range(0, len(chunk_ids), self.insert_batch_size):
+            with metrics.stage("collection_delete"):
+                collection.delete(ids=chunk_ids[start:start + self.insert_batch_size])
+        bm25_index = self._bm25(workspace)
+        if bm25_index is not None and chunk_ids:
+            bm25_index.update(remove_ids=chunk_ids)
+        if chunk_ids and self.on_chunks_deleted is not None:
+            self.on_chunks_deleted(workspace, len(chunk_ids))
+
+    @staticmethod
+    def _get_chunk_hashes(collection, doc_id: str) -> Dict[str, Optional[str]]:
+        existing = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+        return {chunk_id: metadata.get("chunk_hash") for chunk_id, metadata in zip(existing['ids'], existing['metadatas'])}
+
+    def get_indexed_documents(self) -> Dict[str, Dict]:
+        """Parcourt les métadonnées de chaque collection et résume les documents qu'elles contiennent."""
+        documents = {}
+        for workspace in self.list_workspaces():
+            collection = self._collection(workspace)
+            offset = 0
+            while True:
+                page = collection.get(include=["metadatas"], limit=self.insert_batch_size, offset=offset)
+                if not page['ids']:
+                    break
+                for metadata in page['metadatas']:
+                    info = documents.setdefault(metadata['doc_id'], {
+                        "filename": metadata.get('filename', metadata['doc_id']),
+                        "file_hash": metadata.get('file_hash'),
+                        "workspace": workspace,
+                        "chunk_count": 0,
+                    })
+                    info["chunk_count"] += 1
+                offset += len(page['ids'])
+        return documents
+
+    def search(self, query: str, n_results: int = 5, workspace: str = DEFAULT_WORKSPACE, where: Optional[Dict] = None) -> List[Dict]:
+        """Recherche dans la collection de `workspace`, limitée aux chunks satisfaisant `where` (filtre ChromaDB)."""
         self.logger.info(f"Recherche de la requête : '{query[:50]}...'")
-        query_embedding = self.embedding_model.encode([query])
-        results = self.collection.query(
-            query_embeddings=query_embedding.tolist(),
-            n_results=n_results
-        )
-        
-        # Formater les résultats pour être plus utilisables
+        return self.search_batch([query], n_results, workspace, where)[0]
+
+    def search_batch(self, queries: List[str], n_results: int = 5, workspace: str = DEFAULT_WORKSPACE, where: Optional[Dict] = None,
+                     query_embeddings: Optional[np.ndarray] = None) -> List[List[Dict]]:
+        """Recherche de plusieurs requêtes : un seul encodage et une seule requête vectorielle pour tout le lot.
+
+        `query_embeddings` : embeddings des requêtes déjà calculés (voir `query_encoder`), sinon encodés ici.
+        """
+        if self.reranker is None:
+            return self._retrieve(queries, n_results, workspace, where, query_embeddings)
+        # Le cross-encoder reclasse un ensemble de candidats plus large que le résultat demandé
+        candidates = self._retrieve(queries, max(n_results, self.reranker.candidates), workspace, where, query_embeddings)
+        return [self.reranker.rerank(query, results, n_results) for query, results in zip(queries, candidates)]
+
+    def _retrieve(self, queries: List[str], n_results: int, workspace: str, where: Optional[Dict],
+                  query_embeddings: Optional[np.ndarray] = None) -> List[List[Dict]]:
+        if query_embeddings is None:
+            query_embeddings = self.encode(queries)
+        with self._reading(workspace) as collection:
+            return self._retrieve_from(collection, queries, query_embeddings, n_results, workspace, where)
+
+    def _retrieve_from(self, collection, queries: List[str], query_embeddings: np.ndarray, n_results: int, workspace: str,
+                       where: Optional[Dict]) -> List[List[Dict]]:
+        bm25_index = self._bm25(workspace)
+        # Le filtre est appliqué par ChromaDB pendant la recherche, pas sur les résultats
+        filter_args = {"where": where} if where else {}
+        if bm25_index is None:
+            with metrics.stage("vector_search"):
+                results = collection.query(
+                    query_embeddings=query_embeddings.tolist(),
+                    n_results=n_results,
+                    **filter_args
+                )
+            return [self._format_query_results(results, i) for i in range(len(queries))]
+
+        # Recherche hybride : fusion des classements vectoriel et BM25
+        bm25_index.refresh()
+        candidates = max(n_results, self.retrieval_config.get('candidates', 20))
+        with metrics.stage("vector_search"):
+            results = collection.query(
+                query_embeddings=query_embeddings.tolist(),
+                n_results=candidates,
+                **filter_args
+            )
+        vector_results = [self._format_query_results(results, i) for i in range(len(queries))]
+        fused_rankings = []
+        with metrics.stage("lexical_search"):
+            # L'index BM25 ne connaît pas les métadonnées : les chunks satisfaisant le filtre sont lus
+            # une fois pour le lot, et BM25 ne classe qu'eux
+            allowed_ids = set(collection.get(where=where, include=[])['ids']) if where else None
+            for query, query_results in zip(queries, vector_results):
+                lexical_results = bm25_index.search(query, n_results=candidates, allowed_ids=allowed_ids)
+                fused = reciprocal_rank_fusion(
+                    [[res['id'] for res in query_results], [chunk_id for chunk_id, _ in lexical_results]],
+                    k=self.retrieval_config.get('rrf_k', 60)
+                )
+                fused_rankings.append(fused[:n_results])
+
+        results_by_id = {res['id']: res for query_results in vector_results for res in query_results}
+        missing_ids = list(dict.fromkeys(chunk_id for fused in fused_rankings for chunk_id, _ in fused if chunk_id not in results_by_id))
+        if missing_ids:
+            # Chunks trouvés par BM25 seulement : lus en une fois pour tout le lot
+            extra = collection.get(ids=missing_ids, include=["documents", "metadatas"], **filter_args)
+            for chunk_id, doc, metadata in zip(extra['ids'], extra['documents'], extra['metadatas']):
+                results_by_id[chunk_id] = {"id": chunk_id, "content": doc, "metadata": metadata, "distance": None}
+        batch_results = []
+        for fused, query_results in zip(fused_rankings, vector_results):
+            # Un chunk trouvé par la recherche vectorielle d'une autre requête du lot n'a pas de distance pour celle-ci
+            own_results = {res['id']: res for res in query_results}
+            batch_results.append([
+                {**(own_results.get(chunk_id) or {**results_by_id[chunk_id], "distance": None}), "score": score}
+                for chunk_id, score in fused if chunk_id in results_by_id
+            ][:n_results])
+        return batch_results
+
+    def _format_query_results(self, results: Dict, index: int = 0) -> List[Dict]:
+        # Formater les résultats (de la requête `index` du lot) pour être plus utilisables
         formatted_results = []
         if results and results['documents']:
-            for i, doc in enumerate(results['documents'][0]):
+            for i, doc in enumerate(results['documents'][index]):
                 formatted_results.append({
+                    "id": results['ids'][index][i],
                     "content": doc,
-                    "metadata": results['metadatas'][0][i],
-                    "distance": results['distances'][0][i]
+                    "metadata": results['metadatas'][index][i],
+                    "distance": results['distances'][index][i]
                 })
         return formatted_results
 
-    def delete_document(self, doc_id: str):
-        self.logger.info(f"Suppression des chunks associés au document ID: {doc_id}")
-        self.collection.delete(where={"doc_id": doc_id})
+    def delete_document(self, doc_id: str, workspace: str = DEFAULT_WORKSPACE) -> int:
+        return self.delete_documents([doc_id], workspace)
+
+    def delete_documents(self, doc_ids: List[str], workspace: str = DEFAULT_WORKSPACE) -> int:
+        """Supprime les chunks de plusieurs documents d'un espace de travail ; renvoie le nombre de chunks supprimés."""
+        if not doc_ids:
+            return 0
+        self.logger.info(f"Suppression des chunks de {len(doc_ids)} document(s) de l'espace '{workspace}'.")
+        with self._write_lock:
+            where = {"doc_id": doc_ids[0]} if len(doc_ids) == 1 else {"doc_id": {"$in": list(doc_ids)}}
+            chunk_ids = self._collection(workspace).get(where=where, include=[])["ids"]
+            self._delete_chunks(workspace, chunk_ids)
+        self.ingestion_stats["deleted_chunks"] += len(chunk_ids)
+        return len(chunk_ids)
+
+    # --- Maintenance de l'index ---
+
+    def count(self, workspace: str = DEFAULT_WORKSPACE) -> int:
+        return self._collection(workspace).count()
+
+    def tombstones(self, workspace: str) -> Optional[int]:
+        """Chunks supprimés encore présents dans l'index, si la base vectorielle sait les compter (pas ChromaDB)."""
+        collection = self._collection(workspace)
+        return collection.tombstones() if hasattr(collection, "tombstones") else None
+
+    def compact(self, workspace: str):
+        """Retire de l'index d'un espace de travail la place occupée par les chunks supprimés.
+
+        ChromaDB ne fait que marquer les vecteurs supprimés dans son graphe HNSW : la collection
+        est recopiée, embeddings compris et sans réencodage, dans une collection neuve qui la
+        remplace. Le stockage NumPy réécrit sa génération courante. Les recherches et les
+        écritures continuent sur l'ancienne collection pendant la copie ; si une écriture, de ce
+        processus ou d'un autre, l'a modifiée entre-temps, la copie est abandonnée.
+        """
+        collection = self._collection(workspace)
+        if hasattr(collection, "compact"):
+            with metrics.stage("compaction"):
+                collection.compact()
+            return
+        name = collection_name(self.collection_name, workspace)
+        compact_name = f"{name}.compact"
+        # Reste éventuel d'une compaction interrompue
+        self.client.get_or_create_collection(name=compact_name)
+        self.client.delete_collection(name=compact_name)
+        compacted = self.client.get_or_create_collection(name=compact_name)
+        with self._write_lock:
+            # Lue hors de toute écriture de ce processus : une écriture commencée avant la copie est terminée
+            collection = self._collection(workspace)
+            version = self._write_version(workspace)
+            expected = collection.count()
+        try:
+            with metrics.stage("compaction"):
+                offset = 0
+                while True:
+                    page = collection.get(include=["embeddings", "documents", "metadatas"], limit=self.insert_batch_size, offset=offset)
+                    if not len(page['ids']):
+                        break
+                    compacted.add(ids=page['ids'], embeddings=page['embeddings'], documents=page['documents'], metadatas=page['metadatas'])
+                    offset += len(page['ids'])
+        except BaseException:
+            self.client.delete_collection(name=compact_name)
+            raise
+        with self._write_lock:
+            # Le nombre de chunks couvre les écritures d'un processus dont le catalogue ne compte pas les écritures
+            if self._write_version(workspace) != version or compacted.count() != expected or collection.count() != expected:
+                self.client.delete_collection(name=compact_name)
+                raise RuntimeError(f"Collection {name} modifiée pendant la compaction.")
+            self._swap_collection(workspace, collection, compacted)
+        self.logger.info(f"Collection {name} compactée : {expected} chunks.")
+
+    def index_size(self, workspace: str) -> int:
+        """Taille sur disque de l'index, en octets : la collection NumPy, ou toute la base ChromaDB."""
+        root = getattr(self._collection(workspace), "directory", None) or self.vector_db_path
+        return sum(os.path.getsize(os.path.join(directory, filename))
+                   for directory, _, filenames in os.walk(root) for filename in filenames)
+
+    def sample_embeddings(self, workspace: str, count: int) -> List:
+        """Embeddings de `count` chunks consécutifs pris au hasard dans la collection, pour mesurer la recherche."""
+        collection = self._collection(workspace)
+        total = collection.count()
+        if not total:
+            return []
+        page = collection.get(include=["embeddings"], limit=count, offset=random.randrange(max(total - count, 0) + 1))
+        return [list(embedding) for embedding in page['embeddings']]
+
+    def search_latency(self, workspace: str, embeddings: List, n_results: int = 10) -> Dict[str, Optional[float]]:
+        """Latences (ms) de la recherche vectorielle seule, sans encodage, pour chacun des embeddings."""
+        collection = self._collection(workspace)
+        durations = []
+        for embedding in embeddings:
+            start = time.perf_counter()
+            collection.query(query_embeddings=[embedding], n_results=n_results, include=["distances"])
+            durations.append((time.perf_counter() - start) * 1000)
+        if not durations:
+            return {"search_p50_ms": None, "search_p95_ms": None}
+        return {
+            "search_p50_ms": round(float(np.percentile(durations, 50)), 2),
+            "search_p95_ms": round(float(np.percentile(durations, 95)), 2),
+        }
 
     def get_stats(self):
-        count = self.collection.count()
-        return {"total_chunks": count}
\ No newline at end of file
+        count = sum(self._collection(workspace).count() for workspace in self.list_workspaces())
+        stats = {"total_chunks": count, "retrieval_mode": self.retrieval_mode, **self.ingestion_stats}
+        if self.embedding_cache is not None:
+            stats.update(self.embedding_cache.get_stats())
+        if isinstance(self.embedding_model, MicroBatcher):
+            stats.update(self.embedding_model.stats)
+        if self.reranker is not None:
+            stats.update(self.reranker.get_stats())
+        return stats
\ No newline at end of file
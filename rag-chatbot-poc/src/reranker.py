@@ -0,0 +1,131 @@
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .embedding_backends import (
+    EXPORT_CONFIG_FILE, ONNX_INT8_MODEL_FILE, ONNX_MODEL_FILE, TOKENIZER_FILE,
+    create_onnx_session, export_transformer_to_onnx, pad_encodings, prepare_onnx_model,
+)
+from .metrics import metrics
+
+
+def _export_cross_encoder(model_name: str, model_dir: Path):
+    from sentence_transformers import CrossEncoder
+
+    cross_encoder = CrossEncoder(model_name, device="cpu")
+    tokenizer = cross_encoder.tokenizer
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in tokenizer.model_input_names]
+    export_config = {
+        "model_name": model_name,
+        "input_names": input_names,
+        "max_length": cross_encoder.max_length or min(tokenizer.model_max_length, 512),
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    sample = tokenizer(["question"], ["passage"], return_tensors="pt")
+    export_transformer_to_onnx(cross_encoder.model, tokenizer, "logits", sample, model_dir, export_config)
+
+
+class OnnxCrossEncoder:
+    """Cross-encoder exécuté par ONNX Runtime, compatible avec CrossEncoder.predict."""
+    def __init__(self, model_dir: Path, quantized: bool = False, threads: int = 0):
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        self.export_config = json.loads((model_dir / EXPORT_CONFIG_FILE).read_text(encoding="utf-8"))
+        self.input_names = self.export_config["input_names"]
+        self.tokenizer = Tokenizer.from_file(str(model_dir / TOKENIZER_FILE))
+        # Seul le passage est tronqué : la question est toujours lue en entier
+        self.tokenizer.enable_truncation(max_length=self.export_config["max_length"], strategy="only_second")
+        self.tokenizer.no_padding()
+        self.session = create_onnx_session(model_dir / (ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE), threads)
+
+    def predict(self, pairs: List[Tuple[str, str]], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(list(pairs))
+        scores = np.empty(len(encodings), dtype=np.float32)
+        for start in range(0, len(encodings), batch_size):
+            inputs = pad_encodings(encodings[start:start + batch_size], self.export_config["pad_token_id"])
+            logits = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+            scores[start:start + batch_size] = logits[:, 0] if logits.ndim > 1 else logits
+        return scores
+
+
+class Reranker:
+    """Reclassement des candidats de la recherche par un cross-encoder (question et passage lus ensemble).
+
+    Le cross-encoder tourne sur CPU, un lot à la fois. Sa durée moyenne par lot est suivie
+    pour estimer l'attente d'un nouvel appel : si elle dépasse `latency_budget_ms` (charge
+    élevée), le reclassement est sauté et l'ordre de la recherche est conservé. Une estimation
+    qui ne serait plus remesurée bloquerait le reclassement pour de bon : quand aucun appel
+    n'est en cours, un appel d'essai passe toutes les `probe_interval` secondes et la met à jour.
+    """
+    def __init__(self, config: Dict):
+        self.logger = logging.getLogger(__name__)
+        rerank_config = config.get('retrieval', {}).get('rerank', {})
+        self.model_name = rerank_config.get('model_name', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+        self.candidates = rerank_config.get('candidates', 30)
+        self.batch_size = rerank_config.get('batch_size', 32)
+        self.latency_budget = rerank_config.get('latency_budget_ms', 300) / 1000
+        self.max_chars = rerank_config.get('max_chars', 2000)
+        self.probe_interval = rerank_config.get('probe_interval', 5)
+        backend = rerank_config.get('backend', 'torch')
+
+        self.logger.info(f"Chargement du modèle de reclassement : {self.model_name} (backend {backend})")
+        if backend == 'torch':
+            from sentence_transformers import CrossEncoder
+            self.model = CrossEncoder(self.model_name, device="cpu")
+        elif backend in ('onnx', 'onnx-int8'):
+            onnx_config = config.get('embedding', {}).get('onnx', {})
+            quantized = backend == 'onnx-int8'
+            model_dir = prepare_onnx_model(self.model_name, onnx_config.get('cache_dir', 'data/models'), _export_cross_encoder, quantized=quantized)
+            self.model = OnnxCrossEncoder(model_dir, quantized=quantized, threads=onnx_config.get('threads', 0))
+        else:
+            raise ValueError(f"Backend de reclassement inconnu : {backend}")
+
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._waiting = 0
+        self._average_seconds = None
+        self._last_call = 0.0
+        self.stats = {"rerank_calls": 0, "rerank_skipped": 0}
+
+    def _estimated_wait(self) -> float:
+        # Les appels en attente passent un par un : chacun coûte environ un lot moyen
+        if self._average_seconds is None:
+            return 0.0
+        return self._average_seconds * (self._waiting + 1)
+
+    def rerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        if len(results) <= 1:
+            return results[:top_k]
+        with self._stats_lock:
+            now = time.monotonic()
+            probe = self._waiting == 0 and now - self._last_call >= self.probe_interval
+            if self._estimated_wait() > self.latency_budget and not probe:
+                self.stats["rerank_skipped"] += 1
+                self.logger.info("Reclassement sauté : budget de latence dépassé sous la charge actuelle.")
+                return results[:top_k]
+            self._waiting += 1
+            self._last_call = now
+        try:
+            pairs = [(query, res['content'][:self.max_chars]) for res in results]
+            with self._lock, metrics.stage("rerank"):
+                start = time.perf_counter()
+                scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+                elapsed = time.perf_counter() - start
+        finally:
+            with self._stats_lock:
+                self._waiting -= 1
+        with self._stats_lock:
+            self._average_seconds = elapsed if self._average_seconds is None else 0.8 * self._average_seconds + 0.2 * elapsed
+            self.stats["rerank_calls"] += 1
+        order = np.argsort(-np.asarray(scores, dtype=np.float32))[:top_k]
+        return [{**results[index], "rerank_score": float(scores[index])} for index in order]
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            return {**self.stats, "rerank_average_ms": round((self._average_seconds or 0.0) * 1000, 1)}
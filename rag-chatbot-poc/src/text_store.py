@@ -0,0 +1,106 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from .document_processor import DocumentProcessor, Segment
+
+# Version du format des artefacts ; DocumentProcessor.EXTRACTOR_VERSION suit, elle, la logique d'extraction
+FORMAT_VERSION = 1
+
+
+class ExtractedTextStore:
+    """Texte extrait des documents, conservé compressé dans `storage.processed_path`.
+
+    Un artefact par contenu de fichier (clé : hash SHA-256), au format JSON Lines gzip : une
+    ligne d'en-tête, un segment par ligne avec sa position (page, feuille, diapositive), puis
+    une ligne finale donnant le décalage de chaque segment dans le texte complet. Redécouper
+    ou réencoder un document relit cet artefact au lieu du fichier d'origine. Un artefact
+    d'une autre version est ignoré : le fichier d'origine doit alors être réextrait.
+    """
+    def __init__(self, config: Dict):
+        self.logger = logging.getLogger(__name__)
+        storage_cfg = config['storage']
+        self.root = Path(storage_cfg['processed_path'])
+        self.compress_level = storage_cfg.get('extracted_text_compress_level', 6)
+
+    def path_for(self, file_hash: str) -> Path:
+        return self.root / file_hash[:2] / f"{file_hash}.jsonl.gz"
+
+    def _header(self, path: Path) -> Optional[Dict]:
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+        except (OSError, EOFError, ValueError):
+            return None
+        if header.get('version') != FORMAT_VERSION or header.get('extractor_version') != DocumentProcessor.EXTRACTOR_VERSION:
+            return None
+        return header
+
+    def has(self, file_hash: str) -> bool:
+        return self._header(self.path_for(file_hash)) is not None
+
+    def info(self, file_hash: str) -> Optional[Dict]:
+        """En-tête et index des segments d'un artefact valide, None s'il n'existe pas."""
+        path = self.path_for(file_hash)
+        header = self._header(path)
+        if header is None:
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                pass
+        return {**header, **json.loads(line)}
+
+    def write(self, file_hash: str, filename: str, segments: Iterable[Segment]) -> Iterator[Segment]:
+        """Renvoie les segments au fil de l'extraction tout en les enregistrant.
+
+        L'artefact n'apparaît qu'une fois la dernière ligne écrite : une extraction interrompue
+        ne laisse jamais d'artefact partiel.
+        """
+        path = self.path_for(file_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp_", suffix=".jsonl.gz")
+        offsets = []
+        chars = 0
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8', compresslevel=self.compress_level) as f:
+                header = {"version": FORMAT_VERSION, "extractor_version": DocumentProcessor.EXTRACTOR_VERSION,
+                          "file_hash": file_hash, "filename": filename}
+                f.write(json.dumps(header, ensure_ascii=False) + "\n")
+                for location, text in segments:
+                    f.write(json.dumps([location, text], ensure_ascii=False) + "\n")
+                    offsets.append(chars)
+                    chars += len(text) + 1
+                    yield location, text
+                f.write(json.dumps({"segments": len(offsets), "chars": chars, "offsets": offsets}) + "\n")
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def save(self, file_hash: str, filename: str, segments: Iterable[Segment]) -> Dict:
+        for _ in self.write(file_hash, filename, segments):
+            pass
+        return self.info(file_hash)
+
+    def delete(self, file_hash: str):
+        self.path_for(file_hash).unlink(missing_ok=True)
+
+    def read(self, file_hash: str) -> Iterator[Segment]:
+        with gzip.open(self.path_for(file_hash), 'rt', encoding='utf-8') as f:
+            f.readline()
+            for line in f:
+                item = json.loads(line)
+                # La dernière ligne (index des segments) est un objet, les segments des listes
+                if isinstance(item, list):
+                    yield item[0], item[1]
+
+    def open_segments(self, file_hash: str, file_path: str, processor: DocumentProcessor) -> Iterator[Segment]:
+        """Segments du fichier : relus depuis l'artefact s'il existe, sinon extraits et enregistrés au passage."""
+        if self.has(file_hash):
+            self.logger.info(f"Texte déjà extrait pour {Path(file_path).name}, fichier d'origine non relu.")
+            return self.read(file_hash)
+        return self.write(file_hash, Path(file_path).name, processor.iter_segments(file_path))
@@ -0,0 +1,62 @@
+import logging
+from typing import Dict
+
+from .multiworker import get_chroma_server
+from .workspaces import workspace_from_collection
+
+# Interface attendue par RAGEngine, calquée sur ChromaDB :
+#   client : get_or_create_collection(name), delete_collection(name), list_collections()
+#   collection : add, get, update (métadonnées), delete, query, count, modify(name)
+VECTOR_STORES = ("chromadb", "numpy")
+
+
+def create_vector_client(config: Dict):
+    """Client de la base vectorielle choisie par `database.vector_db.type`."""
+    db_config = config['database']['vector_db']
+    store_type = db_config.get('type', 'chromadb')
+    if store_type == 'numpy':
+        from .numpy_store import NumpyVectorClient
+        numpy_config = db_config.get('numpy', {})
+        return NumpyVectorClient(numpy_config.get('path', 'data/database/vectors'), numpy_config)
+    if store_type == 'chromadb':
+        import chromadb
+        chroma_server = get_chroma_server()
+        if chroma_server:
+            # Mode multi-workers : tous les processus partagent le même serveur ChromaDB
+            return chromadb.HttpClient(host=chroma_server[0], port=chroma_server[1])
+        return chromadb.PersistentClient(path=db_config['path'])
+    raise ValueError(f"Type de base vectorielle inconnu : {store_type} ({', '.join(VECTOR_STORES)})")
+
+
+def migrate_chroma_to_numpy(config: Dict, batch_size: int = 1000) -> Dict[str, int]:
+    """Copie les collections ChromaDB (embeddings, textes, métadonnées) dans le stockage NumPy, sans réencoder.
+
+    Les collections NumPy de même nom sont remplacées. Renvoie le nombre de chunks copiés par collection.
+    """
+    import chromadb
+    from .numpy_store import NumpyVectorClient
+
+    logger = logging.getLogger(__name__)
+    db_config = config['database']['vector_db']
+    numpy_config = db_config.get('numpy', {})
+    source = chromadb.PersistentClient(path=db_config['path'])
+    target = NumpyVectorClient(numpy_config.get('path', 'data/database/vectors'), numpy_config)
+    copied = {}
+    for listed in source.list_collections():
+        # Selon la version de ChromaDB, des objets Collection ou directement des noms
+        name = getattr(listed, "name", listed)
+        if workspace_from_collection(db_config['collection_name'], name) is None:
+            continue
+        source_collection = source.get_collection(name=name)
+        target.delete_collection(name)
+        target_collection = target.get_or_create_collection(name=name)
+        offset = 0
+        while True:
+            page = source_collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            if not len(page['ids']):
+                break
+            target_collection.add(ids=page['ids'], embeddings=page['embeddings'], documents=page['documents'], metadatas=page['metadatas'])
+            offset += len(page['ids'])
+        logger.info(f"Collection {name} migrée : {offset} chunks.")
+        copied[name] = offset
+    return copied
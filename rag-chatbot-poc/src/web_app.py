@@ -1,79 +1,409 @@
 import os
+import json
 import time
+import asyncio
+import hashlib
 import logging
+import shutil
 from pathlib import Path
-from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import Depends, FastAPI, Request, UploadFile, File, Form, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from .document_processor import DocumentProcessor
-from .rag_engine import RAGEngine
-from .llm_handler import get_llm_handler
+from .answer_cache import AnswerCache
+from .batch_qa import BatchAnswerer, parse_questions
+from .chat_sessions import ChatSessionStore
+from .llm_handler import ErrorResponse, get_llm_handler, is_error_response
+from .context_builder import ContextBuilder
+from .index_maintenance import IndexMaintenance
+from .text_store import ExtractedTextStore
+from .llm_router import LLMRouter, answering_model
 from .model_manager import OllamaModelManager
-from run import load_config
+from .ollama_client import close_ollama_clients, get_generation_stats
+from .concurrency import OverloadedError, create_embedding_executor, create_generation_limiter, queue_depth, run_blocking
+from .metrics import metrics
+from .workspaces import DEFAULT_WORKSPACE, build_where, documents_dir, validate_workspace
+from run import load_config, CONFIG_PATH
 
 config = load_config()
 logger = logging.getLogger(__name__)
+metrics.configure(config)
 
 app = FastAPI(title=config['app']['name'])
+metrics.instrument_app(app)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+# Composants légers, créés à l'import
 doc_processor = DocumentProcessor()
-rag_engine = RAGEngine(config)
-llm_handler = get_llm_handler(config)
+config_mtime = os.stat(CONFIG_PATH).st_mtime_ns
+handler_reload_lock = asyncio.Lock()
 model_manager = OllamaModelManager(config)
+embedding_executor = create_embedding_executor(config)
+generation_limiter = create_generation_limiter(config)
+answer_cache = AnswerCache(config)
+context_builder = ContextBuilder(config)
+text_store = ExtractedTextStore(config)
+chat_sessions = ChatSessionStore(config)
 
-documents_db: Dict[int, Dict] = {}
-next_doc_id = 1
+# Composants lourds (modèle d'embedding, ChromaDB, LLM), créés par warm_up() après l'ouverture du port
+rag_engine = None
+llm_handler = None
+document_registry = None
+ingestion_manager = None
+batch_answerer = None
+index_maintenance = None
+services_ready = asyncio.Event()
+startup_state = {"status": "starting", "steps": {}, "error": None, "started_at": time.time(), "ready_at": None}
 
-@app.get("/", response_class=HTMLResponse)
+def on_document_indexed(document: Dict):
+    answer_cache.invalidate_documents([document['doc_id']])
+
+def _run_step(name: str, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    startup_state["steps"][name] = round(time.perf_counter() - start, 3)
+    logger.info(f"Démarrage : étape '{name}' terminée en {startup_state['steps'][name]}s")
+    return result
+
+def initialize_services():
+    """Imports lourds, chargement des modèles et ouverture des bases (exécuté hors de la boucle asyncio)."""
+    global rag_engine, llm_handler, document_registry, ingestion_manager, batch_answerer, index_maintenance
+    from .rag_engine import RAGEngine
+    from .database import DocumentRegistry
+    from .ingestion import BulkIngestionManager
+
+    rag_engine = _run_step("rag_engine", RAGEngine, config)
+    # Un premier encodage initialise les noyaux et les buffers du modèle avant la première vraie requête
+    _run_step("embedding_warmup", rag_engine.embedding_model.encode, ["warm-up"])
+    document_registry = _run_step("registry", DocumentRegistry, config)
+    _run_step("reconcile", reconcile_registry)
+    ingestion_manager = BulkIngestionManager(config, rag_engine, document_registry, on_document_indexed)
+    batch_answerer = BatchAnswerer(config, rag_engine, context_builder, answer_cache, embedding_executor)
+    index_maintenance = IndexMaintenance(config, rag_engine, document_registry)
+    index_maintenance.start_background()
+    llm_handler = _run_step("llm_handler", get_llm_handler, config)
+    # Le modèle est chargé dans Ollama avant la première question plutôt que par elle
+    _run_step("llm_preload", llm_handler.preload)
+
+    # Jauges lues à chaque export de /metrics
+    metrics.register_collector(lambda: {
+        **generation_limiter.get_stats(),
+        "embedding_queue_depth": queue_depth(embedding_executor),
+        **answer_cache.get_stats(),
+        **chat_sessions.get_stats(),
+        **get_generation_stats(),
+        **rag_engine.get_stats(),
+        "documents": document_registry.count(),
+    })
+
+def reconcile_registry():
+    """Aligne le catalogue sur la base vectorielle (`database.reconcile_on_startup`).
+
+    En mode "auto", les métadonnées de tous les chunks ne sont parcourues que si le nombre de
+    chunks d'un espace de travail diffère entre le catalogue et la base vectorielle.
+    """
+    mode = config['database'].get('reconcile_on_startup', 'auto')
+    if not mode:
+        return
+    if mode == 'auto':
+        expected = {workspace: count for workspace, count in document_registry.chunk_counts().items() if count}
+        actual = {workspace: count for workspace in rag_engine.list_workspaces() if (count := rag_engine.count(workspace))}
+        if expected == actual:
+            return
+        logger.info("Nombre de chunks différent entre le catalogue et la base vectorielle : réconciliation complète.")
+    document_registry.reconcile(rag_engine.get_indexed_documents())
+
+async def warm_up():
+    try:
+        await run_blocking(embedding_executor, initialize_services)
+    except Exception as e:
+        logger.error(f"Échec de l'initialisation des services: {e}", exc_info=True)
+        startup_state.update(status="failed", error=str(e))
+        return
+    startup_state.update(status="ready", ready_at=time.time())
+    logger.info(f"Services prêts en {startup_state['ready_at'] - startup_state['started_at']:.1f}s")
+    services_ready.set()
+
+@app.on_event("startup")
+async def startup_event():
+    # État d'Ollama tenu à jour en arrière-plan : /api/models/status ne fait aucun appel réseau
+    model_manager.client.start_background_refresh()
+    if config.get('startup', {}).get('background_warmup', True):
+        # Le port est ouvert tout de suite ; les routes qui en dépendent attendent la fin du warm-up
+        asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+
+async def require_ready():
+    """Dépendance des routes qui ont besoin du moteur RAG, du catalogue ou du LLM."""
+    if services_ready.is_set():
+        return
+    if startup_state["status"] != "failed":
+        timeout = config.get('startup', {}).get('request_wait_timeout', 30)
+        try:
+            await asyncio.wait_for(services_ready.wait(), timeout=timeout)
+            return
+        except asyncio.TimeoutError:
+            pass
+    detail = "Initialisation du service en échec." if startup_state["status"] == "failed" else "Service en cours de démarrage, réessayez dans quelques instants."
+    raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+@app.get("/healthz")
+async def healthz():
+    """Sonde de vivacité : le processus répond, même pendant le warm-up."""
+    return JSONResponse({"status": "ok"})
+
+@app.get("/readyz")
+async def readyz():
+    """Sonde de disponibilité : 200 uniquement lorsque les modèles et les bases sont chargés."""
+    return JSONResponse(startup_state, status_code=200 if services_ready.is_set() else 503)
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """Chronomètre chaque requête et expose la durée de ses étapes dans l'en-tête Server-Timing."""
+    timings = metrics.start_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe("rag_http_request_duration_seconds", time.perf_counter() - start,
+                    route=route.path if route is not None else "autre", method=request.method)
+    # Pour les réponses en streaming, seules les étapes antérieures au premier octet figurent dans l'en-tête
+    if timings and config.get('metrics', {}).get('server_timing', True):
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+@app.get("/", response_class=HTMLResponse, dependencies=[Depends(require_ready)])
 async def get_chat_page(request: Request):
-    stats = {"total_documents": len(documents_db), "total_chunks": rag_engine.get_stats()['total_chunks']}
+    stats = {"total_documents": document_registry.count(), "total_chunks": rag_engine.get_stats()['total_chunks']}
     return templates.TemplateResponse("index.html", {"request": request, "stats": stats})
 
-@app.get("/admin", response_class=HTMLResponse)
-async def get_admin_page(request: Request):
-    stats = {"total_documents": len(documents_db), "total_chunks": rag_engine.get_stats()['total_chunks']}
-    return templates.TemplateResponse("admin.html", {"request": request, "stats": stats, "documents": list(documents_db.values())})
+@app.get("/admin", response_class=HTMLResponse, dependencies=[Depends(require_ready)])
+async def get_admin_page(request: Request, page: int = 1):
+    page_size = config.get('admin', {}).get('page_size', 50)
+    documents, total = document_registry.list(page=page, page_size=page_size)
+    stats = {"total_documents": total, "total_chunks": rag_engine.get_stats()['total_chunks']}
+    return templates.TemplateResponse("admin.html", {
+        "request": request, "stats": stats, "documents": documents,
+        "page": page, "total_pages": max(1, (total + page_size - 1) // page_size)
+    })
 
-@app.post("/api/chat")
+async def get_active_llm_handler():
+    """Renvoie le gestionnaire LLM, rechargé si config.yaml a changé (y compris par un autre worker)."""
+    global config, llm_handler, config_mtime
+    if os.stat(CONFIG_PATH).st_mtime_ns == config_mtime:
+        return llm_handler
+    async with handler_reload_lock:
+        mtime = os.stat(CONFIG_PATH).st_mtime_ns
+        if mtime != config_mtime:
+            logger.info("Configuration modifiée, rechargement du gestionnaire LLM.")
+            config = load_config()
+            previous_handler = llm_handler
+            # La création peut sonder Ollama : hors de la boucle asyncio
+            llm_handler = await run_blocking(embedding_executor, get_llm_handler, config)
+            config_mtime = mtime
+            await previous_handler.aclose()
+    return llm_handler
+
+def resolve_workspace(workspace: str) -> str:
+    try:
+        return validate_workspace(workspace, config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_search_scope(request: Request, data: Dict) -> Dict:
+    """Espace de travail (champ `workspace` ou en-tête X-Workspace) et filtres de métadonnées d'une requête de chat."""
+    workspace = resolve_workspace(data.get("workspace") or request.headers.get("X-Workspace"))
+    try:
+        where = build_where(data.get("filters"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"workspace": workspace, "where": where}
+
+async def retrieve_context(query: str, model: str, workspace: str = DEFAULT_WORKSPACE, where: Dict = None) -> Dict:
+    """Recherche les chunks pertinents et prépare le contexte, hors de la boucle asyncio."""
+    return (await batch_answerer.retrieve([query], model, workspace, where))[0]
+
+def parse_session_id(data: Dict):
+    try:
+        return ChatSessionStore.validate_id(data.get("session_id"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def record_answer(query: str, retrieval: Dict, model: str, response_text: str, session_id: Optional[str], history: List[Dict]):
+    """Met la réponse en cache (hors conversation en cours) et l'ajoute à l'historique de la session."""
+    if is_error_response(response_text):
+        return
+    # Une réponse donnée dans une conversation dépend de ses échanges précédents : elle n'est pas réutilisable
+    if not history:
+        batch_answerer.store(query, retrieval, answering_model(model), response_text)
+    chat_sessions.append(session_id, query, response_text)
+
+@app.post("/api/chat", dependencies=[Depends(require_ready)])
 async def api_chat(request: Request):
     data = await request.json()
     query = data.get("message")
-    search_results = rag_engine.search(query, n_results=5)
-    context = "\n\n".join([res['content'] for res in search_results])
-    sources = list(set([res['metadata']['filename'] for res in search_results]))
-    response_text = llm_handler.generate_response(context, query)
-    return JSONResponse({"response": response_text, "sources": sources})
+    scope = parse_search_scope(request, data)
+    session_id = parse_session_id(data)
+    history = chat_sessions.history(session_id)
+    handler = await get_active_llm_handler()
+    model = handler.get_current_model()
+    retrieval = await retrieve_context(query, model, **scope)
+    cached_answer = None if history else answer_cache.get(query, retrieval['chunk_ids'], model, retrieval['query_embedding'])
+    if cached_answer is not None:
+        metrics.inc("rag_chat_answers_total", endpoint="chat", cached="true")
+        chat_sessions.append(session_id, query, cached_answer)
+        return JSONResponse({"response": cached_answer, "sources": retrieval['sources'], "cached": True})
+    try:
+        async with generation_limiter.slot():
+            with metrics.stage("generate"):
+                response_text = await handler.agenerate_response(retrieval['context'], query, history)
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    metrics.inc("rag_chat_answers_total", endpoint="chat", cached="false")
+    record_answer(query, retrieval, model, response_text, session_id, history)
+    return JSONResponse({"response": response_text, "sources": retrieval['sources']})
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/chat/stream", dependencies=[Depends(require_ready)])
+async def api_chat_stream(request: Request):
+    """Version Server-Sent-Events de /api/chat : les sources, puis les tokens au fil de l'eau."""
+    data = await request.json()
+    query = data.get("message")
+    scope = parse_search_scope(request, data)
+    session_id = parse_session_id(data)
+    history = chat_sessions.history(session_id)
+    start_time = time.perf_counter()
+    handler = await get_active_llm_handler()
+    model = handler.get_current_model()
+    retrieval = await retrieve_context(query, model, **scope)
+    sources = retrieval['sources']
+    cached_answer = None if history else answer_cache.get(query, retrieval['chunk_ids'], model, retrieval['query_embedding'])
+
+    if cached_answer is not None:
+        metrics.inc("rag_chat_answers_total", endpoint="chat_stream", cached="true")
+        chat_sessions.append(session_id, query, cached_answer)
+        async def cached_stream():
+            yield _sse_event("sources", sources)
+            yield _sse_event("token", {"token": cached_answer})
+            yield _sse_event("done", {"cached": True})
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def event_stream():
+        # Le créneau est pris et rendu dans le générateur : un client parti avant la lecture du corps
+        # (générateur jamais démarré) ne garde aucun créneau
+        acquired = False
+        try:
+            yield _sse_event("sources", sources)
+            try:
+                await generation_limiter.acquire()
+            except OverloadedError as e:
+                yield _sse_event("error", {"detail": str(e), "retry_after": 5})
+                return
+            acquired = True
+            tokens = []
+            generation_start = time.perf_counter()
+            async for token in handler.astream_response(retrieval['context'], query, history):
+                if not tokens:
+                    logger.info(f"Premier token après {time.perf_counter() - start_time:.3f}s")
+                    metrics.record_stage("first_token", time.perf_counter() - start_time)
+                tokens.append(token)
+                yield _sse_event("token", {"token": token})
+            metrics.record_stage("generate", time.perf_counter() - generation_start)
+            metrics.inc("rag_chat_answers_total", endpoint="chat_stream", cached="false")
+            response_text = "".join(tokens)
+            # Une erreur après des tokens valides rend toute la réponse inutilisable
+            if any(is_error_response(token) for token in tokens):
+                response_text = ErrorResponse(response_text)
+            record_answer(query, retrieval, model, response_text, session_id, history)
+            yield _sse_event("done", {})
+        except Exception as e:
+            logger.error(f"Erreur pendant le streaming de la réponse: {e}")
+            yield _sse_event("error", {"detail": "Erreur pendant la génération de la réponse."})
+        finally:
+            if acquired:
+                generation_limiter.release()
 
-@app.get("/api/models/status")
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/chat/batch", dependencies=[Depends(require_ready)])
+async def api_chat_batch(request: Request):
+    """Répond à une liste de questions ; une ligne JSON par réponse au fil de l'eau, puis le bilan du lot."""
+    data = await request.json()
+    scope = parse_search_scope(request, data)
+    try:
+        questions = parse_questions(data.get("questions"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(questions) > batch_answerer.max_questions:
+        raise HTTPException(status_code=400, detail=f"Lot trop grand : {len(questions)} questions (maximum {batch_answerer.max_questions}).")
+    try:
+        # Le client peut réduire la concurrence du lot, pas dépasser celle de la configuration
+        concurrency = min(int(data.get("concurrency") or batch_answerer.concurrency), batch_answerer.concurrency)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="`concurrency` doit être un entier.")
+    handler = await get_active_llm_handler()
+    logger.info(f"Lot de {len(questions)} question(s) reçu (concurrence {concurrency}).")
+
+    async def result_lines():
+        # Les générations du lot attendent un créneau libre, après les requêtes interactives
+        async for result in batch_answerer.answer(questions, handler, concurrency=concurrency, limiter=generation_limiter, **scope):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Oublie l'historique d'une conversation (nouvelle conversation)."""
+    return JSONResponse({"deleted": chat_sessions.delete(session_id)})
+
+@app.get("/api/models/status", dependencies=[Depends(require_ready)])
 async def get_models_status():
+    handler = await get_active_llm_handler()
     provider = config.get('llm', {}).get('provider', 'simple').lower()
     
     if provider == 'gemini':
         return JSONResponse({
             "provider": "gemini",
-            "current_model": llm_handler.get_current_model(),
+            "current_model": handler.get_current_model(),
             "ollama_available": False
         })
+    elif isinstance(handler, LLMRouter):
+        return JSONResponse({
+            "provider": "router",
+            "ollama_available": model_manager.is_ollama_available(),
+            "current_model": handler.get_current_model(),
+            "backends": handler.get_stats()
+        })
     else: # Pour ollama ou simple
         return JSONResponse({
             "provider": provider,
             "ollama_available": model_manager.is_ollama_available(),
-            "current_model": llm_handler.get_current_model()
+            "current_model": handler.get_current_model()
         })
 
-@app.post("/api/models/set-active/{model_name}")
+@app.get("/api/models/installed", dependencies=[Depends(require_ready)])
+async def get_installed_models():
+    handler = await get_active_llm_handler()
+    return JSONResponse({"models": model_manager.get_installed_models(), "current_model": handler.get_current_model()})
+
+@app.get("/api/models/available", dependencies=[Depends(require_ready)])
+async def get_available_models():
+    return JSONResponse({"ollama_available": model_manager.is_ollama_available(), "ollama_models": model_manager.get_available_models()})
+
+@app.post("/api/models/set-active/{model_name}", dependencies=[Depends(require_ready)])
 async def set_active_model_endpoint(model_name: str):
     success = model_manager.set_active_model(model_name)
     if success:
-        # Recharger la config et ré-instancier le handler pour prendre en compte le changement
-        global config, llm_handler
-        config = load_config()
-        llm_handler = get_llm_handler(config)
+        # Le changement de config.yaml est détecté ici comme par les autres workers
+        handler = await get_active_llm_handler()
+        # Le nouveau modèle est chargé avant la première question, dans un thread hors du pool des embeddings
+        await asyncio.get_running_loop().run_in_executor(None, handler.preload)
         return JSONResponse({"status": "success"})
     else:
         raise HTTPException(status_code=500, detail="Impossible de changer le modèle actif.")
@@ -84,37 +414,177 @@ async def set_active_model_endpoint(model_name: str):
 async def get_upload_page(request: Request):
     return templates.TemplateResponse("upload.html", {"request": request})
 
-@app.post("/api/upload")
-async def api_upload_file(file: UploadFile = File(...)):
-    global next_doc_id
-    upload_dir = Path(config['storage']['documents_path'])
-    file_path = upload_dir / file.filename
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+def workspace_upload_dir(workspace: str) -> Path:
+    """Les fichiers d'un espace de travail autre que celui par défaut sont rangés dans un sous-dossier."""
+    upload_dir = documents_dir(config, workspace)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    return upload_dir
+
+async def save_upload(file: UploadFile, file_path: Path) -> str:
+    """Écrit le fichier reçu sur disque par blocs et renvoie son hash SHA-256."""
+    sha = hashlib.sha256()
+    with open(file_path, "wb") as buffer:
+        while block := await file.read(UPLOAD_BLOCK_SIZE):
+            sha.update(block)
+            buffer.write(block)
+    return sha.hexdigest()
+
+@app.post("/api/upload", dependencies=[Depends(require_ready)])
+async def api_upload_file(file: UploadFile = File(...), workspace: str = Form(DEFAULT_WORKSPACE)):
+    workspace = resolve_workspace(workspace)
+    file_path = workspace_upload_dir(workspace) / file.filename
+    document = None
     try:
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        text = doc_processor.extract_text(str(file_path))
-        doc_metadata = {"id": next_doc_id, "doc_id": f"doc_{next_doc_id}", "filename": file.filename}
-        num_chunks = rag_engine.add_document(doc_id=doc_metadata['doc_id'], text=text, metadata=doc_metadata)
-        doc_metadata["chunk_count"] = num_chunks
-        documents_db[next_doc_id] = doc_metadata
-        next_doc_id += 1
+        with metrics.stage("save_upload"):
+            file_hash = await save_upload(file, file_path)
+        duplicate = document_registry.get_by_hash(file_hash, workspace)
+        if duplicate:
+            return JSONResponse({"message": f"Fichier inchangé, déjà indexé ({duplicate['filename']}).", "chunks": duplicate['chunk_count'], "skipped": True})
+        document = document_registry.resolve(file.filename, workspace)
+        # L'extraction est consommée segment par segment par le moteur RAG, dans le thread d'embedding
+        num_chunks = await run_blocking(
+            embedding_executor, rag_engine.add_document,
+            doc_id=document['doc_id'], segments=text_store.open_segments(file_hash, str(file_path), doc_processor),
+            metadata=document_registry.chunk_metadata(document, file_hash), workspace=workspace
+        )
+        document = document_registry.mark_indexed(document['doc_id'], file_hash, file_path.stat().st_size, num_chunks)
+        on_document_indexed(document)
         return JSONResponse({"message": "Fichier traité.", "chunks": num_chunks})
     except Exception as e:
+        if document is not None and document['status'] == 'pending':
+            document_registry.delete(document['doc_id'])
         raise HTTPException(status_code=500, detail=str(e))
-    
-@app.get("/api/stats")
+
+@app.post("/api/upload/bulk", dependencies=[Depends(require_ready)])
+async def api_upload_bulk(files: List[UploadFile] = File(...), workspace: str = Form(DEFAULT_WORKSPACE)):
+    """Enregistre plusieurs fichiers puis lance leur ingestion en arrière-plan."""
+    workspace = resolve_workspace(workspace)
+    upload_dir = workspace_upload_dir(workspace)
+    file_paths = []
+    for file in files:
+        file_path = upload_dir / file.filename
+        await save_upload(file, file_path)
+        file_paths.append(str(file_path))
+    job_id = ingestion_manager.submit(file_paths, workspace)
+    return JSONResponse({"job_id": job_id, "total_files": len(file_paths), "workspace": workspace}, status_code=202)
+
+@app.delete("/api/documents/{doc_id}", dependencies=[Depends(require_ready)])
+async def api_delete_document(doc_id: str):
+    result = await run_blocking(embedding_executor, ingestion_manager.delete, [doc_id])
+    if not result['deleted']:
+        raise HTTPException(status_code=404, detail="Document introuvable.")
+    answer_cache.invalidate_documents(result['deleted'])
+    return JSONResponse(result)
+
+@app.post("/api/documents/delete", dependencies=[Depends(require_ready)])
+async def api_delete_documents(request: Request):
+    """Supprime plusieurs documents (`{"doc_ids": [...]}`) en une requête par espace de travail."""
+    data = await request.json()
+    doc_ids = data.get("doc_ids")
+    if not isinstance(doc_ids, list) or not doc_ids or not all(isinstance(doc_id, str) for doc_id in doc_ids):
+        raise HTTPException(status_code=400, detail="`doc_ids` doit être une liste non vide d'identifiants.")
+    result = await run_blocking(embedding_executor, ingestion_manager.delete, doc_ids)
+    answer_cache.invalidate_documents(result['deleted'])
+    return JSONResponse(result)
+
+@app.put("/api/documents/{doc_id}", dependencies=[Depends(require_ready)])
+async def api_replace_document(doc_id: str, file: UploadFile = File(...)):
+    """Remplace le contenu d'un document indexé, qui garde son identifiant et son nom ; seuls les chunks modifiés sont encodés."""
+    document = document_registry.get(doc_id)
+    if document is None or document['status'] != 'indexed':
+        raise HTTPException(status_code=404, detail="Document introuvable.")
+    if Path(file.filename).suffix.lower() != Path(document['filename']).suffix.lower():
+        raise HTTPException(status_code=400, detail=f"Le fichier de remplacement doit être du même type que {document['filename']}.")
+    upload_dir = workspace_upload_dir(document['workspace'])
+    # Le fichier d'origine n'est écrasé qu'une fois le nouveau contenu indexé
+    staging_dir = upload_dir / f".replace_{doc_id}"
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    staged_path = staging_dir / document['filename']
+    try:
+        with metrics.stage("save_upload"):
+            file_hash = await save_upload(file, staged_path)
+        if file_hash == document['file_hash']:
+            return JSONResponse({"message": "Contenu identique, document inchangé.", "chunks": document['chunk_count'], "skipped": True})
+        num_chunks = await run_blocking(
+            embedding_executor, rag_engine.add_document,
+            doc_id=doc_id, segments=text_store.open_segments(file_hash, str(staged_path), doc_processor),
+            metadata=document_registry.chunk_metadata(document, file_hash), workspace=document['workspace']
+        )
+        file_size = staged_path.stat().st_size
+        os.replace(staged_path, upload_dir / document['filename'])
+        on_document_indexed(document_registry.mark_indexed(doc_id, file_hash, file_size, num_chunks))
+        ingestion_manager.release_text(document['file_hash'])
+        return JSONResponse({"message": "Document remplacé.", "doc_id": doc_id, "chunks": num_chunks})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+@app.get("/api/maintenance", dependencies=[Depends(require_ready)])
+async def api_get_maintenance():
+    """Chunks supprimés par espace de travail et rapport de la dernière maintenance de l'index."""
+    return JSONResponse(await run_blocking(embedding_executor, index_maintenance.get_status))
+
+@app.post("/api/maintenance", dependencies=[Depends(require_ready)])
+async def api_run_maintenance(request: Request):
+    """Lance la compaction en arrière-plan : espaces au-delà du seuil, ou tous avec `force`."""
+    data = await request.json() if await request.body() else {}
+    workspace = resolve_workspace(data["workspace"]) if data.get("workspace") else None
+    if not index_maintenance.submit(workspace, bool(data.get("force", False))):
+        raise HTTPException(status_code=409, detail="Une maintenance est déjà en cours.")
+    return JSONResponse({"status": "started"}, status_code=202)
+
+@app.get("/api/jobs/{job_id}", dependencies=[Depends(require_ready)])
+async def api_get_job(job_id: str):
+    job = ingestion_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable.")
+    return JSONResponse(job)
+
+@app.get("/api/workspaces", dependencies=[Depends(require_ready)])
+async def get_workspaces():
+    """Espaces de travail existants et leur nombre de documents indexés."""
+    counts = document_registry.workspace_counts()
+    workspaces = sorted(set(counts) | set(rag_engine.list_workspaces()) | {DEFAULT_WORKSPACE})
+    return JSONResponse({"workspaces": [{"name": name, "documents": counts.get(name, 0)} for name in workspaces]})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métriques de ce processus au format d'exposition Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/stats", dependencies=[Depends(require_ready)])
 async def get_api_stats():
     """Retourne les statistiques de base de l'application."""
     try:
         stats = {
-            "total_documents": len(documents_db),
-            "total_chunks": rag_engine.get_stats()['total_chunks']
+            "total_documents": document_registry.count(),
+            **rag_engine.get_stats(),
+            **generation_limiter.get_stats(),
+            **answer_cache.get_stats(),
+            **chat_sessions.get_stats(),
+            **get_generation_stats()
         }
         return JSONResponse(stats)
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des stats: {e}")
         raise HTTPException(status_code=500, detail="Erreur interne du serveur.")
         
+@app.on_event("shutdown")
+async def shutdown_event():
+    if llm_handler is not None:
+        await llm_handler.aclose()
+    await close_ollama_clients()
+    embedding_executor.shutdown(wait=False)
+    if ingestion_manager is not None:
+        ingestion_manager.shutdown()
+    if index_maintenance is not None:
+        index_maintenance.shutdown()
+    if document_registry is not None:
+        document_registry.close()
+
 def run_app():
     import uvicorn
     uvicorn.run(app, host=config['app']['host'], port=config['app']['port'])
\ No newline at end of file
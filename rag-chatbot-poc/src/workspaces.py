@@ -0,0 +1,84 @@
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Espace de travail des documents indexés avant l'introduction des espaces : il garde la collection d'origine
+DEFAULT_WORKSPACE = "default"
+_WORKSPACE_PATTERN = re.compile(r"[a-z0-9](?:[a-z0-9_-]{0,38}[a-z0-9])?")
+_COLLECTION_SEPARATOR = "__"
+
+
+def validate_workspace(workspace: Optional[str], config: Dict) -> str:
+    """Nom d'espace de travail normalisé ; ValueError s'il est invalide ou non autorisé."""
+    if not workspace:
+        return DEFAULT_WORKSPACE
+    workspace = workspace.strip().lower()
+    if not _WORKSPACE_PATTERN.fullmatch(workspace):
+        raise ValueError(f"Nom d'espace de travail invalide : {workspace} (lettres, chiffres, '-' et '_', 40 caractères au plus)")
+    allowed = config['database']['vector_db'].get('allowed_workspaces') or []
+    if allowed and workspace != DEFAULT_WORKSPACE and workspace not in allowed:
+        raise ValueError(f"Espace de travail non autorisé : {workspace}")
+    return workspace
+
+
+def collection_name(base_name: str, workspace: str) -> str:
+    return base_name if workspace == DEFAULT_WORKSPACE else f"{base_name}{_COLLECTION_SEPARATOR}{workspace}"
+
+
+def documents_dir(config: Dict, workspace: str) -> Path:
+    """Dossier des fichiers d'origine d'un espace de travail (sous-dossier de documents_path hors espace par défaut)."""
+    base = Path(config['storage']['documents_path'])
+    return base if workspace == DEFAULT_WORKSPACE else base / workspace
+
+
+def workspace_from_collection(base_name: str, name: str) -> Optional[str]:
+    """Espace de travail correspondant à une collection ChromaDB, None si elle n'en est pas un."""
+    if name == base_name:
+        return DEFAULT_WORKSPACE
+    prefix = base_name + _COLLECTION_SEPARATOR
+    if not name.startswith(prefix):
+        return None
+    # Les collections temporaires (reconstruction en cours) ne sont pas des espaces de travail
+    workspace = name[len(prefix):]
+    return workspace if _WORKSPACE_PATTERN.fullmatch(workspace) else None
+
+
+def _timestamp(value, field: str) -> int:
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp())
+    except ValueError:
+        raise ValueError(f"Date invalide pour {field} : {value} (format attendu AAAA-MM-JJ)")
+
+
+def build_where(filters: Optional[Dict]) -> Optional[Dict]:
+    """Traduit les filtres d'une requête en clause `where` ChromaDB, appliquée pendant la recherche.
+
+    Filtres reconnus : filename et file_type (valeur ou liste), doc_id (valeur ou liste),
+    uploaded_after et uploaded_before (date ISO ou timestamp).
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("Les filtres doivent être un objet JSON.")
+    unknown = set(filters) - {"filename", "file_type", "doc_id", "uploaded_after", "uploaded_before"}
+    if unknown:
+        raise ValueError(f"Filtre(s) inconnu(s) : {', '.join(sorted(unknown))}")
+    clauses: List[Dict] = []
+    for field in ("filename", "file_type", "doc_id"):
+        value = filters.get(field)
+        if value in (None, "", []):
+            continue
+        values = value if isinstance(value, list) else [value]
+        if field == "file_type":
+            values = [str(item).lstrip('.').upper() for item in values]
+        clauses.append({field: values[0]} if len(values) == 1 else {field: {"$in": values}})
+    if filters.get("uploaded_after") not in (None, ""):
+        clauses.append({"upload_ts": {"$gte": _timestamp(filters["uploaded_after"], "uploaded_after")}})
+    if filters.get("uploaded_before") not in (None, ""):
+        clauses.append({"upload_ts": {"$lte": _timestamp(filters["uploaded_before"], "uploaded_before")}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -5,6 +5,8 @@ class ChatInterface {
         this.sendButton = document.getElementById('sendButton');
         this.chatMessages = document.getElementById('chatMessages');
         this.typingIndicator = document.getElementById('typingIndicator');
+        // Une conversation par page : le serveur garde l'historique des échanges de cette session
+        this.sessionId = Date.now().toString(36) + Math.random().toString(36).slice(2, 10);
 
         this.init();
     }
@@ -58,18 +60,51 @@ class ChatInterface {
         this.showTypingIndicator();
 
         try {
-            const response = await fetch('/api/chat', {
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: messageText })
+                body: JSON.stringify({ message: messageText, session_id: this.sessionId })
             });
 
             if (!response.ok) {
                 throw new Error('La réponse du serveur n\'était pas OK');
             }
-            
-            const data = await response.json();
-            this.addMessage(data.response, 'bot', data.sources);
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+            let sources = [];
+            let messageElement = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                // Les événements SSE sont séparés par une ligne vide
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const rawEvent of events) {
+                    const event = this.parseEvent(rawEvent);
+                    if (event.type === 'sources') {
+                        sources = event.data;
+                    } else if (event.type === 'token') {
+                        text += event.data.token;
+                        if (!messageElement) {
+                            this.typingIndicator.style.display = 'none';
+                            messageElement = this.addMessage(text, 'bot', sources);
+                        } else {
+                            this.updateMessage(messageElement, text);
+                        }
+                    } else if (event.type === 'error') {
+                        throw new Error(event.data.detail);
+                    }
+                }
+            }
+
+            if (!messageElement) {
+                this.addMessage(text, 'bot', sources);
+            }
 
         } catch (error) {
             console.error('Erreur lors de l\'envoi du message:', error);
@@ -79,6 +114,23 @@ class ChatInterface {
         }
     }
 
+    parseEvent(rawEvent) {
+        const event = { type: 'message', data: null };
+        for (const line of rawEvent.split('\n')) {
+            if (line.startsWith('event: ')) {
+                event.type = line.slice(7);
+            } else if (line.startsWith('data: ')) {
+                event.data = JSON.parse(line.slice(6));
+            }
+        }
+        return event;
+    }
+
+    updateMessage(messageElement, text) {
+        messageElement.querySelector('p').innerHTML = this.formatText(text);
+        this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+    }
+
     addMessage(text, sender, sources = []) {
         const messageElement = document.createElement('div');
         messageElement.classList.add('message', `${sender}-message`);
@@ -101,6 +153,7 @@ class ChatInterface {
 
         this.chatMessages.appendChild(messageElement);
         this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+        return messageElement;
     }
 
     formatText(text) {
@@ -0,0 +1,66 @@
+import asyncio
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.batch_qa import BatchAnswerer
+from src.embedding_backends import MicroBatcher
+
+
+class SlowModel:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.batch_sizes.append(len(texts))
+        time.sleep(0.05)
+        return np.zeros((len(texts), 4), dtype=np.float32)
+
+
+class StubEngine:
+    def __init__(self, model):
+        self.embedding_model = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+        self.query_encoder = ThreadPoolExecutor(max_workers=32)
+
+    def encode(self, texts):
+        return self.embedding_model.encode(texts)
+
+    def search_batch(self, queries, n_results=5, workspace=None, where=None, query_embeddings=None):
+        assert query_embeddings is not None
+        return [[] for _ in queries]
+
+
+class StubContextBuilder:
+    candidates = 10
+    mmr = False
+
+    def build(self, results, model, query_embedding, encode):
+        return {"context": "", "results": results}
+
+
+class StubAnswerCache:
+    enabled = False
+    semantic = False
+
+
+class RetrieveMicroBatchingTest(unittest.TestCase):
+    def test_concurrent_questions_share_an_encode_beyond_the_pool_size(self):
+        model = SlowModel()
+        engine = StubEngine(model)
+        answerer = BatchAnswerer({}, engine, StubContextBuilder(), StubAnswerCache(), ThreadPoolExecutor(max_workers=2))
+
+        async def ask_all():
+            await asyncio.gather(*(answerer.retrieve([f"question {i}"], "model") for i in range(6)))
+
+        try:
+            asyncio.run(ask_all())
+        finally:
+            engine.embedding_model.close()
+        self.assertEqual(sum(model.batch_sizes), 6)
+        self.assertGreater(max(model.batch_sizes), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
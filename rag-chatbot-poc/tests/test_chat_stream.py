@@ -0,0 +1,90 @@
+import asyncio
+import copy
+import json
+import time
+import unittest
+from unittest import mock
+
+from benchmarks.stub_ollama import start_stub_server
+from src import web_app
+from src.llm_handler import EnhancedOllamaLLMHandler
+from src.ollama_client import get_ollama_client
+
+FIRST_TOKEN_DELAY = 0.05
+TOKEN_DELAY = 0.05
+NUM_TOKENS = 10
+
+RETRIEVAL = {"context": "Contexte de test.", "sources": ["guide.pdf"], "chunk_ids": ["doc_1_a"], "doc_ids": {"doc_1"}, "query_embedding": None}
+
+
+async def post_stream(path: str, body: dict):
+    """Appelle l'application ASGI directement ; renvoie les événements SSE avec leur instant d'envoi."""
+    payload = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    received = False
+    events = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            for block in message["body"].decode("utf-8").split("\n\n"):
+                if block.strip():
+                    name, data = (line.split(": ", 1)[1] for line in block.splitlines())
+                    events.append((time.perf_counter(), name, json.loads(data)))
+
+    await web_app.app(scope, receive, send)
+    return events
+
+
+class ChatStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.server, url = start_stub_server(first_token_delay=FIRST_TOKEN_DELAY, token_delay=TOKEN_DELAY, num_tokens=NUM_TOKENS)
+        config = copy.deepcopy(web_app.config)
+        config['llm']['ollama'].update(url=url, model="stub")
+        self.handler = EnhancedOllamaLLMHandler(config)
+        self.client = get_ollama_client(config)
+
+    def tearDown(self):
+        self.server.shutdown()
+
+    def test_sources_then_tokens_before_generation_ends(self):
+        async def scenario():
+            web_app.services_ready.set()
+            try:
+                start = time.perf_counter()
+                events = await post_stream("/api/chat/stream", {"message": "Que dit le guide ?"})
+            finally:
+                web_app.services_ready.clear()
+                await self.client.aclose()
+            return start, events
+
+        with mock.patch.multiple(web_app, llm_handler=self.handler, config_mtime=web_app.config_mtime,
+                                 retrieve_context=mock.AsyncMock(return_value=RETRIEVAL), record_answer=mock.Mock()), \
+                mock.patch.object(web_app.answer_cache, "get", return_value=None):
+            start, events = asyncio.run(scenario())
+
+        names = [name for _, name, _ in events]
+        self.assertEqual(names, ["sources"] + ["token"] * NUM_TOKENS + ["done"])
+        self.assertEqual(events[0][2], ["guide.pdf"])
+        self.assertEqual("".join(data["token"] for _, name, data in events if name == "token"),
+                         "".join(f"mot{i} " for i in range(NUM_TOKENS)))
+        # Le premier token est transmis dès sa génération, bien avant la fin de celle du stub
+        generation_seconds = FIRST_TOKEN_DELAY + TOKEN_DELAY * (NUM_TOKENS - 1)
+        first_token_at = events[1][0] - start
+        self.assertLess(first_token_at, generation_seconds / 2)
+        self.assertGreaterEqual(events[-1][0] - start, generation_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
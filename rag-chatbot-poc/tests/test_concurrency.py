@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+
+from src.concurrency import GenerationLimiter, OverloadedError
+
+
+class GenerationLimiterTest(unittest.TestCase):
+    def test_interactive_requests_pass_queued_background_work(self):
+        async def scenario():
+            limiter = GenerationLimiter(max_inflight=1, max_queued=4, queue_timeout=5)
+            order = []
+
+            async def generate(name: str, background: bool):
+                async with limiter.slot(background=background):
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+            await limiter.acquire()
+            tasks = [asyncio.create_task(generate("lot-1", True)), asyncio.create_task(generate("lot-2", True))]
+            await asyncio.sleep(0)
+            tasks.append(asyncio.create_task(generate("chat", False)))
+            await asyncio.sleep(0)
+            self.assertEqual((limiter.queued, limiter.background_queued), (1, 2))
+            limiter.release()
+            await asyncio.gather(*tasks)
+            self.assertEqual(limiter.inflight, 0)
+            return order
+
+        self.assertEqual(asyncio.run(scenario()), ["chat", "lot-1", "lot-2"])
+
+    def test_timed_out_or_cancelled_waiters_do_not_keep_slots(self):
+        async def scenario():
+            limiter = GenerationLimiter(max_inflight=1, max_queued=4, queue_timeout=0.01)
+            await limiter.acquire()
+            with self.assertRaises(OverloadedError):
+                await limiter.acquire()
+            background = asyncio.create_task(limiter.acquire_background())
+            await asyncio.sleep(0)
+            background.cancel()
+            await asyncio.gather(background, return_exceptions=True)
+            limiter.release()
+            self.assertEqual(limiter.inflight, 0)
+            await limiter.acquire_background()
+            self.assertEqual(limiter.inflight, 1)
+
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
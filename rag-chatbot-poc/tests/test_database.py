@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+
+from src.database import DocumentRegistry
+
+
+class ReconcileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = DocumentRegistry({'database': {'path': os.path.join(self.directory.name, 'chatbot.db')}})
+
+    def tearDown(self):
+        self.registry.close()
+        self.directory.cleanup()
+
+    def index(self, filename: str, chunks: int):
+        document = self.registry.resolve(filename, 'default')
+        return self.registry.mark_indexed(document['doc_id'], f"hash-{filename}", 10, chunks)
+
+    def test_documents_without_chunks_survive_reconcile(self):
+        image = self.index("scan.png", 0)
+        report = self.index("report.pdf", 3)
+        self.registry.reconcile({})
+
+        self.assertEqual([document['doc_id'] for document in self.registry.indexed_documents()], [image['doc_id']])
+        self.assertIsNotNone(self.registry.get_by_hash("hash-scan.png", 'default'))
+        self.assertIsNone(self.registry.get(report['doc_id']))
+
+
+if __name__ == '__main__':
+    unittest.main()
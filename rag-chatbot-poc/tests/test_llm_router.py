@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+
+from src import llm_router
+from src.llm_router import Backend, BackendHealth, LLMRouter, answering_model
+
+ROUTER_CONFIG = {'min_samples': 3, 'hedge_min_delay': 0.05, 'hedge_max_delay': 0.05}
+
+
+class StubHandler:
+    def __init__(self, model: str, delay: float = 0.0, response: str = "Réponse"):
+        self.model = model
+        self.delay = delay
+        self.response = response
+        self.calls = 0
+
+    def get_current_model(self) -> str:
+        return self.model
+
+    async def agenerate_response(self, context, query, history=None) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.response
+
+
+def make_router(*handlers: StubHandler) -> LLMRouter:
+    """Routeur avec les backends `handlers`, dans cet ordre, suivis du mode simple."""
+    router = LLMRouter({'llm': {'router': {**ROUTER_CONFIG, 'backends': [{'provider': 'simple'}]}}})
+    stubs = [Backend(handler.model, handler, BackendHealth(200, 3, 3, 30), False) for handler in handlers]
+    router.backends = stubs + router.backends
+    return router
+
+
+class LLMRouterTest(unittest.TestCase):
+    def setUp(self):
+        llm_router._health.clear()
+
+    def test_fallback_stays_last_after_answering(self):
+        ollama = StubHandler("llama3")
+        router = make_router(ollama)
+        real, simple = router.backends
+        for _ in range(5):
+            real.health.record_success(2.0)
+            simple.health.record_success(0.001)
+
+        self.assertEqual([backend.name for backend in router._ranked_backends()], ["llama3", "simple"])
+        response = asyncio.run(router.agenerate_response("contexte", "question"))
+        self.assertEqual(response, "Réponse")
+        self.assertEqual(ollama.calls, 1)
+
+    def test_answering_model_is_the_backend_that_answered(self):
+        async def ask(router):
+            response = await router.agenerate_response("contexte", "question")
+            return response, answering_model(router.get_current_model())
+
+        router = make_router(StubHandler("llama3", response=llm_router.NO_BACKEND_RESPONSE), StubHandler("mistral"))
+        response, model = asyncio.run(ask(router))
+        self.assertEqual(response, "Réponse")
+        self.assertEqual(router.get_current_model(), "llama3")
+        self.assertEqual(model, "mistral")
+
+    def test_hedged_loser_records_elapsed_latency(self):
+        router = make_router(StubHandler("lent", delay=1.0), StubHandler("rapide"))
+        slow = router.backends[0]
+        asyncio.run(router.agenerate_response("contexte", "question"))
+        self.assertEqual(len(slow.health.latencies), 1)
+        self.assertGreaterEqual(slow.health.latencies[0], 0.05)
+        self.assertEqual(list(slow.health.outcomes), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+from src import web_app
+from src.llm_handler import SimpleLLMHandler
+
+
+class ClosingHandler:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class ActiveHandlerReloadTest(unittest.TestCase):
+    def test_config_change_reloads_handler(self):
+        with open(web_app.CONFIG_PATH, encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+        config['llm']['provider'] = 'simple'
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = Path(directory) / 'config.yaml'
+            config_path.write_text(yaml.safe_dump(config), encoding='utf-8')
+            mtime = os.stat(config_path).st_mtime_ns
+            previous = ClosingHandler()
+            with mock.patch.multiple(web_app, CONFIG_PATH=str(config_path), config=web_app.config, config_mtime=mtime, llm_handler=previous,
+                                     load_config=lambda: yaml.safe_load(config_path.read_text(encoding='utf-8'))):
+                self.assertIs(asyncio.run(web_app.get_active_llm_handler()), previous)
+                # Modification de config.yaml, par /api/models/set-active ou par un autre worker
+                os.utime(config_path, ns=(mtime + 10**9, mtime + 10**9))
+                handler = asyncio.run(web_app.get_active_llm_handler())
+                self.assertIsInstance(handler, SimpleLLMHandler)
+                self.assertTrue(previous.closed)
+                self.assertEqual(web_app.config_mtime, mtime + 10**9)
+
+
+if __name__ == '__main__':
+    unittest.main()